@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+""" Benchmark the throughput of the machine-readable output formats """
+import argparse
+import contextlib
+import io
+import os
+import time
+from decimal import Decimal
+
+from dynamo3 import Binary
+
+from dql import output
+from dql.output import JsonFormat, JsonLinesFormat
+
+
+def make_items(count):
+    """Generate items that look like a typical table"""
+    for i in range(count):
+        yield {
+            "id": "item-%d" % i,
+            "ts": Decimal(1600000000 + i),
+            "score": Decimal("%d.25" % i),
+            "tags": set(["a", "b", "c"]),
+            "payload": Binary(b"x" * 32),
+            "name": "Name number %d" % i,
+        }
+
+
+def run(formatter, count):
+    """Display the items with a formatter and return the items per second"""
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        output.console.file = devnull
+        ostream = output.SmartBuffer(io.BufferedWriter(io.FileIO(os.devnull, "w")))
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(devnull):
+            formatter(make_items(count), ostream, pagesize=0).display()
+        elapsed = time.perf_counter() - start
+        ostream.flush()
+    return count / elapsed
+
+
+def main():
+    """Run the benchmarks"""
+    parse = argparse.ArgumentParser(description=main.__doc__)
+    parse.add_argument(
+        "-n", type=int, default=20000, help="Number of items (default %(default)d)"
+    )
+    args = parse.parse_args()
+    for name, formatter in [("json", JsonFormat), ("jsonl", JsonLinesFormat)]:
+        print("%-6s %10.0f items/s" % (name, run(formatter, args.n)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+""" Benchmark the throughput of converting items with selection expressions """
+import argparse
+import time
+from decimal import Decimal
+
+from dql.expressions import SelectionExpression
+from dql.grammar import parser
+
+SELECTIONS = [
+    "id, score, name",
+    "id, score * 2 AS double, meta.tags[1]",
+    "id, TIMESTAMP(ts) AS created",
+    "id, UTCTIMESTAMP(updated) AS updated",
+]
+
+
+def make_items(count):
+    """Generate items that look like a typical table"""
+    return [
+        {
+            "id": "item-%d" % i,
+            "ts": Decimal(1600000000 + i),
+            "updated": "2020-09-13T12:%02d:%02dZ" % (i // 60 % 60, i % 60),
+            "score": Decimal("%d.25" % i),
+            "name": "Name number %d" % i,
+            "meta": {"tags": ["a", "b", "c"]},
+        }
+        for i in range(count)
+    ]
+
+
+def run(selection, items):
+    """Convert the items with a selection and return the items per second"""
+    attrs = parser.parseString("SCAN %s FROM foobar" % selection)[0].attrs
+    expression = SelectionExpression.from_selection(attrs)
+    convert = expression.convert
+    start = time.perf_counter()
+    for item in items:
+        convert(item, True)
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    """Run the benchmarks"""
+    parse = argparse.ArgumentParser(description=main.__doc__)
+    parse.add_argument(
+        "-n", type=int, default=100000, help="Number of items (default %(default)d)"
+    )
+    args = parse.parse_args()
+    items = make_items(args.n)
+    for selection in SELECTIONS:
+        print("%-40s %10.0f items/s" % (selection, run(selection, items)))
+
+
+if __name__ == "__main__":
+    main()
@@ -55,6 +55,11 @@ def main():
         action="store_true",
         help="When used with --command, format the results as JSON",
     )
+    parse.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="When used with --command, write the results as JSON lines",
+    )
     parse.add_argument(
         "--version", action="store_true", help="Print the version and exit"
     )
@@ -68,14 +73,17 @@ def main():
     cli = DQLClient()
     cli.initialize(region=args.region, host=args.host, port=args.port)
 
-    if args.command:
-        command = args.command.strip()
-        try:
-            cli.run_command(command, use_json=args.json)
-            # Add a trailing ';' if it was missing
-            if cli.engine.partial:
-                cli.run_command(";", use_json=args.json)
-        except KeyboardInterrupt:
-            pass
-    else:
-        cli.start()
+    try:
+        if args.command:
+            command = args.command.strip()
+            try:
+                cli.run_command(command, use_json=args.json, use_jsonl=args.jsonl)
+                # Add a trailing ';' if it was missing
+                if cli.engine.partial:
+                    cli.run_command(";", use_json=args.json, use_jsonl=args.jsonl)
+            except KeyboardInterrupt:
+                pass
+        else:
+            cli.start()
+    finally:
+        cli.engine.close()
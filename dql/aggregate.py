@@ -0,0 +1,347 @@
+""" Computing aggregate functions, like SUM(foo) ... GROUP BY bar """
+
+import functools
+import os
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .exceptions import EngineRuntimeError
+from .expressions import SelectionExpression
+from .expressions.base import Field
+from .expressions.selection import AggregateFunction, NamedExpression
+from .sketch import HyperLogLog, QuantileSketch
+
+# The most groups kept in memory before they are spilled to disk
+MAX_GROUPS = 100000
+
+# The number of files the groups are spilled into. Each file is merged
+# separately, so only about 1/SPILL_PARTITIONS of the groups are in memory.
+SPILL_PARTITIONS = 16
+
+
+def is_number(value: Any) -> bool:
+    """Check if a value can be summed"""
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+class Count(object):
+    """The running state of COUNT(*) or COUNT(expr)"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.value += 1
+
+    def merge(self, other: "Count") -> None:
+        self.value += other.value
+
+    def result(self) -> Any:
+        return self.value
+
+
+class Sum(object):
+    """The running state of SUM(expr)"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value: Any) -> None:
+        if is_number(value):
+            self.value = value if self.value is None else self.value + value
+
+    def merge(self, other: "Sum") -> None:
+        if other.value is not None:
+            self.add(other.value)
+
+    def result(self) -> Any:
+        return self.value
+
+
+class Avg(object):
+    """The running state of AVG(expr)"""
+
+    __slots__ = ("total", "count")
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def add(self, value: Any) -> None:
+        if is_number(value):
+            self.total += value
+            self.count += 1
+
+    def merge(self, other: "Avg") -> None:
+        self.total += other.total
+        self.count += other.count
+
+    def result(self) -> Any:
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+
+class Min(object):
+    """The running state of MIN(expr)"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def _better(self, value: Any) -> bool:
+        return value < self.value
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            return
+        try:
+            if self.value is None or self._better(value):
+                self.value = value
+        except TypeError as e:
+            raise EngineRuntimeError(
+                "Cannot compare %r and %r in %s"
+                % (value, self.value, type(self).__name__.upper())
+            ) from e
+
+    def merge(self, other: "Min") -> None:
+        self.add(other.value)
+
+    def result(self) -> Any:
+        return self.value
+
+
+class Max(Min):
+    """The running state of MAX(expr)"""
+
+    __slots__ = ()
+
+    def _better(self, value: Any) -> bool:
+        return value > self.value
+
+
+class ApproxCountDistinct(object):
+    """The running state of APPROX_COUNT_DISTINCT(expr)"""
+
+    __slots__ = ("sketch",)
+
+    def __init__(self):
+        self.sketch = HyperLogLog()
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.sketch.add(value)
+
+    def merge(self, other: "ApproxCountDistinct") -> None:
+        self.sketch.merge(other.sketch)
+
+    def result(self) -> Any:
+        return self.sketch.count()
+
+
+class ApproxPercentile(object):
+    """The running state of APPROX_PERCENTILE(expr, percentile)"""
+
+    __slots__ = ("percentile", "sketch")
+
+    def __init__(self, percentile: Decimal):
+        self.percentile = float(percentile)
+        self.sketch = QuantileSketch()
+
+    def add(self, value: Any) -> None:
+        if is_number(value):
+            self.sketch.add(value)
+
+    def merge(self, other: "ApproxPercentile") -> None:
+        self.sketch.merge(other.sketch)
+
+    def result(self) -> Any:
+        return self.sketch.quantile(self.percentile)
+
+
+AGGREGATES = {
+    "COUNT": Count,
+    "SUM": Sum,
+    "AVG": Avg,
+    "MIN": Min,
+    "MAX": Max,
+    "APPROX_COUNT_DISTINCT": ApproxCountDistinct,
+    "APPROX_PERCENTILE": ApproxPercentile,
+}
+
+
+def _hashable(value: Any) -> Any:
+    """Convert a value into something that can be used as a dict key"""
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_hashable(v) for v in value)
+    elif isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+# A group is the values of the GROUP BY fields and the aggregate states
+Group = Tuple[List[Any], List[Any]]
+
+
+class Aggregator(object):
+    """
+    Compute the aggregate functions of a selection as items stream in
+
+    Only the running state of each aggregate is kept, once for each group. If
+    there are more than ``max_groups`` groups they are spilled to temporary
+    files, which are merged one partition at a time.
+
+    Parameters
+    ----------
+    selection : :class:`~dql.expressions.SelectionExpression`
+        The aggregate functions and the GROUP BY fields
+    max_groups : int, optional
+        The most groups to keep in memory (default :data:`MAX_GROUPS`)
+
+    """
+
+    def __init__(
+        self, selection: SelectionExpression, max_groups: Optional[int] = None
+    ):
+        self.group_by = selection.group_by
+        self.max_groups = MAX_GROUPS if max_groups is None else max_groups
+        self._group_fields = [Field(field).compile() for field in self.group_by]
+        self._aggregates: List[Tuple[Callable[[], Any], Optional[Callable]]] = []
+        # Each column of the result is (key, is_group_field, index)
+        self._columns = []
+        for expr in selection.expressions:
+            if isinstance(expr, AggregateFunction):
+                evaluate = None if expr.expr is None else expr.expr.compile()
+                self._columns.append((expr.key, False, len(self._aggregates)))
+                factory = functools.partial(AGGREGATES[expr.name], *expr.args)
+                self._aggregates.append((factory, evaluate))
+            else:
+                field = _get_group_field(expr)
+                if field not in self.group_by:
+                    raise SyntaxError(
+                        "%s must be an aggregate function or be in the GROUP BY" % expr
+                    )
+                self._columns.append((expr.key, True, self.group_by.index(field)))
+        self._groups: Dict[Any, Group] = {}
+        self._spill_dir: Optional[str] = None
+
+    def _new_states(self) -> List[Any]:
+        return [factory() for factory, _ in self._aggregates]
+
+    def _get_group(self, values: List[Any]) -> Group:
+        """Get the group for the values of the GROUP BY fields"""
+        key = _hashable(values) if values else ()
+        group = self._groups.get(key)
+        if group is None:
+            if len(self._groups) >= self.max_groups:
+                self._spill()
+            group = self._groups[key] = (values, self._new_states())
+        return group
+
+    def add(self, item: Dict[str, Any]) -> None:
+        """Add an item to its group"""
+        values = [evaluate(item) for evaluate in self._group_fields]
+        states = self._get_group(values)[1]
+        for state, (_, evaluate) in zip(states, self._aggregates):
+            # COUNT(*) counts every item
+            value = True if evaluate is None else evaluate(item)
+            # Expressions that failed to evaluate are treated as missing
+            if not isinstance(value, Exception):
+                state.add(value)
+
+    def add_all(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Add all of the items from the results of a query or scan"""
+        for item in items:
+            self.add(item)
+
+    def merge(self, other: "Aggregator") -> None:
+        """Merge the partial results of another aggregator into this one"""
+        for values, other_states in other._iter_groups():
+            states = self._get_group(values)[1]
+            for state, other_state in zip(states, other_states):
+                state.merge(other_state)
+
+    def _spill(self):
+        """Write all of the groups to the spill files"""
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="dql-groups-")
+        partitions: List[List[Group]] = [[] for _ in range(SPILL_PARTITIONS)]
+        for key, group in self._groups.items():
+            partitions[hash(key) % SPILL_PARTITIONS].append(group)
+        for i, groups in enumerate(partitions):
+            if groups:
+                with open(os.path.join(self._spill_dir, str(i)), "ab") as ofile:
+                    pickle.dump(groups, ofile, pickle.HIGHEST_PROTOCOL)
+        self._groups.clear()
+
+    def _iter_groups(self) -> Iterator[Group]:
+        """Generate all of the groups, merging the ones that were spilled"""
+        if self._spill_dir is None:
+            yield from self._groups.values()
+            return
+        self._spill()
+        for i in range(SPILL_PARTITIONS):
+            filename = os.path.join(self._spill_dir, str(i))
+            if not os.path.exists(filename):
+                continue
+            # Each partition only has a fraction of the groups
+            groups: Dict[Any, Group] = {}
+            with open(filename, "rb") as ifile:
+                try:
+                    while True:
+                        for values, states in pickle.load(ifile):
+                            key = _hashable(values) if values else ()
+                            if key not in groups:
+                                groups[key] = (values, states)
+                                continue
+                            for state, other in zip(groups[key][1], states):
+                                state.merge(other)
+                except EOFError:
+                    pass
+            os.remove(filename)
+            yield from groups.values()
+
+    def results(self) -> Iterator[Dict[str, Any]]:
+        """Generate a result for each group"""
+        try:
+            groups = self._iter_groups()
+            if not self.group_by and not self._groups:
+                # With no GROUP BY there is always one result
+                groups = iter([([], self._new_states())])
+            for values, states in groups:
+                ret: Dict[str, Any] = OrderedDict()
+                for key, is_group_field, index in self._columns:
+                    if is_group_field:
+                        ret[key] = values[index]
+                    else:
+                        ret[key] = states[index].result()
+                yield ret
+        finally:
+            self.close()
+
+    def close(self):
+        """Remove the spill files"""
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+        self._groups.clear()
+
+
+def _get_group_field(expr: NamedExpression) -> Optional[str]:
+    """Get the field of a selection that isn't an aggregate, if it's a field"""
+    selection = expr.expr
+    if selection.expr2 is None and isinstance(selection.expr1, Field):
+        return selection.expr1.field
+    return None
@@ -0,0 +1,157 @@
+""" Collecting query results into NumPy arrays """
+
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Optional
+
+from .exceptions import EngineRuntimeError
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+
+def infer_dtype(value: Any) -> Any:
+    """Get the dtype for a column from its first non-NULL value"""
+    if isinstance(value, bool):
+        return np.dtype(bool)
+    elif isinstance(value, Decimal):
+        return np.dtype("float64")
+    return np.dtype(object)
+
+
+class ColumnBuilder(object):
+    """
+    Accumulates the values of one attribute into a growing NumPy array
+
+    Parameters
+    ----------
+    name : str
+        The name of the attribute
+    dtype : :class:`numpy.dtype`, optional
+        The dtype of the array. If not provided, it will be inferred from the
+        first value.
+
+    """
+
+    def __init__(self, name: str, dtype: Optional[Any] = None):
+        self.name = name
+        self.inferred = dtype is None
+        self.dtype: Any = None if dtype is None else np.dtype(dtype)
+        self.data: Any = None
+        # Items that don't have the attribute stay masked
+        self.mask = np.ones(0, dtype=bool)
+
+    @property
+    def _storage_dtype(self):
+        """Strings are stored as objects until we know how long they are"""
+        if self.dtype.kind in "US":
+            return np.dtype(object)
+        return self.dtype
+
+    def _convert(self, value: Any) -> Any:
+        """Convert a value into something that fits the dtype"""
+        kind = self.dtype.kind
+        if kind in "fiu" and isinstance(value, (str, bytes)):
+            raise TypeError("%r is not a number" % value)
+        if kind == "f":
+            return float(value)
+        elif kind in "iu":
+            if isinstance(value, Decimal) and value % 1 != 0:
+                raise ValueError("%r is not an integer" % value)
+            return int(value)
+        elif kind == "b":
+            if not isinstance(value, bool):
+                raise TypeError("%r is not a boolean" % value)
+            return value
+        elif kind in "US":
+            return str(value)
+        return value
+
+    def _grow(self, size: int) -> None:
+        """Make sure the arrays can hold at least size values"""
+        if size <= len(self.mask):
+            return
+        capacity = max(size, 2 * len(self.mask), 16)
+        data = np.zeros(capacity, dtype=self._storage_dtype)
+        mask = np.ones(capacity, dtype=bool)
+        if self.data is not None:
+            data[: len(self.data)] = self.data
+            mask[: len(self.mask)] = self.mask
+        self.data = data
+        self.mask = mask
+
+    def append(self, index: int, value: Any) -> None:
+        """Set the value of the attribute for the item at an index"""
+        if value is None:
+            return
+        if self.dtype is None:
+            self.dtype = infer_dtype(value)
+        self._grow(index + 1)
+        try:
+            converted = self._convert(value)
+        except (TypeError, ValueError, InvalidOperation) as e:
+            if not self.inferred:
+                raise EngineRuntimeError(
+                    "Attribute %r has a value %r that cannot be stored as %s"
+                    % (self.name, value, self.dtype)
+                ) from e
+            # The column has mixed types, so fall back to objects
+            self.dtype = np.dtype(object)
+            self.data = self.data.astype(object)
+            converted = value
+        self.data[index] = converted
+        self.mask[index] = False
+
+    def finish(self, size: int) -> Any:
+        """Get the :class:`numpy.ma.MaskedArray` of the attribute"""
+        if self.dtype is None:
+            # Every value was NULL
+            self.dtype = np.dtype(object)
+        self._grow(size)
+        data = self.data[:size]
+        if self.dtype.kind in "US":
+            data = data.astype(
+                self.dtype.kind if self.dtype.itemsize == 0 else self.dtype
+            )
+        return np.ma.MaskedArray(data, mask=self.mask[:size].copy())
+
+
+def to_columns(
+    items: Iterable[Dict], dtypes: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Collect items into a masked NumPy array for each attribute
+
+    Parameters
+    ----------
+    items : iterable
+        The items to collect. They are consumed one at a time, so the whole
+        result set is never held as dicts.
+    dtypes : dict, optional
+        Mapping of attribute name to NumPy dtype. The dtype of any other
+        attribute is inferred from its first non-NULL value (float64 for
+        numbers, bool for booleans, and object for everything else).
+
+    Returns
+    -------
+    columns : dict
+        Mapping of attribute name to :class:`numpy.ma.MaskedArray`. Items that
+        don't have the attribute are masked.
+
+    """
+    if np is None:
+        raise EngineRuntimeError("to_columns requires numpy (pip install numpy)")
+    dtypes = dtypes or {}
+    builders: Dict[str, ColumnBuilder] = {}
+    for name, dtype in dtypes.items():
+        builders[name] = ColumnBuilder(name, dtype)
+    size = 0
+    for index, item in enumerate(items):
+        for name, value in item.items():
+            builder = builders.get(name)
+            if builder is None:
+                builder = builders[name] = ColumnBuilder(name)
+            builder.append(index, value)
+        size = index + 1
+    return dict((name, builder.finish(size)) for name, builder in builders.items())
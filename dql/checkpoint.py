@@ -0,0 +1,108 @@
+""" Checkpoints for resuming long-running statements """
+
+import json
+import os
+from base64 import b64decode, b64encode
+from typing import Dict, Optional
+
+from .exceptions import EngineRuntimeError
+
+
+def encode_key(key: Dict) -> Dict:
+    """Convert a DynamoDB-encoded key into something JSON can store"""
+    ret = {}
+    for name, value in key.items():
+        ((type_, raw),) = value.items()
+        if type_ == "B":
+            raw = b64encode(raw).decode("ascii")
+        ret[name] = {type_: raw}
+    return ret
+
+
+def decode_key(key: Dict) -> Dict:
+    """Inverse of :meth:`~.encode_key`"""
+    ret = {}
+    for name, value in key.items():
+        ((type_, raw),) = value.items()
+        if type_ == "B":
+            raw = b64decode(raw)
+        ret[name] = {type_: raw}
+    return ret
+
+
+class Checkpoint(object):
+    """
+    Records the progress of a statement in a local file so it can be resumed
+
+    Parameters
+    ----------
+    filename : str
+        The file that stores the checkpoint state
+    statement : str
+        Identifies the statement. A checkpoint can only be resumed by the
+        statement that created it.
+
+    Attributes
+    ----------
+    last_key : dict
+        The DynamoDB-encoded key to resume after. None means start from the
+        beginning.
+    processed : int
+        The number of items processed before ``last_key``
+    offset : int
+        For SAVE, the length of the output file at ``last_key``
+    resumed : bool
+        True if this checkpoint was loaded from an existing file
+
+    """
+
+    def __init__(self, filename: str, statement: str):
+        self.filename = filename
+        self.statement = statement
+        self.last_key: Optional[Dict] = None
+        self.processed = 0
+        self.offset = 0
+        self.resumed = False
+
+    @classmethod
+    def load(cls, filename: str, statement: str) -> "Checkpoint":
+        """Load the checkpoint file, or create a new checkpoint if missing"""
+        checkpoint = cls(filename, statement)
+        if not os.path.exists(filename):
+            return checkpoint
+        with open(filename, "r", encoding="utf-8") as ifile:
+            data = json.load(ifile)
+        if data["statement"] != statement:
+            raise EngineRuntimeError(
+                "Checkpoint %r was created by a different statement:\n%s"
+                % (filename, data["statement"])
+            )
+        if data["last_key"] is not None:
+            checkpoint.last_key = decode_key(data["last_key"])
+        checkpoint.processed = data["processed"]
+        checkpoint.offset = data.get("offset", 0)
+        checkpoint.resumed = True
+        return checkpoint
+
+    def save(self, last_key: Optional[Dict], processed: int, offset: int = 0) -> None:
+        """Record the progress of the statement"""
+        self.last_key = last_key
+        self.processed = processed
+        self.offset = offset
+        data = {
+            "statement": self.statement,
+            "last_key": None if last_key is None else encode_key(last_key),
+            "processed": processed,
+            "offset": offset,
+        }
+        # Write to a temporary file and swap it in, so getting killed in the
+        # middle of a write won't corrupt the checkpoint
+        tmpfile = self.filename + ".tmp"
+        with open(tmpfile, "w", encoding="utf-8") as ofile:
+            json.dump(data, ofile)
+        os.replace(tmpfile, self.filename)
+
+    def clear(self):
+        """Remove the checkpoint file once the statement has completed"""
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
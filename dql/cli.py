@@ -48,6 +48,7 @@ from .output import (
     ColumnFormat,
     ExpandedFormat,
     JsonFormat,
+    JsonLinesFormat,
     SmartBuffer,
     SmartFormat,
     console,
@@ -76,6 +77,7 @@ FORMATTERS = {
     "expanded": ExpandedFormat,
     "column": ColumnFormat,
     "json": JsonFormat,
+    "jsonl": JsonLinesFormat,
 }
 DEFAULT_CONFIG = {
     "width": "auto",
@@ -84,6 +86,7 @@ DEFAULT_CONFIG = {
     "format": "smart",
     "allow_select_scan": False,
     "lossy_json_float": True,
+    "decode_workers": 0,
     "_throttle": {},
 }
 
@@ -288,6 +291,7 @@ class DQLClient(cmd.Cmd):
         self.display = DISPLAYS[self.conf["display"]]
         self.throttle = TableLimits()
         self.throttle.load(self.conf["_throttle"])
+        self.engine.decode_workers = self.conf["decode_workers"]
 
     def start(self):
         """Start running the interactive session (blocking)"""
@@ -352,14 +356,15 @@ class DQLClient(cmd.Cmd):
         )
         print(proc.communicate()[0])
 
-    def caution_callback(self, action):
+    def caution_callback(self, action, message=None):
         """
         Prompt user for manual continue when doing write operation on all items
-        in a table
+        in a table, or when a query has reached its MAX CAPACITY
 
         """
-        msg = "This will run %s on all items in the table! Continue?" % action
-        return promptyn(msg, False)
+        if message is None:
+            message = "This will run %s on all items in the table!" % action
+        return promptyn(message + " Continue?", False)
 
     def save_config(self):
         """Save the conf file"""
@@ -515,6 +520,12 @@ class DQLClient(cmd.Cmd):
         """Autocomplete for lossy_json_float option"""
         return [t for t in ("true", "false", "yes", "no") if t.startswith(text.lower())]
 
+    def opt_decode_workers(self, workers):
+        """Set option decode_workers"""
+        workers = int(workers)
+        self.conf["decode_workers"] = workers
+        self.engine.decode_workers = workers
+
     @repl_command
     def do_watch(self, *args):
         """Watch Dynamo tables consumed capacity"""
@@ -797,11 +808,15 @@ class DQLClient(cmd.Cmd):
             if not self._silent:
                 print(results)
         else:
+            pagesize = self.conf["pagesize"]
+            # 'less' does the paging, so don't stop to prompt for more results
+            if self.display is less_display:
+                pagesize = 0
             with self.display() as ostream:
                 formatter = FORMATTERS[self.conf["format"]](
                     results,
                     ostream,
-                    pagesize=self.conf["pagesize"],
+                    pagesize=pagesize,
                     width=self.conf["width"],
                     lossy_json_float=self.conf["lossy_json_float"],
                 )
@@ -861,7 +876,11 @@ class DQLClient(cmd.Cmd):
         return self._common_exit()
 
     def run_command(
-        self, command: str, use_json: bool = False, raise_exceptions: bool = False
+        self,
+        command: str,
+        use_json: bool = False,
+        raise_exceptions: bool = False,
+        use_jsonl: bool = False,
     ) -> None:
         """Run a command passed in from the command line with -c"""
         self.display = DISPLAYS["stdout"]
@@ -869,6 +888,9 @@ class DQLClient(cmd.Cmd):
         if use_json:
             self.conf["format"] = "json"
             self._silent = True
+        elif use_jsonl:
+            self.conf["format"] = "jsonl"
+            self._silent = True
         if raise_exceptions:
             self.onecmd(command)
         else:
@@ -0,0 +1,301 @@
+""" Writing query results to columnar (Parquet and Arrow) files """
+
+import json
+import os
+from base64 import b64encode
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dynamo3 import Binary
+
+from .exceptions import EngineRuntimeError
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+COLUMNAR_FORMATS = (".parquet", ".arrow")
+
+# Numbers outside of this range can't be stored in an int64 column
+MIN_INT64 = -(2**63)
+MAX_INT64 = 2**63 - 1
+
+
+def json_default(value):
+    """Encode the DynamoDB types that are nested in maps and lists"""
+    if isinstance(value, Decimal):
+        if value % 1 == 0:
+            return int(value)
+        return float(value)
+    elif isinstance(value, set):
+        return list(value)
+    elif isinstance(value, Binary):
+        return b64encode(value.value).decode("ascii")
+    elif isinstance(value, bytes):
+        return b64encode(value).decode("ascii")
+    elif isinstance(value, datetime):
+        return value.isoformat()
+    elif isinstance(value, timedelta):
+        return value.total_seconds()
+    raise TypeError("Cannot encode %s value %r" % (type(value), value))
+
+
+def value_kind(value: Any) -> str:
+    """Get the kind of column that can store a value"""
+    if isinstance(value, bool):
+        return "bool"
+    elif isinstance(value, str):
+        return "string"
+    elif isinstance(value, Decimal):
+        if value % 1 == 0 and MIN_INT64 <= value <= MAX_INT64:
+            return "int"
+        return "float"
+    elif isinstance(value, (Binary, bytes)):
+        return "binary"
+    elif isinstance(value, set):
+        kind = None
+        for elem in value:
+            kind = merge_kinds(kind, value_kind(elem))
+        return "set:" + (kind or "string")
+    return "json"
+
+
+def merge_kinds(kind: Optional[str], other: str) -> str:
+    """Get the kind of column that can store values of both kinds"""
+    if kind is None or kind == other:
+        return other
+    if set([kind, other]) == set(["int", "float"]):
+        return "float"
+    if kind.startswith("set:") and other.startswith("set:"):
+        elem_kind = merge_kinds(kind[4:], other[4:])
+        if elem_kind != "json":
+            return "set:" + elem_kind
+    # Mixed types get stored as JSON
+    return "json"
+
+
+def arrow_type(kind: Optional[str]) -> Any:
+    """Get the Arrow type for a kind of column"""
+    if kind is None:
+        # Every value so far has been NULL
+        return pa.null()
+    elif kind.startswith("set:"):
+        return pa.list_(arrow_type(kind[4:]))
+    return {
+        "bool": pa.bool_(),
+        "string": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "binary": pa.binary(),
+        "json": pa.string(),
+    }[kind]
+
+
+def convert_value(kind: str, value: Any) -> Any:
+    """Convert a value into something Arrow can store in a column"""
+    if kind == "json":
+        return json.dumps(value, default=json_default)
+    elif kind == "int":
+        return int(value)
+    elif kind == "float":
+        return float(value)
+    elif kind == "binary":
+        return value.value if isinstance(value, Binary) else value
+    elif kind.startswith("set:"):
+        elem_kind = kind[4:]
+        return [convert_value(elem_kind, elem) for elem in value]
+    return value
+
+
+class ColumnarWriter(object):
+    """
+    Write items to a Parquet or Arrow file in batches
+
+    The schema is inferred from the items. Numbers are stored as int64 if they
+    are all integers, otherwise float64. Sets are stored as lists, and maps,
+    lists, and attributes with mixed types are stored as JSON strings.
+    Attributes that have only been NULL are stored as a null column until a
+    value shows up.
+
+    Each batch is written as soon as it is full. If a later batch doesn't fit
+    the schema (an int column gets a float, a column gets a value of a
+    different type, or a new attribute appears), the columns are promoted and
+    the batches after that are written to a separate part. When the file is
+    closed, the parts are merged into one file with the final schema.
+
+    Parameters
+    ----------
+    filename : str
+    ext : str
+        Either '.parquet' or '.arrow'
+    batch_size : int, optional
+        The number of items in each row group/record batch (default 10000)
+
+    """
+
+    def __init__(self, filename: str, ext: str, batch_size: int = 10000):
+        if pa is None:
+            raise EngineRuntimeError(
+                "Saving to %s files requires pyarrow (pip install pyarrow)" % ext
+            )
+        self.filename = filename
+        self.ext = ext
+        self.batch_size = batch_size
+        self._items: List[Dict] = []
+        self._kinds: Optional[Dict[str, Optional[str]]] = None
+        self._writer: Any = None
+        self._path = filename
+        # The files (and their column kinds) written before the schema changed
+        self._parts: List[Tuple[str, Dict[str, Optional[str]]]] = []
+
+    def write(self, item: Dict) -> None:
+        """Write an item to the file"""
+        self._items.append(item)
+        if len(self._items) >= self.batch_size:
+            self.flush()
+
+    def _infer_kinds(self) -> Dict[str, Optional[str]]:
+        """Get the column kinds that can store the current batch of items"""
+        kinds: Dict[str, Optional[str]] = OrderedDict(self._kinds or {})
+        for item in self._items:
+            for key, value in item.items():
+                kind = kinds.get(key)
+                if value is not None:
+                    kind = merge_kinds(kind, value_kind(value))
+                kinds[key] = kind
+        return kinds
+
+    def _column(self, name: str, kind: Optional[str]) -> List:
+        """Convert the batch of items into the values for a column"""
+        values: List[Any] = []
+        for item in self._items:
+            value = item.get(name)
+            # A column with no kind has only seen NULLs
+            values.append(
+                None if value is None or kind is None else convert_value(kind, value)
+            )
+        return values
+
+    def _open(self, path: str, kinds: Dict[str, Optional[str]]) -> None:
+        """Open a file for writing"""
+        schema = pa.schema([(key, arrow_type(kind)) for key, kind in kinds.items()])
+        if self.ext == ".parquet":
+            self._writer = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd")
+            self._writer = pa.ipc.new_file(path, schema, options=options)
+        self._path = path
+        self._kinds = kinds
+
+    def _write_batch(self, arrays: List) -> None:
+        """Write a batch of columns to the open file"""
+        assert self._kinds is not None
+        schema = pa.schema(
+            [(key, arrow_type(kind)) for key, kind in self._kinds.items()]
+        )
+        batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        if self.ext == ".parquet":
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def flush(self):
+        """Write the buffered items as a row group"""
+        if not self._items:
+            return
+        kinds = self._infer_kinds()
+        if self._kinds is None:
+            self._open(self.filename, kinds)
+        elif kinds != self._kinds:
+            # The schema changed, so start a new part with the promoted schema
+            self._writer.close()
+            path = self._path
+            if path == self.filename:
+                path = self._part_name(0)
+                os.rename(self.filename, path)
+            self._parts.append((path, self._kinds))
+            self._open(self._part_name(len(self._parts)), kinds)
+        self._write_batch(
+            [
+                pa.array(self._column(name, kind), type=arrow_type(kind))
+                for name, kind in kinds.items()
+            ]
+        )
+        self._items = []
+
+    def _part_name(self, index: int) -> str:
+        """The name of the file to write a part to"""
+        return "%s.%d.part" % (self.filename, index)
+
+    def _read_batches(self, path: str) -> Iterator[Any]:
+        """Read the record batches back from a part"""
+        if self.ext == ".parquet":
+            yield from pq.ParquetFile(path).iter_batches(batch_size=self.batch_size)
+        else:
+            reader = pa.ipc.open_file(path)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+    def _merge_parts(self):
+        """Copy the parts into the output file, promoting them to the final schema"""
+        assert self._kinds is not None
+        self._parts.append((self._path, self._kinds))
+        final_kinds = self._kinds
+        self._open(self.filename, final_kinds)
+        for path, kinds in self._parts:
+            for batch in self._read_batches(path):
+                arrays = []
+                for name, kind in final_kinds.items():
+                    new_type = arrow_type(kind)
+                    if name not in kinds:
+                        arrays.append(pa.nulls(batch.num_rows, type=new_type))
+                        continue
+                    column = batch.column(batch.schema.get_field_index(name))
+                    if kind == kinds[name] or kind != "json":
+                        # Same kind, ints promoted to floats, or a null column
+                        # that got a type
+                        arrays.append(column.cast(new_type))
+                    else:
+                        arrays.append(
+                            pa.array(
+                                [
+                                    (
+                                        None
+                                        if value is None
+                                        else json.dumps(value, default=json_default)
+                                    )
+                                    for value in column.to_pylist()
+                                ],
+                                type=new_type,
+                            )
+                        )
+                self._write_batch(arrays)
+
+    def close(self):
+        """Write any remaining items and close the file"""
+        try:
+            self.flush()
+            if self._parts:
+                self._writer.close()
+                self._merge_parts()
+        finally:
+            if self._writer is None:
+                # There were no items, so write an empty file
+                self._open(self.filename, OrderedDict())
+            self._writer.close()
+            for path, _ in self._parts:
+                if os.path.exists(path):
+                    os.remove(path)
+            if self._path != self.filename and os.path.exists(self._path):
+                os.remove(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
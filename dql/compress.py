@@ -0,0 +1,283 @@
+""" Compressing and decompressing SAVE files on multiple threads """
+
+import gzip
+import io
+import os
+import queue
+import threading
+from collections import deque
+from concurrent import futures
+from typing import IO, Any, BinaryIO, Callable, Deque, Optional, cast
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+# Mapping of file extension to compression format
+COMPRESSED_EXTENSIONS = {
+    ".gz": "gzip",
+    ".gzip": "gzip",
+    ".zst": "zstd",
+    ".lz4": "lz4",
+}
+
+# Amount of uncompressed data in each independently compressed block
+BLOCK_SIZE = 1 << 20
+
+
+def get_compression(filename: str) -> Optional[str]:
+    """Get the compression format of a file from its extension"""
+    ext = os.path.splitext(filename)[1]
+    return COMPRESSED_EXTENSIONS.get(ext.lower())
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    """Compress a block as a zstd frame"""
+    # Compressors can't be shared between threads
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _check_available(compression: str) -> None:
+    """Raise an error if the library for a compression format is missing"""
+    # Imported here because the exceptions import util, which imports this
+    from .exceptions import EngineRuntimeError
+
+    if compression == "zstd" and zstandard is None:
+        raise EngineRuntimeError("zstd files require zstandard (pip install dql[zstd])")
+    elif compression == "lz4" and lz4 is None:
+        raise EngineRuntimeError("lz4 files require lz4 (pip install dql[lz4])")
+
+
+def _get_compressor(compression: str) -> Callable[[bytes], bytes]:
+    """Get the function that compresses a block into a gzip member or frame"""
+    _check_available(compression)
+    if compression == "zstd":
+        return _zstd_compress
+    elif compression == "lz4":
+        return lz4.frame.compress
+    return gzip.compress
+
+
+def _open_decompressor(filename: str, compression: str) -> IO[bytes]:
+    """Open a file that decompresses all of the members or frames"""
+    _check_available(compression)
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(filename, "rb"), read_across_frames=True, closefd=True
+        )
+    elif compression == "lz4":
+        return lz4.frame.open(filename, "rb")
+    return cast(IO[bytes], gzip.open(filename, "rb"))
+
+
+class ParallelCompressor(io.BufferedIOBase):
+    """
+    A file that compresses the data written to it on a pool of threads
+
+    The data is split into blocks, and each block is compressed into a
+    separate gzip member (or zstd/lz4 frame). Readers will decompress all of
+    them as one stream.
+
+    Parameters
+    ----------
+    fileobj : file
+        The binary file to write the compressed data to
+    compress : callable
+        Compresses a block into a gzip member or frame
+    block_size : int, optional
+        The amount of uncompressed data in each block (default 1MB)
+    workers : int, optional
+        The number of threads to use (default is the number of CPUs)
+
+    """
+
+    def __init__(
+        self,
+        fileobj: IO[bytes],
+        compress: Callable[[bytes], bytes],
+        block_size: int = BLOCK_SIZE,
+        workers: Optional[int] = None,
+    ):
+        super().__init__()
+        workers = workers or os.cpu_count() or 1
+        self._fileobj = fileobj
+        self._compress = compress
+        self._block_size = block_size
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers)
+        # Bound the amount of data waiting to be compressed
+        self._max_pending = 2 * workers
+        self._pending: Deque[futures.Future] = deque()
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        # This is only so that TextIOWrapper will call tell()
+        return True
+
+    def tell(self) -> int:
+        """The number of uncompressed bytes that have been written"""
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if (whence, offset) not in [(io.SEEK_SET, self._position), (io.SEEK_CUR, 0)]:
+            raise io.UnsupportedOperation("Cannot seek in a compressed file")
+        return self._position
+
+    def write(self, data: Any) -> int:
+        if self.closed:  # pylint: disable=W0125
+            raise ValueError("write to closed file")
+        length = len(data)
+        self._buffer += data
+        self._position += length
+        if len(self._buffer) >= self._block_size:
+            self._submit()
+        return length
+
+    def _submit(self):
+        """Start compressing the buffered data"""
+        block = bytes(self._buffer)
+        self._buffer = bytearray()
+        self._pending.append(self._executor.submit(self._compress, block))
+        # Write the blocks that are done, in order
+        while self._pending and (
+            len(self._pending) > self._max_pending or self._pending[0].done()
+        ):
+            self._fileobj.write(self._pending.popleft().result())
+
+    def flush(self):
+        """Compress and write all of the data written so far"""
+        if self._buffer:
+            self._submit()
+        while self._pending:
+            self._fileobj.write(self._pending.popleft().result())
+        self._fileobj.flush()
+
+    def close(self):
+        if self.closed:  # pylint: disable=W0125
+            return
+        try:
+            self.flush()
+            super().close()
+        finally:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown()
+            self._fileobj.close()
+
+
+class ReadAheadReader(io.RawIOBase):
+    """
+    A file that reads chunks from another file on a background thread
+
+    This lets decompression overlap with processing the data.
+
+    Parameters
+    ----------
+    fileobj : file
+        The binary file to read from
+    chunk_size : int, optional
+        The size of each read (default 1MB)
+    depth : int, optional
+        The number of chunks to read ahead (default 4)
+
+    """
+
+    def __init__(
+        self, fileobj: IO[bytes], chunk_size: int = BLOCK_SIZE, depth: int = 4
+    ):
+        super().__init__()
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._queue: queue.Queue = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._chunk = b""
+        self._pos = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _put(self, value: Any) -> None:
+        """Put a value on the queue, unless the reader is closed"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(value, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _read_ahead(self):
+        """Read chunks until the end of the file. Runs on a thread."""
+        try:
+            while not self._stop.is_set():
+                data = self._fileobj.read(self._chunk_size)
+                # An empty chunk marks the end of the file
+                self._put(data)
+                if not data:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if self._pos >= len(self._chunk):
+            if self._eof:
+                return 0
+            value = self._queue.get()
+            if isinstance(value, Exception):
+                self._eof = True
+                raise value
+            if not value:
+                self._eof = True
+                return 0
+            self._chunk = value
+            self._pos = 0
+        length = min(len(buffer), len(self._chunk) - self._pos)
+        buffer[:length] = self._chunk[self._pos : self._pos + length]
+        self._pos += length
+        return length
+
+    def close(self):
+        if self.closed:  # pylint: disable=W0125
+            return
+        self._stop.set()
+        self._thread.join()
+        self._fileobj.close()
+        super().close()
+
+
+def open_compressed(
+    filename: str, compression: str, mode: str = "r", workers: Optional[int] = None
+) -> BinaryIO:
+    """
+    Open a compressed file in binary mode
+
+    Parameters
+    ----------
+    filename : str
+    compression : str
+        One of 'gzip', 'zstd', or 'lz4'
+    mode : str, optional
+        'r', 'w', or 'a' (default 'r'). Appending adds new members or frames
+        to the end of the file.
+    workers : int, optional
+        The number of threads to compress with (default is the number of CPUs)
+
+    """
+    if mode == "r":
+        reader = ReadAheadReader(_open_decompressor(filename, compression))
+        return io.BufferedReader(reader, BLOCK_SIZE)
+    compress = _get_compressor(compression)
+    return ParallelCompressor(  # type: ignore
+        open(filename, mode + "b"), compress, workers=workers  # pylint: disable=W1514
+    )
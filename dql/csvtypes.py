@@ -0,0 +1,203 @@
+""" Column types for saving and loading CSV files """
+
+import json
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .exceptions import EngineRuntimeError
+
+# The sidecar file that SAVE writes next to a CSV with the type of each column
+TYPES_SUFFIX = ".types.json"
+
+# The number of rows used to infer the column types
+SAMPLE_ROWS = 1000
+
+# Numbers that are safe to infer. Leading zeros and exponents are probably
+# identifiers, and Dynamo only supports 38 digits of precision.
+NUMBER_RE = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?")
+MAX_DIGITS = 38
+
+BOOLEANS = {"True": True, "False": False, "true": True, "false": False}
+
+
+def value_type(value: Any) -> Optional[str]:
+    """Get the CSV column type of a value, or None if it's missing"""
+    if value is None:
+        # Missing values are written as empty cells, which LOAD skips
+        return None
+    elif isinstance(value, bool):
+        return "BOOL"
+    elif isinstance(value, (Decimal, int, float)):
+        return "N"
+    # Everything else is written as a string
+    return "S"
+
+
+def merge_types(column_type: Optional[str], other: Optional[str]) -> Optional[str]:
+    """Get the type of a column that has values of both types"""
+    if other is None:
+        return column_type
+    elif column_type is None or column_type == other:
+        return other
+    return "S"
+
+
+def get_types_filename(filename: str) -> str:
+    """Get the name of the sidecar file with the column types of a CSV"""
+    return filename + TYPES_SUFFIX
+
+
+def write_types(filename: str, types: Dict[str, str]) -> None:
+    """Write the sidecar file with the column types of a CSV"""
+    with open(get_types_filename(filename), "w", encoding="utf-8") as ofile:
+        json.dump(types, ofile, indent=2, sort_keys=True)
+        ofile.write("\n")
+
+
+def read_types(filename: str) -> Dict[str, str]:
+    """Read the sidecar file with the column types of a CSV, if there is one"""
+    types_file = get_types_filename(filename)
+    if not os.path.exists(types_file):
+        return {}
+    with open(types_file, "r", encoding="utf-8") as ifile:
+        return json.load(ifile)
+
+
+def parse_header(header: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Get the column names and types from the header of a CSV
+
+    The type of a column can be given in the header as 'name:TYPE', where
+    TYPE is S, N, or BOOL.
+
+    """
+    names = []
+    types = {}
+    for column in header:
+        name, _, column_type = column.rpartition(":")
+        if name and column_type.upper() in CONVERTERS:
+            types[name] = column_type.upper()
+        else:
+            name = column
+        names.append(name)
+    return names, types
+
+
+def _infer_type(value: str) -> str:
+    """Infer the type of a CSV value"""
+    if value in BOOLEANS:
+        return "BOOL"
+    elif NUMBER_RE.fullmatch(value) and len(value.lstrip("-")) <= MAX_DIGITS + 1:
+        return "N"
+    return "S"
+
+
+def infer_types(names: List[str], rows: Iterable[List[str]]) -> Dict[str, str]:
+    """Infer the type of each column from a sample of rows"""
+    types: Dict[str, Optional[str]] = dict.fromkeys(names)
+    for row in rows:
+        for name, value in zip(names, row):
+            if value != "" and types[name] != "S":
+                types[name] = merge_types(types[name], _infer_type(value))
+    return dict((name, column_type or "S") for name, column_type in types.items())
+
+
+def _to_number(value: str) -> Decimal:
+    try:
+        return Decimal(value)
+    except InvalidOperation as e:
+        raise ValueError(value) from e
+
+
+def _to_bool(value: str) -> bool:
+    return BOOLEANS[value]
+
+
+CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    "S": str,
+    "N": _to_number,
+    "BOOL": _to_bool,
+}
+
+
+def make_converter(
+    names: List[str], types: Dict[str, str], explicit: Optional[Set[str]] = None
+) -> Callable[[List[str]], Dict[str, Any]]:
+    """
+    Create a function that converts a row of a CSV into an item
+
+    Empty cells are left out of the item, because SAVE writes them for the
+    attributes that an item doesn't have.
+
+    Parameters
+    ----------
+    names : list
+    types : dict
+        Mapping of column name to 'S', 'N', or 'BOOL'
+    explicit : set, optional
+        The columns whose type was given explicitly. A value that doesn't fit
+        one of these types raises an error, but the types of the other columns
+        were only inferred from a sample, so those values are kept as strings.
+        If not provided, every type is explicit.
+
+    """
+    width = len(names)
+    columns = [
+        (
+            index,
+            name,
+            CONVERTERS[types.get(name, "S")],
+            explicit is None or name in explicit,
+        )
+        for index, name in enumerate(names)
+    ]
+
+    def convert(row: List[str]) -> Dict[str, Any]:
+        """Convert a row of a CSV into an item"""
+        if len(row) != width:
+            row = (row + [""] * width)[:width]
+        item = {}
+        for index, name, converter, strict in columns:
+            value = row[index]
+            if value != "":
+                try:
+                    item[name] = converter(value)
+                except (KeyError, ValueError) as e:
+                    if not strict:
+                        item[name] = value
+                        continue
+                    raise EngineRuntimeError(
+                        "Invalid %s value %r in column %r" % (types[name], value, name)
+                    ) from e
+        return item
+
+    return convert
+
+
+def get_column_types(
+    filename: str, header: List[str], sample: List[List[str]]
+) -> Tuple[List[str], Dict[str, str], Set[str]]:
+    """
+    Get the names and types of the columns of a CSV
+
+    The types come from the sidecar file written by SAVE, then the types given
+    in the header, and finally are inferred from a sample of the rows.
+
+    Returns
+    -------
+    names : list
+    types : dict
+        Mapping of column name to 'S', 'N', or 'BOOL'
+    explicit : set
+        The columns whose type came from the sidecar file or the header, which
+        can be passed to :func:`~.make_converter`
+
+    """
+    names, header_types = parse_header(header)
+    types = infer_types(names, sample)
+    types.update(header_types)
+    sidecar_types = read_types(filename)
+    types.update(sidecar_types)
+    return names, types, set(header_types).union(sidecar_types)
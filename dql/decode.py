@@ -0,0 +1,82 @@
+""" Decoding the results of large queries and scans on a pool of processes """
+
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent import futures
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from dynamo3 import Dynamizer
+
+from .expressions import SelectionExpression
+from .raw import RawResultSet
+
+# The number of items sent to a process at a time
+DECODE_BATCH_SIZE = 1000
+
+# Dynamizers can't be pickled, so each process uses the default one
+_DYNAMIZER = Dynamizer()
+
+
+def decode_batch(
+    raw_items: List[Dict[str, Any]], selection: SelectionExpression, sanitize: bool
+) -> List[Dict[str, Any]]:
+    """Decode a batch of items in the DynamoDB wire format and select from them"""
+    decode = _DYNAMIZER.decode_keys
+    return [selection.convert(decode(raw_item), sanitize) for raw_item in raw_items]
+
+
+def create_decode_pool(workers: int) -> futures.ProcessPoolExecutor:
+    """Create a pool of processes for :func:`~.iter_decoded`"""
+    return futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def iter_decoded(
+    result: RawResultSet,
+    selection: SelectionExpression,
+    sanitize: bool = False,
+    workers: int = 1,
+    executor: Optional[futures.Executor] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Decode and select from the items of a query or scan on a pool of processes
+
+    The pages are fetched on this thread while earlier ones are decoded, and
+    the items are generated in their original order.
+
+    Parameters
+    ----------
+    result : :class:`~dql.raw.RawResultSet`
+        The results, which haven't been decoded
+    selection : :class:`~dql.expressions.SelectionExpression`
+    sanitize : bool, optional
+        Passed to :meth:`~dql.expressions.SelectionExpression.convert`
+    workers : int, optional
+        The number of processes (default 1)
+    executor : :class:`~concurrent.futures.Executor`, optional
+        A pool to share with other results. If not provided, one will be
+        created for these results.
+
+    """
+    if executor is None:
+        with create_decode_pool(workers) as executor:
+            yield from iter_decoded(result, selection, sanitize, workers, executor)
+        return
+    # Bound the number of batches waiting to be decoded
+    max_pending = 2 * workers
+    pending: Deque[futures.Future] = deque()
+    try:
+        while True:
+            batch = list(itertools.islice(result, DECODE_BATCH_SIZE))
+            if not batch:
+                break
+            pending.append(executor.submit(decode_batch, batch, selection, sanitize))
+            while pending and (len(pending) > max_pending or pending[0].done()):
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -7,16 +7,33 @@ import io
 import itertools
 import json
 import logging
+import multiprocessing
 import os
 import pickle
+import re
 import sys
+import threading
 import time
+import types
 from base64 import b64encode
 from builtins import int
+from collections import deque
 from concurrent import futures
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 from pprint import pformat
-from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union, cast, overload
+from typing import (
+    Any,
+    BinaryIO,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+    overload,
+)
 
 import botocore
 import botocore.session
@@ -36,6 +53,7 @@ from dynamo3 import (
     Throughput,
 )
 from dynamo3.constants import PAY_PER_REQUEST, PROVISIONED, RESERVED_WORDS
+from dynamo3.exception import TransactionCanceledException
 from dynamo3.result import Count
 from dynamo3.types import TYPES
 from pyparsing import ParseException
@@ -49,20 +67,82 @@ from rich.progress import (
 )
 from typing_extensions import Literal
 
-from .exceptions import EngineRuntimeError, ExplainSignal
+from .aggregate import Aggregator
+from .arrays import to_columns
+from .checkpoint import Checkpoint
+from .columnar import COLUMNAR_FORMATS, ColumnarWriter
+from .compress import get_compression
+from .csvtypes import (
+    SAMPLE_ROWS,
+    get_column_types,
+    make_converter,
+    merge_types,
+    read_types,
+    value_type,
+    write_types,
+)
+from .decode import create_decode_pool, iter_decoded
+from .exceptions import (
+    CapacityExceeded,
+    EngineRuntimeError,
+    ExplainSignal,
+    StatementInterrupted,
+)
 from .expressions import (
     ConstraintExpression,
     SelectionExpression,
     UpdateExpression,
     Visitor,
 )
+from .framed import (
+    decode_block,
+    is_framed_file,
+    iter_block_payloads,
+    open_block_file,
+)
 from .grammar import line_parser, parser
+from .loader import (
+    PICKLE_FORMAT,
+    expand_load_filename,
+    get_load_format,
+    get_manifest_counts,
+    iter_chunks,
+    not_framed_error,
+    parse_chunk,
+)
 from .models import GlobalIndexMeta, TableMeta
 from .output import console
-from .util import open_file_smart_mode, plural, resolve, unwrap
+from .raw import (
+    RAW_FORMAT,
+    RawResultSet,
+    decode_raw_item,
+    raw_encoder,
+    write_raw_items,
+)
+from .sample import EstimatedCount, choose_segments, estimate_count
+from .shards import MAX_SHARDS, write_manifest
+from .throttle import CapacityBudget
+from .util import (
+    open_file_smart_mode,
+    plural,
+    resolve,
+    truncate_file_smart_mode,
+    unwrap,
+)
 
 LOG = logging.getLogger(__name__)
 
+# The most segments a PARALLEL scan can be split into
+MAX_PARALLEL = 1000
+
+# The most items DynamoDB allows in one TransactWriteItems request
+MAX_TRANSACTION_ITEMS = 100
+
+# Transactions cancelled for these reasons may succeed if we try again
+RETRYABLE_TXN_REASONS = frozenset(
+    ["TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded"]
+)
+
 
 def default(value):
     """Default encoder for JSON"""
@@ -89,6 +169,40 @@ def add_query_kwargs(kwargs, visitor, constraints, index):
         kwargs["index"] = index.name
 
 
+def get_save_file(tree: Any) -> Tuple[str, str, bool]:
+    """Get the filename, format extension, and if it's compressed from a SAVE"""
+    filename = tree.save_file[0]
+    if filename[0] in ['"', "'"]:
+        filename = unwrap(filename)
+    remainder, ext = os.path.splitext(filename)
+    compressed = get_compression(filename) is not None
+    if compressed:
+        ext = os.path.splitext(remainder)[1]
+    return filename, ext.lower(), compressed
+
+
+def get_all_headers(items: List[Dict]) -> List[str]:
+    """Get the union of the keys of all items, for the header of a CSV"""
+    # Have to do this to get all the headers :(
+    all_headers: Set[str] = set()
+    for item in items:
+        all_headers.update(item.keys())
+    return list(all_headers)
+
+
+def get_cancellation_reasons(exc: TransactionCanceledException) -> List[str]:
+    """Get the reason code for each action of a cancelled transaction"""
+    if exc.exc_info is not None:
+        response = getattr(exc.exc_info[1], "response", {})
+        if "CancellationReasons" in response:
+            return [reason["Code"] for reason in response["CancellationReasons"]]
+    # The message looks like "Transaction cancelled ... [None, ConditionalCheckFailed]"
+    match = re.search(r"\[(.*)\]", exc.kwargs.get("Message", ""))
+    if match is None:
+        return []
+    return [code.strip() for code in match.group(1).split(",")]
+
+
 def iter_insert_items(tree):
     """Iterate over the items to insert from an INSERT statement"""
     if tree.list_values:
@@ -122,7 +236,8 @@ class Engine(object):
     ----------
     caution_callback : callable, optional
         Called to prompt user when a potentially dangerous action is about to
-        occur.
+        occur. It is passed the name of the action and, optionally, a message
+        describing the danger. Return True to proceed.
 
     """
 
@@ -143,9 +258,15 @@ class Engine(object):
         self._explaining = False
         self._analyzing = False
         self._query_rate_limit = None
+        self._capacity_budget = None
+        self._checkpoint = None
         self.rate_limit = None
         self._encoder = json.JSONEncoder(separators=(",", ":"), default=default)
         self.caution_callback = None
+        # The number of processes that decode the results of queries and scans
+        self.decode_workers = 0
+        self._decode_pool: Optional[futures.ProcessPoolExecutor] = None
+        self._decode_pool_workers = 0
         self._identity = None
 
     def connect(self, *args, **kwargs):
@@ -155,6 +276,31 @@ class Engine(object):
         if self._session is None:
             self._session = botocore.session.get_session()
 
+    def close(self):
+        """Shut down the processes that decode results"""
+        if self._decode_pool is not None:
+            self._decode_pool.shutdown()
+            self._decode_pool = None
+
+    def _get_decode_pool(self) -> futures.ProcessPoolExecutor:
+        """
+        Get the pool of processes that decode results
+
+        The pool is shared by every statement, so the processes only start up
+        once. It is replaced if ``decode_workers`` changes.
+
+        """
+        if (
+            self._decode_pool is not None
+            and self._decode_pool_workers != self.decode_workers
+        ):
+            self._decode_pool.shutdown(wait=False)
+            self._decode_pool = None
+        if self._decode_pool is None:
+            self._decode_pool = create_decode_pool(self.decode_workers)
+            self._decode_pool_workers = self.decode_workers
+        return self._decode_pool
+
     @property
     def region(self):
         """Get the connected dynamo region or host"""
@@ -177,11 +323,13 @@ class Engine(object):
     @connection.setter
     def connection(self, connection: DynamoDBConnection) -> None:
         """Change the dynamo connection"""
+        if self._connection is not None:
+            self._connection.unsubscribe("capacity", self._on_capacity_data)
+            self._connection.unsubscribe("precall", self._on_precall)
         if connection is not None:
             connection.subscribe("capacity", self._on_capacity_data)
+            connection.subscribe("precall", self._on_precall)
             connection.default_return_capacity = True
-        if self._connection is not None:
-            connection.unsubscribe("capacity", self._on_capacity_data)
         self._connection = connection
         self._cloudwatch_connection = None
         self.cached_descriptions = {}
@@ -208,17 +356,25 @@ class Engine(object):
         ret = result
         if statement.action in ("SELECT", "SCAN"):
             if statement.save_file:
-                filename = statement.save_file[0]
-                if filename[0] in ['"', "'"]:
-                    filename = unwrap(filename)
+                filename = get_save_file(statement)[0]
                 ret = "Saved %d record%s to %s" % (result, plural(result), filename)
+            elif isinstance(result, EstimatedCount):
+                ret = "~%d (95%% confidence: %d - %d, sampled %.3g%% of table)" % (
+                    result,
+                    result.low,
+                    result.high,
+                    100 * result.fraction,
+                )
             elif isinstance(result, Count):
                 if result.count == result.scanned_count:
                     ret = "%d" % result
                 else:
                     ret = "%d (scanned count: %d)" % (result, result.scanned_count)
         elif statement.action == "UPDATE":
-            if isinstance(result, int):
+            if statement.save_file:
+                filename = get_save_file(statement)[0]
+                ret = "Saved %d record%s to %s" % (result, plural(result), filename)
+            elif isinstance(result, int):
                 ret = "Updated %d item%s" % (result, plural(result))
         elif statement.action == "DELETE":
             ret = "Deleted %d item%s" % (result, plural(result))
@@ -334,7 +490,7 @@ class Engine(object):
 
         return table
 
-    def execute(self, commands, pretty_format=False):
+    def execute(self, commands, pretty_format=False, stream=False):
         """
         Parse and run a DQL string
 
@@ -344,21 +500,69 @@ class Engine(object):
             The DQL command string
         pretty_format : bool
             Pretty-format the return value. (e.g. 4 -> 'Updated 4 items')
+        stream : bool
+            If the last statement is an ``UPDATE ... RETURNS``, return an
+            iterator that runs the updates as it is read, instead of running
+            them all and returning a list. (default False)
 
         """
         tree = parser.parseString(commands)
         self.consumed_capacities = []
         self._analyzing = False
         self._query_rate_limit = None
-        for statement in tree:
+        self._capacity_budget = None
+        self._checkpoint = None
+        for i, statement in enumerate(tree):
             try:
                 result = self._run(statement)
+                # The items returned by an UPDATE are streamed, so nothing
+                # happens until they're read. Run it now unless the caller
+                # asked to stream the results of the last statement.
+                streamed = stream and i == len(tree) - 1
+                if not streamed and self._is_streamed_update(statement, result):
+                    result = list(result)
             except ExplainSignal:
                 return self._format_explain()
         if pretty_format:
             return self._pretty_format(tree[-1], result)
         return result
 
+    @staticmethod
+    def _is_streamed_update(statement: Any, result: Any) -> bool:
+        """Check if a statement is an UPDATE whose results haven't run yet"""
+        if statement.action == "ANALYZE":
+            statement = statement[1]
+        return statement.action == "UPDATE" and isinstance(result, types.GeneratorType)
+
+    def to_columns(self, command, dtypes=None):
+        """
+        Run a query and collect the results into NumPy arrays
+
+        This requires numpy. The items are added to the arrays as each page of
+        results is fetched.
+
+        Parameters
+        ----------
+        command : str
+            The DQL query. The last statement must return items (e.g. SELECT
+            or SCAN).
+        dtypes : dict, optional
+            Mapping of attribute name to NumPy dtype. Other attributes have
+            their dtype inferred from their first non-NULL value.
+
+        Returns
+        -------
+        columns : dict
+            Mapping of attribute name to :class:`numpy.ma.MaskedArray`, where
+            items that don't have the attribute are masked.
+
+        """
+        # Call this directly because FragmentEngine.execute works differently
+        results = Engine.execute(self, command)
+        if results is None or isinstance(results, (str, int, dict)):
+            raise EngineRuntimeError("to_columns requires a query that returns items")
+        return to_columns(results, dtypes)
+
     def _run(self, tree):
         """Run a query from a parse tree"""
         if tree.throttle:
@@ -366,6 +570,17 @@ class Engine(object):
             self._query_rate_limit = limiter
             del tree["throttle"]
             return self._run(tree)
+        if tree.max_capacity:
+            self._capacity_budget = self._parse_max_capacity(
+                tree.table, tree.max_capacity
+            )
+            del tree["max_capacity"]
+            return self._run(tree)
+        if tree.checkpoint:
+            if not self._explaining:
+                self._checkpoint = self._load_checkpoint(tree)
+            del tree["checkpoint"]
+            return self._run(tree)
         if tree.action == "SELECT":
             return self._select(tree, self.allow_select_scan)
         elif tree.action == "SCAN":
@@ -413,10 +628,33 @@ class Engine(object):
         cap = Capacity(*amount)  # pylint: disable=E1120
         return RateLimit(total=cap, callback=self._on_throttle)
 
+    def _parse_max_capacity(self, tablename: str, max_capacity: Any) -> CapacityBudget:
+        """Parse a 'max capacity' statement and return a CapacityBudget"""
+        amount: List[Optional[float]] = [None, None]
+        for i, value in enumerate(max_capacity):
+            if value != "*":
+                units = float(value)
+                if units <= 0:
+                    raise SyntaxError("MAX CAPACITY must be greater than 0")
+                amount[i] = units
+        return CapacityBudget(tablename, *amount)
+
+    def _load_checkpoint(self, tree: Any) -> Checkpoint:
+        """Load the checkpoint for a statement with a 'checkpoint' clause"""
+        filename = tree.checkpoint[0]
+        if filename[0] in ['"', "'"]:
+            filename = unwrap(filename)
+        if tree.limit:
+            raise SyntaxError("Cannot use LIMIT with CHECKPOINT")
+        return Checkpoint.load(filename, repr(tree.asList()))
+
     def _on_capacity_data(self, conn, command, kwargs, response, capacity):
         """Log the received consumed capacity data"""
         if self._analyzing:
             self.consumed_capacities.append((command, capacity))
+        budget = self._capacity_budget
+        if budget is not None and capacity.tablename == budget.tablename:
+            budget.on_capacity(capacity.total)
         if self._query_rate_limit is not None:
             self._query_rate_limit.on_capacity(
                 conn, command, kwargs, response, capacity
@@ -425,6 +663,30 @@ class Engine(object):
             self.rate_limit.callback = self._on_throttle
             self.rate_limit.on_capacity(conn, command, kwargs, response, capacity)
 
+    def _on_precall(self, conn, command, kwargs):
+        """Abort the statement before a request if it is over its MAX CAPACITY"""
+        budget = self._capacity_budget
+        if budget is None or not budget.applies_to(command, kwargs):
+            return
+        if budget.check(self._confirm_capacity):
+            return
+        last_key = kwargs.get("ExclusiveStartKey")
+        if last_key is not None:
+            last_key = conn.dynamizer.decode_keys(last_key)
+        raise CapacityExceeded(budget, last_key=last_key)
+
+    def _confirm_capacity(self):
+        """Ask the caution_callback if we should exceed the MAX CAPACITY"""
+        if not callable(self.caution_callback):
+            return False
+        budget = self._capacity_budget
+        assert budget is not None
+        msg = "Consumed %s capacity, reaching MAX CAPACITY %s." % (
+            budget.consumed,
+            budget,
+        )
+        return self.caution_callback("MAX CAPACITY", msg)  # pylint: disable=E1102
+
     def _on_throttle(self, conn, command, kwargs, response, capacity, seconds):
         """Print out a message when the query is throttled"""
         console.log(
@@ -529,9 +791,18 @@ class Engine(object):
 
         visitor = Visitor(self.reserved_words)
 
-        selection = SelectionExpression.from_selection(tree.attrs)
+        selection = SelectionExpression.from_selection(tree.attrs, tree.group_by)
         if selection.is_count:
             kwargs["select"] = "COUNT"
+        if selection.is_aggregate:
+            if tree.limit:
+                raise SyntaxError("Cannot use LIMIT with aggregate functions")
+            elif tree.save_file:
+                raise SyntaxError("Cannot use SAVE with aggregate functions")
+        elif tree.parallel and not selection.is_count:
+            raise SyntaxError(
+                "PARALLEL can only be used with COUNT(*) or aggregate functions"
+            )
 
         if tree.keys_in:
             if tree.limit:
@@ -542,6 +813,14 @@ class Engine(object):
                 raise SyntaxError("Cannot use DESC/ASC with KEYS IN")
             elif tree.where:
                 raise SyntaxError("Cannot use WHERE with KEYS IN")
+            elif self._checkpoint is not None:
+                raise SyntaxError("Cannot use CHECKPOINT with KEYS IN")
+            elif tree.shards:
+                raise SyntaxError("Cannot use SHARDS with KEYS IN")
+            elif selection.is_aggregate:
+                raise SyntaxError("Cannot use aggregate functions with KEYS IN")
+            elif tree.sample:
+                raise SyntaxError("Cannot use SAMPLE with KEYS IN")
             keys = list(self._iter_where_in(tree))
             kwargs["attributes"] = selection.build(visitor)
             kwargs["alias"] = visitor.attribute_names
@@ -596,13 +875,136 @@ class Engine(object):
             fetch_attrs_after = True
         else:
             attributes = selection.build(visitor)
+            if not attributes and selection.is_aggregate:
+                # COUNT(*) doesn't need any attributes, so only fetch the key
+                attributes = [visitor.get_field(desc.primary_key_attributes[0])]
             if attributes:
                 kwargs["attributes"] = attributes
         kwargs["expr_values"] = visitor.expression_values
         kwargs["alias"] = visitor.attribute_names
 
+        checkpoint = self._checkpoint
+        if checkpoint is not None:
+            # Checkpoints are taken as the items stream into the file, so
+            # anything that needs to read all the results first won't work
+            if fetch_attrs_after:
+                raise SyntaxError(
+                    "Cannot use CHECKPOINT when selecting attributes that are "
+                    "not projected into the index"
+                )
+            if order_by is not None and (index is None or order_by != index.range_key):
+                raise SyntaxError("Cannot use CHECKPOINT with ORDER BY")
+            if checkpoint.resumed:
+                kwargs["exclusive_start_key"] = checkpoint.last_key
+
+        # Raw items are saved without being decoded, so we can't do anything
+        # with them locally
+        raw = bool(tree.save_file) and get_save_file(tree)[1] == RAW_FORMAT
+        if raw and (
+            selection.expressions
+            or fetch_attrs_after
+            or (order_by is not None and (index is None or order_by != index.range_key))
+        ):
+            raise SyntaxError(
+                "SAVE to %s only supports SELECT * without ORDER BY" % RAW_FORMAT
+            )
+
+        if tree.shards:
+            if selection.is_count:
+                raise SyntaxError("Cannot use count(*) with SAVE")
+            elif tree.limit:
+                raise SyntaxError("Cannot use LIMIT with SHARDS")
+            elif checkpoint is not None:
+                raise SyntaxError("Cannot use CHECKPOINT with SHARDS")
+            elif fetch_attrs_after:
+                raise SyntaxError(
+                    "Cannot use SHARDS when selecting attributes that are not "
+                    "projected into the index"
+                )
+            elif order_by is not None and (
+                index is None or order_by != index.range_key
+            ):
+                raise SyntaxError("Cannot use SHARDS with ORDER BY")
+            return self._save_shards(tree, action, tablename, kwargs, selection, raw)
+
+        def order_groups(rows):
+            """Sort the results of aggregate functions"""
+            if order_by is None:
+                return rows
+            # Groups where the value is missing go last in either direction
+            rows = list(rows)
+            present = [row for row in rows if row.get(order_by) is not None]
+            missing = [row for row in rows if row.get(order_by) is None]
+            present.sort(key=lambda x: x[order_by], reverse=reverse)
+            return present + missing
+
+        if tree.sample:
+            if not selection.is_count:
+                raise SyntaxError("SAMPLE can only be used with COUNT(*)")
+            elif action != "scan":
+                raise SyntaxError("SAMPLE can only be used with a scan")
+            elif tree.parallel:
+                raise SyntaxError("Cannot use PARALLEL with SAMPLE")
+            elif tree.scan_limit:
+                raise SyntaxError("Cannot use SCAN LIMIT with SAMPLE")
+            percent = Decimal(tree.sample[0])
+            if not 0 < percent <= 100:
+                raise SyntaxError("SAMPLE must be between 0 and 100 PERCENT")
+            total_segments, segments = choose_segments(percent)
+            count = self._count_segments(
+                tablename, kwargs, total_segments, desc.item_count, segments
+            )
+            fraction = len(segments) / total_segments
+            return estimate_count(count, fraction, desc.item_count)
+
+        if tree.parallel:
+            if action != "scan":
+                raise SyntaxError("PARALLEL can only be used with a scan")
+            elif tree.scan_limit:
+                raise SyntaxError("Cannot use SCAN LIMIT with PARALLEL")
+            elif fetch_attrs_after:
+                raise SyntaxError(
+                    "Cannot use PARALLEL when selecting attributes that are not "
+                    "projected into the index"
+                )
+            num_segments = int(tree.parallel[0])
+            if not 1 <= num_segments <= MAX_PARALLEL:
+                raise SyntaxError("PARALLEL must be between 1 and %d" % MAX_PARALLEL)
+            if selection.is_count:
+                return self._count_segments(
+                    tablename, kwargs, num_segments, desc.item_count
+                )
+            result = self._aggregate_segments(
+                tablename, kwargs, selection, num_segments
+            )
+            return order_groups(result)
+
         method = getattr(self.connection, action)
         result = method(tablename, **kwargs)
+        if raw:
+            result = RawResultSet.from_result_set(result)
+
+        # Checkpoints need to know which page each item came from, so they
+        # can't read ahead
+        decode_in_pool = (
+            self.decode_workers > 0
+            and not raw
+            and not fetch_attrs_after
+            and not selection.is_count
+            and checkpoint is None
+        )
+
+        def convert(items, sanitize=False):
+            """Decode the items and select the attributes"""
+            if decode_in_pool:
+                return iter_decoded(
+                    RawResultSet.from_result_set(items),
+                    selection,
+                    sanitize,
+                    self.decode_workers,
+                    self._get_decode_pool(),
+                )
+            return (selection.convert(item, sanitize) for item in items)
 
         # If the queried index didn't project the selected attributes, we need
         # to do a BatchGetItem to fetch all the data.
@@ -618,6 +1020,11 @@ class Engine(object):
             get_kwargs["alias"] = visitor.attribute_names
             result = self.connection.batch_get(tablename, **get_kwargs)
 
+        if selection.is_aggregate:
+            aggregator = Aggregator(selection)
+            aggregator.add_all(result)
+            return order_groups(aggregator.results())
+
         def order(items):
             """Sort the items by the specified keys"""
             if order_by is None:
@@ -633,69 +1040,408 @@ class Engine(object):
             if selection.is_count:
                 raise SyntaxError("Cannot use count(*) with SAVE")
             count = 0
-            result = order(selection.convert(item, True) for item in result)
-            filename = tree.save_file[0]
-            if filename[0] in ['"', "'"]:
-                filename = unwrap(filename)
-            # If it's still an iterator, convert to a list so we can iterate
-            # multiple times.
-            if not isinstance(result, list):
-                result = list(result)
-            remainder, ext = os.path.splitext(filename)
-            is_gzip = ext.lower() in [".gz", ".gzip"]
-            if is_gzip:
-                ext = os.path.splitext(remainder)[1]
-
-            with open_file_smart_mode(filename, True) as ofile:
-                if ext.lower() == ".csv":
-                    if selection.all_keys:
-                        headers = selection.all_keys
-                    else:
-                        # Have to do this to get all the headers :(
+            pages = result
+            result = order(convert(result, True))
+            filename, ext, compressed = get_save_file(tree)
+
+            # When resuming, throw away anything written after the checkpoint
+            # and append to the file from there.
+            resuming = checkpoint is not None and checkpoint.resumed
+            base_offset = 0
+            if checkpoint is not None:
+                if ext in COLUMNAR_FORMATS:
+                    raise SyntaxError("Cannot use CHECKPOINT with SAVE to %s" % ext)
+                if ext == ".csv" and not selection.all_keys:
+                    raise SyntaxError(
+                        "Cannot use CHECKPOINT with SAVE to CSV unless the "
+                        "attributes are selected explicitly"
+                    )
+                if resuming:
+                    if not os.path.exists(filename):
+                        raise EngineRuntimeError(
+                            "Cannot resume from checkpoint %r: %r is missing"
+                            % (checkpoint.filename, filename)
+                        )
+                    truncate_file_smart_mode(filename, checkpoint.offset)
+                    count = checkpoint.processed
+                    # A compressed file appends a new member, which starts at 0
+                    if compressed:
+                        base_offset = checkpoint.offset
+
+            # Items are written as they are fetched, so if we exceed the MAX
+            # CAPACITY the file will still contain everything read so far.
+            column_types = read_types(filename) if resuming else {}
+            try:
+                with self._open_save_file(filename, ext, compressed, resuming) as ofile:
+                    headers = selection.all_keys
+                    if ext == ".csv" and not headers:
                         result = list(result)
-                        all_headers = set()
-                        for item in result:
-                            all_headers.update(item.keys())
-                        headers = list(all_headers)
-                    writer = csv.DictWriter(
-                        ofile, fieldnames=headers, extrasaction="ignore"
+                        headers = get_all_headers(result)
+                    write_item = self._item_writer(
+                        ofile, ext, headers, not resuming, column_types
                     )
-                    writer.writeheader()
+                    last_key = None if checkpoint is None else checkpoint.last_key
                     for item in result:
+                        # When a new page is fetched, everything from the
+                        # previous pages has been written
+                        if (
+                            checkpoint is not None
+                            and pages.kwargs.get("ExclusiveStartKey") is not last_key
+                        ):
+                            ofile.flush()
+                            checkpoint.save(last_key, count, base_offset + ofile.tell())
+                            last_key = pages.kwargs.get("ExclusiveStartKey")
                         count += 1
-                        writer.writerow(item)
-                elif ext.lower() == ".json":
-                    for item in result:
-                        count += 1
-                        ofile.write(self._encoder.encode(item))
-                        ofile.write("\n")
-                else:
-                    for item in result:
-                        count += 1
-                        pickle.dump(item, ofile)
+                        write_item(item)
+            except CapacityExceeded as e:
+                e.processed = count
+                raise
+            finally:
+                self._capacity_budget = None
+                if ext == ".csv":
+                    write_types(filename, column_types)
+            if checkpoint is not None:
+                checkpoint.clear()
             return count
         elif not selection.is_count:
-            result = order(selection.convert(item) for item in result)
+            result = order(convert(result))
 
         return result
 
+    def _aggregate_segments(self, tablename, kwargs, selection, segments):
+        """
+        Compute aggregate functions by scanning segments of a table in parallel
+
+        Each segment is aggregated by its own thread, and the partial results
+        are merged at the end.
+
+        """
+        stop = threading.Event()
+
+        def aggregate_segment(segment):
+            """Aggregate the items in a segment of the table"""
+            aggregator = Aggregator(selection)
+            try:
+                result = self.connection.scan(
+                    tablename, segment=segment, total_segments=segments, **kwargs
+                )
+                for item in result:
+                    if stop.is_set():
+                        break
+                    aggregator.add(item)
+            except BaseException:
+                aggregator.close()
+                raise
+            return aggregator
+
+        with futures.ThreadPoolExecutor(max_workers=segments) as executor:
+            pending = [
+                executor.submit(aggregate_segment, segment)
+                for segment in range(segments)
+            ]
+            try:
+                done, _ = futures.wait(pending, return_when=futures.FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+            except BaseException:
+                # Stop the other segments at the next item
+                stop.set()
+                futures.wait(pending)
+                for future in pending:
+                    if not future.cancelled() and future.exception() is None:
+                        future.result().close()
+                raise
+        aggregators = [future.result() for future in pending]
+        total = aggregators[0]
+        try:
+            for aggregator in aggregators[1:]:
+                total.merge(aggregator)
+                aggregator.close()
+        except BaseException:
+            for aggregator in aggregators:
+                aggregator.close()
+            raise
+        return total.results()
+
+    def _count_segments(
+        self, tablename, kwargs, total_segments, item_count, segments=None
+    ):
+        """
+        Run a COUNT(*) by scanning segments of a table in parallel
+
+        The progress is estimated from the number of items DynamoDB reports
+        for the table, which is updated about every six hours. If ``segments``
+        is provided, only those segments are scanned.
+
+        """
+        if segments is None:
+            segments = list(range(total_segments))
+        expected = item_count * len(segments) // total_segments
+        stop = threading.Event()
+
+        def on_precall(conn, command, query_kwargs):
+            """Stop the other segments before their next page"""
+            if stop.is_set() and query_kwargs.get("TotalSegments") == total_segments:
+                raise StatementInterrupted()
+
+        def on_postcall(conn, command, query_kwargs, response):
+            """Update the progress after each page"""
+            if (
+                command == "scan"
+                and query_kwargs.get("TotalSegments") == total_segments
+            ):
+                progress.update(task, advance=response.get("ScannedCount", 0))
+
+        def count_segment(segment):
+            """Count the items in a segment of the table"""
+            return self.connection.scan(
+                tablename, segment=segment, total_segments=total_segments, **kwargs
+            )
+
+        with Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TaskProgressColumn(),
+            TimeElapsedColumn(),
+            transient=True,
+        ) as progress:
+            # The item count is 0 until DynamoDB first updates it
+            task = progress.add_task("[green] Items scanned", total=expected or None)
+            with futures.ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                self.connection.subscribe("precall", on_precall)
+                self.connection.subscribe("postcall", on_postcall)
+                try:
+                    pending = [
+                        executor.submit(count_segment, segment) for segment in segments
+                    ]
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_EXCEPTION)
+                    for future in done:
+                        future.result()
+                    return sum((future.result() for future in pending), Count(0, 0))
+                except BaseException:
+                    stop.set()
+                    raise
+                finally:
+                    # Wait for the other segments to stop before unsubscribing
+                    executor.shutdown()
+                    self.connection.unsubscribe("precall", on_precall)
+                    self.connection.unsubscribe("postcall", on_postcall)
+
+    def _save_shards(self, tree, action, tablename, kwargs, selection, raw):
+        """
+        Run a SAVE with SHARDS
+
+        A scan is split into one segment per shard, and each segment is saved
+        by its own thread. The results of a query are dealt out to the shards
+        in turn. A manifest of the shards is written to the same directory.
+
+        """
+        num_shards = int(tree.shards[0])
+        if not 1 <= num_shards <= MAX_SHARDS:
+            raise SyntaxError("SHARDS must be between 1 and %d" % MAX_SHARDS)
+        pattern, ext, compressed = get_save_file(tree)
+        dirname, basename = os.path.split(pattern)
+        if "*" not in basename:
+            raise SyntaxError(
+                "SAVE with SHARDS requires a filename pattern with a '*' "
+                "(e.g. 'out/part-*.json.gz')"
+            )
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        width = max(5, len(str(num_shards - 1)))
+        filenames = [
+            os.path.join(dirname, basename.replace("*", str(i).zfill(width)))
+            for i in range(num_shards)
+        ]
+        counts = [0] * num_shards
+        column_types: List[Dict[str, str]] = [{} for _ in range(num_shards)]
+        stop = threading.Event()
+        headers = selection.all_keys
+
+        decode_pool = None
+        if self.decode_workers > 0 and not raw:
+            decode_pool = self._get_decode_pool()
+
+        def convert(result):
+            """Convert the results of a query or scan segment for saving"""
+            if decode_pool is not None:
+                return iter_decoded(
+                    RawResultSet.from_result_set(result),
+                    selection,
+                    True,
+                    self.decode_workers,
+                    decode_pool,
+                )
+            if raw:
+                result = RawResultSet.from_result_set(result)
+            return (selection.convert(item, True) for item in result)
+
+        def save_segment(shard):
+            """Scan a segment of the table into a shard"""
+            items = convert(
+                self.connection.scan(
+                    tablename, segment=shard, total_segments=num_shards, **kwargs
+                )
+            )
+            with self._open_save_file(filenames[shard], ext, compressed) as ofile:
+                shard_headers = headers
+                if ext == ".csv" and not shard_headers:
+                    items = list(items)
+                    shard_headers = get_all_headers(items)
+                write_item = self._item_writer(
+                    ofile, ext, shard_headers, column_types=column_types[shard]
+                )
+                try:
+                    for item in items:
+                        if stop.is_set():
+                            return
+                        write_item(item)
+                        counts[shard] += 1
+                finally:
+                    if ext == ".csv":
+                        write_types(filenames[shard], column_types[shard])
+
+        complete = False
+        try:
+            if action == "scan":
+                with futures.ThreadPoolExecutor(max_workers=num_shards) as executor:
+                    pending = [
+                        executor.submit(save_segment, shard)
+                        for shard in range(num_shards)
+                    ]
+                    try:
+                        for future in futures.as_completed(pending):
+                            future.result()
+                    except BaseException:
+                        # Stop the other segments at the next item
+                        stop.set()
+                        raise
+            else:
+                items = convert(self.connection.query(tablename, **kwargs))
+                if ext == ".csv" and not headers:
+                    items = list(items)
+                    headers = get_all_headers(items)
+                with contextlib.ExitStack() as stack:
+                    writers = [
+                        self._item_writer(
+                            stack.enter_context(
+                                self._open_save_file(filename, ext, compressed)
+                            ),
+                            ext,
+                            headers,
+                            column_types=shard_types,
+                        )
+                        for filename, shard_types in zip(filenames, column_types)
+                    ]
+                    try:
+                        for i, item in enumerate(items):
+                            writers[i % num_shards](item)
+                            counts[i % num_shards] += 1
+                    finally:
+                        if ext == ".csv":
+                            for filename, shard_types in zip(filenames, column_types):
+                                write_types(filename, shard_types)
+            complete = True
+        except CapacityExceeded as e:
+            e.processed = sum(counts)
+            raise
+        finally:
+            self._capacity_budget = None
+            write_manifest(dirname, basename, filenames, counts, complete)
+        return sum(counts)
+
+    def _open_save_file(self, filename, ext, compressed, append=False):
+        """Open a file for SAVE, which :meth:`~._item_writer` can write to"""
+        if ext in COLUMNAR_FORMATS:
+            if compressed:
+                raise SyntaxError(
+                    "Cannot compress %s files; they are already compressed" % ext
+                )
+            return ColumnarWriter(filename, ext)
+        elif ext not in (".csv", ".json", RAW_FORMAT):
+            return open_block_file(filename, append)
+        return open_file_smart_mode(filename, True, append)
+
+    def _item_writer(
+        self, ofile, ext, headers=None, write_header=True, column_types=None
+    ):
+        """
+        Get a function that writes items to a SAVE file
+
+        If ``column_types`` is a dict, the type of each column of a CSV is recorded
+        in it, so it can be written with :func:`~dql.csvtypes.write_types`.
+
+        """
+        if ext == ".csv":
+            writer = csv.DictWriter(ofile, fieldnames=headers, extrasaction="ignore")
+            if write_header:
+                writer.writeheader()
+            if column_types is None:
+                return writer.writerow
+
+            def write_item(item):
+                for key in headers:
+                    column_type = merge_types(
+                        column_types.get(key), value_type(item.get(key))
+                    )
+                    if column_type is not None:
+                        column_types[key] = column_type
+                writer.writerow(item)
+
+            return write_item
+        elif ext == ".json":
+
+            def write_item(item):
+                ofile.write(self._encoder.encode(item))
+                ofile.write("\n")
+
+        elif ext == RAW_FORMAT:
+
+            def write_item(item):
+                ofile.write(raw_encoder.encode(item))
+                ofile.write("\n")
+
+        else:
+            # The columnar and binary writers encode the items themselves
+            return ofile.write
+
+        return write_item
+
     def _scan(self, tree):
         """Run a SCAN statement"""
         return self._select(tree, True)
 
-    def _query_and_op(self, tree, table, method_name, method_kwargs):
+    def _query_and_op(self, tree, table, method_name, method_kwargs, batch_size=1):
         """Query the table and perform an operation on each item"""
-        result = []
+        checkpoint = self._checkpoint
+        dynamizer = self.connection.dynamizer
+        index_keys: List[str] = []
         if tree.keys_in:
             if tree.using:
                 raise SyntaxError("Cannot use USING with KEYS IN")
             keys_iterable = self._iter_where_in(tree)
+            if checkpoint is not None and checkpoint.resumed:
+                # Skip past the keys that have already been processed
+                last_key = checkpoint.last_key
+                keys_iterable = itertools.dropwhile(
+                    lambda key: dynamizer.encode_keys(key) != last_key, keys_iterable
+                )
+                next(keys_iterable, None)
         else:
             visitor = Visitor(self.reserved_words)
-            (action, kwargs, _) = self._build_query(table, tree, visitor)
+            (action, kwargs, index) = self._build_query(table, tree, visitor)
             attrs = [visitor.get_field(table.hash_key.name)]
             if table.range_key is not None:
                 attrs.append(visitor.get_field(table.range_key.name))
+            # Resuming a query on an index needs the index keys as well
+            if checkpoint is not None and index is not None:
+                for key in (index.hash_key, index.range_key):
+                    if key is not None and key not in table.primary_key_attributes:
+                        index_keys.append(key)
+                        attrs.append(visitor.get_field(key))
+            if checkpoint is not None and checkpoint.resumed:
+                kwargs["exclusive_start_key"] = checkpoint.last_key
             kwargs["attributes"] = attrs
             kwargs["expr_values"] = visitor.expression_values
             kwargs["alias"] = visitor.attribute_names
@@ -715,10 +1461,65 @@ class Engine(object):
                 except ExplainSignal:
                     keys_iterable = [{}]
 
+        results = self._iter_query_and_op(
+            table, keys_iterable, method_name, method_kwargs, index_keys, batch_size
+        )
+        if method_kwargs.get("returns", "NONE") != "NONE":
+            # Hand back the returned items as soon as each request finishes
+            return (item for item in results if item)
+        count = 0 if checkpoint is None else checkpoint.processed
+        for ret in results:
+            # Transactions return the number of items they wrote
+            count += ret if batch_size > 1 else 1
+        return count
+
+    def _transact_write(self, method_name, tablename, keys, kwargs):
+        """
+        Perform an update or delete on a group of keys in one transaction
+
+        Items that fail the condition are dropped from the transaction, and it
+        is retried with backoff if it conflicts with another write. Returns the
+        number of items written.
+
+        """
+        action = method_name.split("_")[0]
+        kwargs = dict((k, v) for k, v in kwargs.items() if k != "returns")
+        attempt = 0
+        while keys:
+            txn = self.connection.txn_write()
+            for key in keys:
+                getattr(txn, action)(tablename, key, **kwargs)
+            try:
+                txn.execute()
+                return len(keys)
+            except TransactionCanceledException as e:
+                reasons = get_cancellation_reasons(e)
+                if "ConditionalCheckFailed" in reasons:
+                    keys = [
+                        key
+                        for key, reason in zip(keys, reasons)
+                        if reason != "ConditionalCheckFailed"
+                    ]
+                    continue
+                attempt += 1
+                if attempt > self.connection.request_retries or not (
+                    RETRYABLE_TXN_REASONS.intersection(reasons)
+                ):
+                    raise
+                self.connection.exponential_sleep(attempt)
+        return 0
+
+    def _iter_query_and_op(
+        self, table, keys_iterable, method_name, method_kwargs, index_keys, batch_size
+    ):
+        """Perform an operation on each key and generate the return values"""
+        checkpoint = self._checkpoint
+        budget = self._capacity_budget
+        dynamizer = self.connection.dynamizer
         method = getattr(self.connection, method_name)
-        count = 0
-        # def run_method(key, **method_kwargs):
-        #     return method(table.name, key, **method_kwargs)
+        count = 0 if checkpoint is None else checkpoint.processed
+        # The progress bars would fight with the output of the returned items
+        streaming = method_kwargs.get("returns", "NONE") != "NONE"
 
         def take(iterable, n):
             "Return first n items of the iterable as a list."
@@ -726,6 +1527,12 @@ class Engine(object):
 
         CHUNK_SIZE = 2000
         WORKER_COUNT = 20
+        exceeded: Optional[CapacityExceeded] = None
+        interrupted = False
+        # The last key that was processed along with every key before it
+        last_key = None
+        if checkpoint is not None and checkpoint.last_key is not None:
+            last_key = dynamizer.decode_keys(checkpoint.last_key)
         with (
             Progress(
                 TextColumn("[progress.description]{task.description}"),
@@ -733,59 +1540,143 @@ class Engine(object):
                 MofNCompleteColumn(),
                 TaskProgressColumn(),
                 TimeElapsedColumn(),
+                disable=streaming,
             ) as progress,
             futures.ThreadPoolExecutor(max_workers=WORKER_COUNT) as executor,
         ):
             main_progress_bar = progress.add_task("[green] Total records processed")
-            chunk = take(keys_iterable, CHUNK_SIZE)
             chunk_progress_bar = progress.add_task("[green] Processing next batch")
+            try:
+                chunk = take(keys_iterable, CHUNK_SIZE)
+            except CapacityExceeded as e:
+                exceeded = e
+                chunk = []
+            except KeyboardInterrupt:
+                interrupted = True
+                chunk = []
 
             while len(chunk) > 0:
                 future_results = []
                 chunk_len = len(chunk)
+                chunk_start_count = count
                 progress.update(
                     chunk_progress_bar,
                     total=chunk_len,
                     completed=0,
                 )
 
-                for key in chunk:
-                    future_results.append(
-                        executor.submit(method, table.name, key, **method_kwargs)
-                    )
+                if index_keys:
+                    keys = [
+                        dict((k, v) for k, v in key.items() if k not in index_keys)
+                        for key in chunk
+                    ]
+                else:
+                    keys = chunk
+                batches = [
+                    keys[i : i + batch_size] for i in range(0, chunk_len, batch_size)
+                ]
+                for batch in batches:
+                    if batch_size > 1:
+                        future = executor.submit(
+                            self._transact_write,
+                            method_name,
+                            table.name,
+                            batch,
+                            method_kwargs,
+                        )
+                    else:
+                        future = executor.submit(
+                            method, table.name, batch[0], **method_kwargs
+                        )
+                    future_results.append(future)
+
+                # Requests that went through, and how many items they changed
+                completed = set()
+                written = {}
 
-                for f in futures.as_completed(future_results):
+                def finish(future):
+                    """Record the outcome of a finished request"""
+                    nonlocal count, exceeded
                     try:
-                        res = f.result()
+                        ret = future.result()
                     except CheckFailed:
-                        continue
-                    progress.update(chunk_progress_bar, advance=1)
-                    count += 1
-                    if res:
-                        result.append(res)
+                        completed.add(future)
+                        return False
+                    except CapacityExceeded as e:
+                        # Keep draining so the processed count is accurate
+                        exceeded = e
+                        return False
+                    num_written = ret if batch_size > 1 else 1
+                    completed.add(future)
+                    written[future] = num_written
+                    progress.update(chunk_progress_bar, advance=num_written)
+                    count += num_written
+                    return True
+
+                try:
+                    for f in futures.as_completed(future_results):
+                        if finish(f):
+                            yield f.result()
+                except KeyboardInterrupt:
+                    # Drop the queued requests and only wait for the ones that
+                    # are already in flight
+                    interrupted = True
+                    for f in future_results:
+                        f.cancel()
+                    for f in future_results:
+                        if not f.cancelled() and f not in completed:
+                            finish(f)
+                except GeneratorExit:
+                    # The caller stopped reading the results
+                    for f in future_results:
+                        f.cancel()
+                    raise
                 # spinner.update(text=f"[blue] Total Processed: {count}")
                 progress.update(
                     main_progress_bar,
                     total=count,
                     completed=count,
                 )
-                chunk = take(keys_iterable, CHUNK_SIZE)
+                if interrupted or exceeded is not None:
+                    # Requests finish out of order, so we can only resume after
+                    # the keys that were processed along with all keys before them
+                    done = 0
+                    processed = chunk_start_count
+                    for f, batch in zip(future_results, batches):
+                        if f not in completed:
+                            break
+                        done += len(batch)
+                        processed += written.get(f, 0)
+                    if done > 0:
+                        last_key = chunk[done - 1]
+                        if checkpoint is not None:
+                            checkpoint.save(dynamizer.encode_keys(last_key), processed)
+                    break
+                last_key = chunk[-1]
+                if checkpoint is not None:
+                    checkpoint.save(dynamizer.encode_keys(last_key), count)
+                try:
+                    chunk = take(keys_iterable, CHUNK_SIZE)
+                except CapacityExceeded as e:
+                    exceeded = e
+                    break
+                except KeyboardInterrupt:
+                    interrupted = True
+                    break
 
         # TODO: Change the behaviour to optionally display progress as per a Render class.
-        # Old Code
-        # for key in keys:
-        #     try:
-        #         ret = method(table.name, key, **method_kwargs)
-        #     except CheckFailed:
-        #         continue
-        #     count += 1
-        #     if ret:
-        #         result.append(ret)
-
-        if result:
-            return result
-        else:
-            return count
+
+        # The statement is done, so stop enforcing its budget
+        if self._capacity_budget is budget:
+            self._capacity_budget = None
+        if exceeded is not None:
+            exceeded.processed = count
+            exceeded.last_key = last_key
+            raise exceeded
+        if interrupted:
+            raise StatementInterrupted(count, last_key)
+        if checkpoint is not None:
+            checkpoint.clear()
 
     def _delete(self, tree):
         """Run a DELETE statement"""
@@ -817,7 +1708,52 @@ class Engine(object):
             kwargs["condition"] = tree.where.build(visitor)
         kwargs["expr_values"] = visitor.expression_values
         kwargs["alias"] = visitor.attribute_names
-        return self._query_and_op(tree, table, "update_item", kwargs)
+        if tree.save_file:
+            if kwargs["returns"] == "NONE":
+                raise SyntaxError("Must use RETURNS with SAVE")
+            elif self._checkpoint is not None:
+                raise SyntaxError("Cannot use CHECKPOINT with SAVE")
+        batch_size = 1
+        if tree.batch_transaction:
+            size = tree.batch_transaction[0]
+            if not size.isdigit() or not 2 <= int(size) <= MAX_TRANSACTION_ITEMS:
+                raise SyntaxError(
+                    "BATCH TRANSACTION size must be an integer between 2 and %d"
+                    % MAX_TRANSACTION_ITEMS
+                )
+            batch_size = int(size)
+            if tree.returns:
+                raise SyntaxError("Cannot use RETURNS with BATCH TRANSACTION")
+        result = self._query_and_op(
+            tree, table, "update_item", kwargs, batch_size=batch_size
+        )
+        if result is False:
+            # The caution_callback stopped an UPDATE without a WHERE
+            return result
+        elif not tree.save_file:
+            return result
+
+        # Write the returned items to the file as the updates finish
+        count = 0
+        filename, ext, compressed = get_save_file(tree)
+        headers = None
+        if ext == ".csv":
+            result = list(result)
+            headers = get_all_headers(result)
+        elif ext == RAW_FORMAT:
+            encode = self.connection.dynamizer.encode_keys
+            result = (encode(item) for item in result)
+        column_types: Dict[str, str] = {}
+        with self._open_save_file(filename, ext, compressed) as ofile:
+            write_item = self._item_writer(
+                ofile, ext, headers, column_types=column_types
+            )
+            for item in result:
+                count += 1
+                write_item(item)
+        if ext == ".csv":
+            write_types(filename, column_types)
+        return count
 
     def _create(self, tree):
         """Run a SELECT statement"""
@@ -1043,34 +1979,47 @@ class Engine(object):
         filename = tree.load_file[0]
         if filename[0] in ['"', "'"]:
             filename = unwrap(filename)
-        if not os.path.exists(filename):
-            raise FileNotFoundError("No such file %r" % filename)
-        remainder, ext = os.path.splitext(filename)
-        is_gzip = ext.lower() in [".gz", ".gzip"]
-        if is_gzip:
-            ext = os.path.splitext(remainder)[1]
+        filenames = expand_load_filename(filename)
+        if len(filenames) > 1:
+            return self._load_files(tree.table, filenames)
+        filename = filenames[0]
+        ext = get_load_format(filename)
+
+        if ext == RAW_FORMAT:
+            # Send the items back exactly as they were saved
+            with open_file_smart_mode(filename) as ifile:
+                return write_raw_items(
+                    self.connection, tree.table, map(decode_raw_item, ifile)
+                )
+
+        if ext not in (".csv", ".json"):
+            if is_framed_file(filename):
+                return self._load_blocks(tree.table, filename)
+            elif ext != PICKLE_FORMAT:
+                raise not_framed_error(filename)
 
         batch = self.connection.batch_write(tree.table)
         count = 0
         with batch:
             with open_file_smart_mode(filename) as ifile:
-                if ext.lower() == ".csv":
-                    reader = csv.DictReader(ifile)
-                    for row in reader:
-                        item: Dict[str, Any] = {}
-                        for k, v in row.items():
-                            try:
-                                num = Decimal(v)
-                                item[k] = num
-                            except InvalidOperation:
-                                item[k] = v
-                        batch.put(item)
-                        count += 1
-                elif ext.lower() == ".json":
+                if ext == ".csv":
+                    reader = csv.reader(ifile)
+                    header = next(reader, [])
+                    # Find the column types once, instead of for every value
+                    sample = list(itertools.islice(reader, SAMPLE_ROWS))
+                    convert = make_converter(
+                        *get_column_types(filename, header, sample)
+                    )
+                    for row in itertools.chain(sample, reader):
+                        if row:
+                            batch.put(convert(row))
+                            count += 1
+                elif ext == ".json":
                     for line in ifile:
                         batch.put(json.loads(line))
                         count += 1
                 else:
+                    # Files saved by older versions are pickled
                     try:
                         while True:
                             batch.put(pickle.load(ifile))
@@ -1079,6 +2028,145 @@ class Engine(object):
                         pass
         return count
 
+    def _load_files(self, tablename, filenames):
+        """
+        LOAD many files at once
+
+        Each file is read and split into chunks by a reader thread. The chunks
+        are parsed in a process pool, and the items are written by a pool of
+        writer threads.
+
+        """
+        READER_COUNT = 4
+        WRITER_COUNT = 16
+        # The number of chunks of each file that can be parsing or writing
+        MAX_PENDING = 4
+        expected = get_manifest_counts(filenames)
+        stop = threading.Event()
+
+        def write_items(kind, items):
+            """Write a chunk of parsed items to the table"""
+            if kind == RAW_FORMAT:
+                return write_raw_items(self.connection, tablename, items)
+            with self.connection.batch_write(tablename) as batch:
+                for item in items:
+                    batch.put(item)
+            return len(items)
+
+        def load_file(filename, task):
+            """Read, parse, and write one file"""
+            count = 0
+            parsing: Deque[Tuple[str, futures.Future]] = deque()
+            writing: Deque[futures.Future] = deque()
+
+            def write_next():
+                """Write the next chunk once it has been parsed"""
+                kind, parsed = parsing.popleft()
+                writing.append(writers.submit(write_items, kind, parsed.result()))
+
+            def finish_next():
+                """Wait for the next chunk to be written"""
+                nonlocal count
+                count += writing.popleft().result()
+                progress.update(task, completed=count)
+
+            for kind, data in iter_chunks(filename):
+                if stop.is_set():
+                    break
+                if kind == "items":
+                    # Pickled items have already been parsed
+                    parsed: futures.Future = futures.Future()
+                    parsed.set_result(data)
+                else:
+                    parsed = parsers.submit(parse_chunk, kind, data)
+                parsing.append((kind, parsed))
+                if len(parsing) > MAX_PENDING:
+                    write_next()
+                if len(writing) > MAX_PENDING:
+                    finish_next()
+            while parsing:
+                write_next()
+            while writing:
+                finish_next()
+            return count
+
+        total = 0
+        with contextlib.ExitStack() as stack:
+            progress = stack.enter_context(
+                Progress(
+                    TextColumn("[progress.description]{task.description}"),
+                    BarColumn(),
+                    MofNCompleteColumn(),
+                    TaskProgressColumn(),
+                    TimeElapsedColumn(),
+                )
+            )
+            parsers = stack.enter_context(
+                futures.ProcessPoolExecutor(
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            )
+            writers = stack.enter_context(
+                futures.ThreadPoolExecutor(max_workers=WRITER_COUNT)
+            )
+            readers = stack.enter_context(
+                futures.ThreadPoolExecutor(max_workers=READER_COUNT)
+            )
+            pending = [
+                readers.submit(
+                    load_file,
+                    filename,
+                    progress.add_task(
+                        os.path.basename(filename), total=expected[filename]
+                    ),
+                )
+                for filename in filenames
+            ]
+            try:
+                for future in pending:
+                    total += future.result()
+            except BaseException:
+                # Stop the other files after their current chunk
+                stop.set()
+                for future in pending:
+                    future.cancel()
+                raise
+        return total
+
+    def _load_blocks(self, tablename, filename):
+        """Write the blocks of a binary SAVE file to a table in parallel"""
+        WORKER_COUNT = 8
+
+        def write_block(payload):
+            """Decode a block and write the items"""
+            with self.connection.batch_write(tablename) as batch:
+                for item in decode_block(payload):
+                    batch.put(item)
+
+        count = 0
+        with iter_block_payloads(filename) as blocks, futures.ThreadPoolExecutor(
+            max_workers=WORKER_COUNT
+        ) as executor:
+            # Only read a few blocks ahead of the writers
+            pending: Set[futures.Future] = set()
+            try:
+                for payload, block_count in blocks:
+                    if len(pending) >= 2 * WORKER_COUNT:
+                        done, pending = futures.wait(
+                            pending, return_when=futures.FIRST_COMPLETED
+                        )
+                        for future in done:
+                            future.result()
+                    pending.add(executor.submit(write_block, payload))
+                    count += block_count
+                for future in futures.as_completed(pending):
+                    future.result()
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        return count
+
 
 class FragmentEngine(Engine):
     """
@@ -1100,13 +2188,14 @@ class FragmentEngine(Engine):
         """Clear any query fragments from the engine"""
         self.fragments = ""
 
-    def execute(self, fragment, pretty_format=True):
+    def execute(self, fragment, pretty_format=True, stream=True):
         """
         Run or aggregate a query fragment
 
         Concat the fragment to any stored fragments. If they form a complete
         query, run it and return the result. If not, store them and return
-        None.
+        None. The results of an ``UPDATE ... RETURNS`` are streamed by
+        default, so they can be displayed as the updates run.
 
         """
         self.fragments = (self.fragments + "\n" + fragment).lstrip()
@@ -1117,7 +2206,9 @@ class FragmentEngine(Engine):
         else:
             self.last_query = self.fragments.strip()
             self.fragments = ""
-            return super(FragmentEngine, self).execute(self.last_query, pretty_format)
+            return super(FragmentEngine, self).execute(
+                self.last_query, pretty_format, stream
+            )
         return None
 
     def pformat_exc(self, exc):
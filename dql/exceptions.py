@@ -1,5 +1,7 @@
 """ Custom exceptions """
 
+from .util import plural
+
 
 class ExplainSignal(Exception):
     """Thrown to stop a query when we're doing an EXPLAIN"""
@@ -7,3 +9,57 @@ class ExplainSignal(Exception):
 
 class EngineRuntimeError(RuntimeError):
     """Issue with the DQL engine at runtime"""
+
+
+class StatementInterrupted(EngineRuntimeError):
+    """
+    Raised when a statement is stopped partway through (e.g. with Ctrl-C)
+
+    Attributes
+    ----------
+    processed : int, optional
+        The number of items that were returned, saved, or modified
+    last_key : dict, optional
+        The last key that was evaluated. Resume from this key to pick up where
+        the statement left off.
+
+    """
+
+    def __init__(self, processed=None, last_key=None):
+        super(StatementInterrupted, self).__init__()
+        self.processed = processed
+        self.last_key = last_key
+
+    def _summary(self):
+        """The first line of the error message"""
+        return "Statement interrupted"
+
+    def __str__(self):
+        msg = self._summary()
+        if self.processed is not None:
+            msg += "\nProcessed %d item%s" % (self.processed, plural(self.processed))
+        if self.last_key is not None:
+            msg += "\nResume key: %r" % (self.last_key,)
+        return msg
+
+
+class CapacityExceeded(StatementInterrupted):
+    """
+    Raised when a statement consumes more than its MAX CAPACITY budget
+
+    Attributes
+    ----------
+    budget : :class:`dql.throttle.CapacityBudget`
+        The budget (and consumed capacity) of the statement
+
+    """
+
+    def __init__(self, budget, processed=None, last_key=None):
+        super(CapacityExceeded, self).__init__(processed, last_key)
+        self.budget = budget
+
+    def _summary(self):
+        return "Consumed %s capacity, exceeding MAX CAPACITY %s" % (
+            self.budget.consumed,
+            self.budget,
+        )
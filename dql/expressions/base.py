@@ -1,10 +1,12 @@
 """ Common utilities for all expressions """
 
 import re
+from typing import List, Tuple, Union
 
 from .visitor import dummy_visitor
 
 PATH_PATTERN = re.compile(r"\w+|\[(\d+)\]")
+NAME_PATTERN = re.compile(r"\w+")
 
 
 class Expression(object):
@@ -46,6 +48,36 @@ class Field(Expression):
             return None
         return item
 
+    def compile(self):
+        """Create a function that does the same thing as :meth:`~.evaluate`"""
+        if NAME_PATTERN.fullmatch(self.field):
+            name = self.field
+            return lambda item: item.get(name)
+        # Parse the path once instead of for every item
+        steps: List[Tuple[bool, Union[int, str]]] = []
+        for match in PATH_PATTERN.finditer(self.field):
+            if match.group(1) is not None:
+                steps.append((True, int(match.group(1))))
+            else:
+                steps.append((False, match.group(0)))
+
+        def evaluate(item):
+            """Pull the field off the item"""
+            try:
+                for is_index, key in steps:
+                    if is_index:
+                        try:
+                            item = item[key]
+                        except IndexError:
+                            item = item[0]
+                    else:
+                        item = item.get(key)
+            except (IndexError, TypeError, AttributeError):
+                return None
+            return item
+
+        return evaluate
+
     def __hash__(self):
         return hash(self.field)
 
@@ -66,6 +98,11 @@ class Value(Expression):
         """Values evaluate to themselves regardless of the item"""
         return self.value
 
+    def compile(self):
+        """Create a function that does the same thing as :meth:`~.evaluate`"""
+        value = self.value
+        return lambda item: value
+
     def __hash__(self):
         return hash(self.value)
 
@@ -2,6 +2,8 @@
 
 from collections import OrderedDict
 from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
 from typing import Any, Dict, List
 
 from dateutil.parser import parse
@@ -9,7 +11,7 @@ from dateutil.tz import tzlocal, tzutc
 
 from dql.util import resolve
 
-from .base import Expression, Field, Value
+from .base import NAME_PATTERN, Expression, Field, Value
 from .visitor import dummy_visitor
 
 
@@ -63,6 +65,19 @@ def div(a, b):
 
 OP_MAP = {"+": add, "-": sub, "*": mul, "/": div}
 
+# The number of parsed strings each TIMESTAMP() remembers
+TIMESTAMP_CACHE_SIZE = 4096
+
+
+def parse_timestamp(value):
+    """Parse a datetime, with a fast path for ISO 8601 strings"""
+    try:
+        if value.endswith("Z"):
+            return datetime.fromisoformat(value[:-1] + "+00:00")
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parse(value)
+
 
 def parse_expression(clause):
     """For a clause that could be a field, value, or expression"""
@@ -82,42 +97,101 @@ def parse_expression(clause):
 class SelectionExpression(Expression):
     """Entry point for Selection expressions"""
 
-    def __init__(self, expressions, is_count=False):
+    def __init__(self, expressions, is_count=False, group_by=None):
         self.expressions = expressions
         self.is_count = is_count
+        self.group_by = list(group_by or [])
         self._all_fields = None
+        self._convert = None
+
+    def __getstate__(self):
+        # The compiled function can't be pickled
+        state = self.__dict__.copy()
+        state["_convert"] = None
+        return state
 
     def convert(self, item, sanitize=False):
         """Convert an item into an OrderedDict with the selected fields"""
         if not self.expressions:
             return item
-        ret: Dict[str, Any] = OrderedDict()
-        for expr in self.expressions:
-            expr.populate(item, ret, sanitize)
-        return ret
+        if self._convert is None:
+            self._convert = self.compile()
+        return self._convert(item, sanitize)
+
+    def compile(self):
+        """
+        Create a function that converts items like :meth:`~.convert`
+
+        The tree of expressions is only walked once, instead of for every
+        item.
+
+        """
+        keys = [expr.key for expr in self.expressions]
+        names = [expr.field_name for expr in self.expressions]
+        if None not in names:
+            # Every expression is a plain field, so just look them up
+            def convert_fields(item, sanitize=False):
+                """Select the fields from an item"""
+                return OrderedDict(zip(keys, map(item.get, names)))
+
+            return convert_fields
+
+        columns = [
+            (key, expr.expr.compile()) for key, expr in zip(keys, self.expressions)
+        ]
+
+        def convert(item, sanitize=False):
+            """Evaluate the expressions for an item"""
+            ret: Dict[str, Any] = OrderedDict()
+            for key, evaluate in columns:
+                value = evaluate(item)
+                if sanitize and isinstance(value, TypeError):
+                    continue
+                ret[key] = value
+            return ret
+
+        return convert
 
     @classmethod
-    def from_selection(cls, selection):
+    def from_selection(cls, selection, group_by=None):
         """Factory for creating a Selection expression"""
         expressions: List[Expression] = []
         # Have to special case the '*' and 'COUNT(*)' selections
         if selection[0] == "*":
+            if group_by:
+                raise SyntaxError("Cannot use GROUP BY with SELECT *")
             return cls(expressions)
         elif selection[0] == "COUNT(*)":
-            return cls(expressions, True)
+            if not group_by:
+                return cls(expressions, True)
+            # Count the items in each group
+            expressions = [
+                NamedExpression(AttributeSelection(Field(field))) for field in group_by
+            ]
+            expressions.append(AggregateFunction("COUNT"))
+            return cls(expressions, group_by=group_by)
         for attr in selection:
             name = attr.getName()
             if name == "selection":
                 expr = NamedExpression.from_statement(attr)
+            elif name == "aggregate":
+                expr = AggregateFunction.from_statement(attr)
             else:
                 raise SyntaxError("Unknown selection name: %r for %s" % (name, attr))
             expressions.append(expr)
-        return cls(expressions)
+        ret = cls(expressions, group_by=group_by)
+        if group_by and not ret.is_aggregate:
+            raise SyntaxError(
+                "GROUP BY requires an aggregate function, like COUNT(*) or SUM(foo)"
+            )
+        return ret
 
     def build(self, visitor):
         fields = set()
         for expr in self.expressions:
             fields.update(expr.build(visitor))
+        for field in self.group_by:
+            fields.add(visitor.get_field(field))
         if self.is_count:
             return set()
         elif fields:
@@ -137,6 +211,11 @@ class SelectionExpression(Expression):
         """The keys, in order, that are selected by the statement"""
         return [e.key for e in self.expressions]
 
+    @property
+    def is_aggregate(self):
+        """True if this selects aggregate functions, like SUM(foo)"""
+        return any(isinstance(e, AggregateFunction) for e in self.expressions)
+
     def __str__(self):
         return " ".join(str(e) for e in self.expressions)
 
@@ -164,6 +243,17 @@ class NamedExpression(Expression):
         else:
             return str(self.expr)
 
+    @property
+    def field_name(self):
+        """The name of the field, if this only selects a top-level field"""
+        if (
+            self.expr.expr2 is None
+            and isinstance(self.expr.expr1, Field)
+            and NAME_PATTERN.fullmatch(self.expr.expr1.field)
+        ):
+            return self.expr.expr1.field
+        return None
+
     def populate(self, item, ret, sanitize):
         """Evaluate the child expression and put result into return value"""
         value = self.expr.evaluate(item)
@@ -181,6 +271,65 @@ class NamedExpression(Expression):
         return base
 
 
+class AggregateFunction(Expression):
+    """
+    A function that is computed over all of the items, like SUM(foo)
+
+    See :class:`~dql.aggregate.Aggregator`
+
+    """
+
+    def __init__(self, name, expr=None, alias=None, args=()):
+        self.name = name
+        # This is None for COUNT(*)
+        self.expr = expr
+        self.alias = alias
+        # Constant arguments, like the percentile of APPROX_PERCENTILE
+        self.args = tuple(args)
+
+    @classmethod
+    def from_statement(cls, statement):
+        """Parse the aggregate function and alias from a statement"""
+        alias = None
+        if statement.alias:
+            alias = statement.alias[0]
+        name, arg = statement[0][:2]
+        args = [Decimal(a) for a in statement[0][2:]]
+        if name == "APPROX_PERCENTILE":
+            if len(args) != 1 or not 0 <= args[0] <= 1:
+                raise SyntaxError(
+                    "APPROX_PERCENTILE requires a percentile between 0 and 1, "
+                    "like APPROX_PERCENTILE(foo, 0.99)"
+                )
+        elif args:
+            raise SyntaxError("%s takes only one argument" % name)
+        if arg == "*":
+            if name != "COUNT":
+                raise SyntaxError("%s(*) is not supported" % name)
+            return cls(name, None, alias)
+        return cls(name, AttributeSelection.from_statement(arg), alias, args)
+
+    @property
+    def key(self):
+        """The name that this will occupy in the final result dict"""
+        if self.alias:
+            return self.alias
+        return str(self)
+
+    def build(self, visitor):
+        if self.expr is None:
+            return set()
+        return self.expr.build(visitor)
+
+    def __str__(self):
+        args = ["*" if self.expr is None else str(self.expr)]
+        args.extend(str(arg) for arg in self.args)
+        base = "%s(%s)" % (self.name, ", ".join(args))
+        if self.alias is not None:
+            base += " AS " + self.alias
+        return base
+
+
 class AttributeSelection(Expression):
     """A tree of select expressions"""
 
@@ -233,6 +382,23 @@ class AttributeSelection(Expression):
         except TypeError as e:
             return e
 
+    def compile(self):
+        """Create a function that does the same thing as :meth:`~.evaluate`"""
+        if self.expr2 is None:
+            return self.expr1.compile()
+        evaluate1, evaluate2 = self.expr1.compile(), self.expr2.compile()
+        op = OP_MAP[self.op]
+
+        def evaluate(item):
+            """Evaluate this expression for a partiular item"""
+            v1, v2 = evaluate1(item), evaluate2(item)
+            try:
+                return op(v1, v2)
+            except TypeError as e:
+                return e
+
+        return evaluate
+
     def __str__(self):
         if self.expr2 is None:
             return str(self.expr1)
@@ -256,6 +422,10 @@ class SelectFunction(Expression):
         """Evaluate this expression for a partiular item"""
         raise NotImplementedError
 
+    def compile(self):
+        """Create a function that does the same thing as :meth:`~.evaluate`"""
+        return self.evaluate
+
 
 class NowFunction(SelectFunction):
     """Function to grab the current time"""
@@ -289,6 +459,8 @@ class TimestampFunction(SelectFunction):
     def __init__(self, expr, utc):
         self.expr = expr
         self.utc = utc
+        # Looking up the local timezone is slow, so only do it once
+        self.tz = tzutc() if utc else tzlocal()
 
     @classmethod
     def from_statement(cls, statement):
@@ -306,25 +478,35 @@ class TimestampFunction(SelectFunction):
     def build(self, visitor):
         return self.expr.build(visitor)
 
-    def evaluate(self, item):
-        base_value = self.expr.evaluate(item)
+    def _parse(self, value):
+        """Parse a string as a datetime"""
+        return parse_timestamp(value).replace(tzinfo=self.tz)
+
+    def _to_datetime(self, base_value, parse_string):
+        """Convert a string or number into a datetime"""
         if base_value is None:
             return None
         elif isinstance(base_value, str):
-            dt = parse(base_value)
-        else:
-            base_value = float(base_value)
-            if self.utc:
-                meth = datetime.utcfromtimestamp
-            else:
-                meth = datetime.fromtimestamp
-            try:
-                dt = meth(base_value)
-            except ValueError:
-                dt = meth(base_value / 1000)
-            except TypeError as e:
-                return e
+            return parse_string(base_value)
+        base_value = float(base_value)
         if self.utc:
-            return dt.replace(tzinfo=tzutc())
+            meth = datetime.utcfromtimestamp
         else:
-            return dt.replace(tzinfo=tzlocal())
+            meth = datetime.fromtimestamp
+        try:
+            dt = meth(base_value)
+        except ValueError:
+            dt = meth(base_value / 1000)
+        except TypeError as e:
+            return e
+        return dt.replace(tzinfo=self.tz)
+
+    def evaluate(self, item):
+        return self._to_datetime(self.expr.evaluate(item), self._parse)
+
+    def compile(self):
+        evaluate = self.expr.compile()
+        # Timestamps are often repeated, so remember the most recent ones
+        parse_string = lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)(self._parse)
+        to_datetime = self._to_datetime
+        return lambda item: to_datetime(evaluate(item), parse_string)
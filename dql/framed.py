@@ -0,0 +1,410 @@
+"""
+Compact binary format for SAVE and LOAD
+
+A file starts with :data:`MAGIC` and is followed by a sequence of blocks::
+
+    b"K" <payload size: uint32> <record count: uint32> <payload>
+
+The payload is the records of the block, each prefixed with its length as a
+uint32. Each record is an item, encoded as a tagged value (see
+:func:`encode_item`). When the file is closed, an index of the blocks is
+written at the end::
+
+    b"X" <block count: uint32> (<offset: uint64> <size: uint32> <count: uint32>)*
+    <index offset: uint64> b"DQLX"
+
+The index lets a reader memory-map the file and decode the blocks
+independently. If it is missing (e.g. the SAVE was killed), the blocks can
+still be read one after the other.
+
+"""
+
+import contextlib
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from dynamo3 import Binary
+
+from .compress import get_compression
+from .exceptions import EngineRuntimeError
+from .util import open_file_smart_mode
+
+MAGIC = b"DQLB\x01"
+END_MAGIC = b"DQLX"
+BLOCK = b"K"
+INDEX = b"X"
+
+# Size of the encoded items in a block before it is written
+BLOCK_SIZE = 1 << 20
+
+_length = struct.Struct("<I")
+_block_header = struct.Struct("<II")
+_index_entry = struct.Struct("<QII")
+_trailer = struct.Struct("<Q4s")
+_unpack_length = _length.unpack_from
+
+# The tags, as they are read from the bytes
+_STR, _NUMBER, _BINARY, _MAP, _LIST, _TRUE, _FALSE, _NULL, _DATETIME = b"snbmltf0d"
+_SET_TAGS = b"SNB"
+
+
+def _encode_bytes(tag: bytes, data: bytes, out: bytearray) -> None:
+    out += tag
+    out += _length.pack(len(data))
+    out += data
+
+
+def _encode_str(value: str, out: bytearray) -> None:
+    _encode_bytes(b"s", value.encode("utf-8"), out)
+
+
+def _encode_number(value: Any, out: bytearray) -> None:
+    _encode_bytes(b"n", str(value).encode("ascii"), out)
+
+
+def _encode_binary(value: Any, out: bytearray) -> None:
+    _encode_bytes(b"b", value.value if isinstance(value, Binary) else value, out)
+
+
+def _encode_set(value: Any, out: bytearray) -> None:
+    if not value:
+        # Dynamo doesn't allow empty sets, but they can be selected
+        out += b"S"
+        out += _length.pack(0)
+        return
+    first = next(iter(value))
+    if isinstance(first, str):
+        out += b"S"
+        encode = _encode_str
+    elif isinstance(first, (Binary, bytes)):
+        out += b"B"
+        encode = _encode_binary
+    else:
+        out += b"N"
+        encode = _encode_number
+    out += _length.pack(len(value))
+    for elem in value:
+        # The tag of each element is redundant, but it keeps decoding simple
+        encode(elem, out)
+
+
+def _encode_list(value: Any, out: bytearray) -> None:
+    out += b"l"
+    out += _length.pack(len(value))
+    for elem in value:
+        _encode_value(elem, out)
+
+
+def _encode_map(value: Any, out: bytearray) -> None:
+    out += b"m"
+    out += _length.pack(len(value))
+    for key, elem in value.items():
+        data = key.encode("utf-8")
+        out += _length.pack(len(data))
+        out += data
+        _encode_value(elem, out)
+
+
+_ENCODERS: Dict[type, Callable[[Any, bytearray], None]] = {
+    str: _encode_str,
+    Decimal: _encode_number,
+    int: _encode_number,
+    float: _encode_number,
+    Binary: _encode_binary,
+    bytes: _encode_binary,
+    set: _encode_set,
+    frozenset: _encode_set,
+    list: _encode_list,
+    tuple: _encode_list,
+    dict: _encode_map,
+    OrderedDict: _encode_map,
+    bool: lambda value, out: out.extend(b"t" if value else b"f"),
+    type(None): lambda value, out: out.extend(b"0"),
+    datetime: lambda value, out: _encode_bytes(
+        b"d", value.isoformat().encode("ascii"), out
+    ),
+}
+
+
+def _encode_value(value: Any, out: bytearray) -> None:
+    """Append a tagged value to a buffer"""
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        raise EngineRuntimeError(
+            "Cannot save %s value %r" % (type(value).__name__, value)
+        )
+    encoder(value, out)
+
+
+def encode_item(item: Dict[str, Any]) -> bytes:
+    """Encode an item as a record"""
+    out = bytearray()
+    _encode_map(item, out)
+    return bytes(out)
+
+
+def _decode_value(data: bytes, pos: int) -> Tuple[Any, int]:
+    """Decode the tagged value at a position, and return the next position"""
+    tag = data[pos]
+    if tag == _TRUE:
+        return True, pos + 1
+    elif tag == _FALSE:
+        return False, pos + 1
+    elif tag == _NULL:
+        return None, pos + 1
+    (length,) = _unpack_length(data, pos + 1)
+    pos += 5
+    end = pos + length
+    if tag == _STR:
+        return data[pos:end].decode("utf-8"), end
+    elif tag == _NUMBER:
+        return Decimal(data[pos:end].decode("ascii")), end
+    elif tag == _MAP:
+        return _decode_map(data, pos, length)
+    elif tag == _BINARY:
+        return Binary(data[pos:end]), end
+    elif tag == _LIST:
+        values = []
+        for _ in range(length):
+            value, pos = _decode_value(data, pos)
+            values.append(value)
+        return values, pos
+    elif tag in _SET_TAGS:
+        elems = set()
+        for _ in range(length):
+            value, pos = _decode_value(data, pos)
+            elems.add(value)
+        return elems, pos
+    elif tag == _DATETIME:
+        return datetime.fromisoformat(data[pos:end].decode("ascii")), end
+    raise EngineRuntimeError("Corrupt record: unknown tag %r" % chr(tag))
+
+
+def _decode_map(data: bytes, pos: int, length: int) -> Tuple[Dict[str, Any], int]:
+    """Decode the keys and values of a map"""
+    ret = {}
+    for _ in range(length):
+        (key_len,) = _unpack_length(data, pos)
+        pos += 4
+        key = data[pos : pos + key_len].decode("utf-8")
+        pos += key_len
+        # Inline the most common types
+        tag = data[pos]
+        if tag == _STR or tag == _NUMBER:
+            (value_len,) = _unpack_length(data, pos + 1)
+            pos += 5
+            value = data[pos : pos + value_len].decode("utf-8")
+            pos += value_len
+            ret[key] = value if tag == _STR else Decimal(value)
+        else:
+            ret[key], pos = _decode_value(data, pos)
+    return ret, pos
+
+
+def decode_block(data: bytes) -> List[Dict[str, Any]]:
+    """Decode the payload of a block into a list of items"""
+    items = []
+    pos = 0
+    while pos < len(data):
+        (length,) = _unpack_length(data, pos)
+        pos += 4
+        items.append(_decode_value(data, pos)[0])
+        pos += length
+    return items
+
+
+def encode_block(items: List[Dict[str, Any]]) -> bytes:
+    """Encode items as the payload of a block"""
+    out = bytearray()
+    for item in items:
+        record = encode_item(item)
+        out += _length.pack(len(record))
+        out += record
+    return bytes(out)
+
+
+class BlockWriter(object):
+    """
+    Writes items to a file in the framed binary format
+
+    Items are buffered and written out as a block once they reach
+    :data:`BLOCK_SIZE`. Encoded blocks can also be written directly with
+    :meth:`~.write_block`, which is safe to call from multiple threads.
+
+    Parameters
+    ----------
+    ofile : file
+        The binary file to write to
+    blocks : list, optional
+        The index entries of the blocks that are already in the file, if
+        appending. If None, the file header will be written.
+    offset : int, optional
+        The position of the end of the existing blocks, if appending
+
+    """
+
+    def __init__(
+        self,
+        ofile: BinaryIO,
+        blocks: Optional[List[Tuple[int, int, int]]] = None,
+        offset: int = 0,
+    ):
+        self._ofile = ofile
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._buffered = 0
+        if blocks is None:
+            ofile.write(MAGIC)
+            offset = len(MAGIC)
+            blocks = []
+        self._blocks = blocks
+        self._offset = offset
+
+    def write(self, item: Dict[str, Any]) -> None:
+        """Write an item to the file"""
+        record = encode_item(item)
+        self._buffer += _length.pack(len(record))
+        self._buffer += record
+        self._buffered += 1
+        if len(self._buffer) >= BLOCK_SIZE:
+            self._write_buffer()
+
+    def write_block(self, payload: bytes, count: int) -> None:
+        """Write an encoded block of items (see :func:`~.encode_block`)"""
+        with self._lock:
+            self._ofile.write(BLOCK + _block_header.pack(len(payload), count))
+            self._ofile.write(payload)
+            self._blocks.append((self._offset, len(payload), count))
+            self._offset += 1 + _block_header.size + len(payload)
+
+    def _write_buffer(self):
+        """Write the buffered items as a block"""
+        if self._buffered:
+            self.write_block(bytes(self._buffer), self._buffered)
+            self._buffer = bytearray()
+            self._buffered = 0
+
+    def flush(self):
+        """End the current block and flush the file"""
+        self._write_buffer()
+        self._ofile.flush()
+
+    def tell(self) -> int:
+        """The position in the underlying file"""
+        return self._ofile.tell()
+
+    def close(self):
+        """Write the remaining items and the block index"""
+        self._write_buffer()
+        index = bytearray(INDEX + _length.pack(len(self._blocks)))
+        for entry in self._blocks:
+            index += _index_entry.pack(*entry)
+        index += _trailer.pack(self._offset, END_MAGIC)
+        self._ofile.write(index)
+
+
+def _read_blocks(ifile: BinaryIO) -> Iterator[Tuple[int, bytes, int]]:
+    """Read the (offset, payload, count) of each block from the start of a file"""
+    if ifile.read(len(MAGIC)) != MAGIC:
+        raise EngineRuntimeError("Not a DQL binary file")
+    offset = len(MAGIC)
+    while True:
+        kind = ifile.read(1)
+        if kind != BLOCK:
+            # Either the index or the end of the file
+            return
+        header = ifile.read(_block_header.size)
+        if len(header) < _block_header.size:
+            return
+        size, count = _block_header.unpack(header)
+        payload = ifile.read(size)
+        if len(payload) < size:
+            # The last block was only partially written
+            return
+        yield offset, payload, count
+        offset += 1 + _block_header.size + size
+
+
+def is_framed_file(filename: str) -> bool:
+    """Check if a file was written in the framed binary format"""
+    with open_file_smart_mode(filename) as ifile:
+        return ifile.read(len(MAGIC)) == MAGIC
+
+
+def _read_index(data: Any) -> Optional[List[Tuple[int, int, int]]]:
+    """Read the block index from the end of a memory-mapped file"""
+    if len(data) < len(MAGIC) + _trailer.size or data[-4:] != END_MAGIC:
+        return None
+    index_offset, _ = _trailer.unpack_from(data, len(data) - _trailer.size)
+    if data[index_offset : index_offset + 1] != INDEX:
+        return None
+    (num_blocks,) = _length.unpack_from(data, index_offset + 1)
+    start = index_offset + 5
+    return [
+        _index_entry.unpack_from(data, start + i * _index_entry.size)
+        for i in range(num_blocks)
+    ]
+
+
+@contextlib.contextmanager
+def iter_block_payloads(filename: str) -> Iterator[Iterator[Tuple[bytes, int]]]:
+    """
+    Open a file and iterate over the (payload, count) of each block
+
+    If the file isn't compressed and has an index, it is memory-mapped and each
+    block is only read when its payload is requested.
+
+    """
+    if get_compression(filename) is not None:
+        with open_file_smart_mode(filename) as ifile:  # pylint: disable=W0135
+            yield ((payload, count) for _, payload, count in _read_blocks(ifile))
+        return
+    with open(filename, "rb") as ifile:
+        with mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[: len(MAGIC)] != MAGIC:
+                raise EngineRuntimeError("Not a DQL binary file")
+            index = _read_index(data)
+            if index is None:
+                # No index, so read the blocks in order
+                blocks = ((payload, count) for _, payload, count in _read_blocks(ifile))
+                yield blocks
+                return
+            header = 1 + _block_header.size
+            yield (
+                (data[offset + header : offset + header + size], count)
+                for offset, size, count in index
+            )
+
+
+@contextlib.contextmanager
+def open_block_file(filename: str, append: bool = False) -> Iterator[BlockWriter]:
+    """
+    Open a file for writing in the framed binary format
+
+    When appending, the file must have been truncated to the end of a block
+    (as a checkpoint does). The index of the existing blocks is rebuilt from
+    the file.
+
+    """
+    blocks = None
+    offset = 0
+    if append:
+        with open_file_smart_mode(filename) as ifile:  # pylint: disable=W0135
+            # If the file is empty, it still needs a header
+            if ifile.peek(1):
+                blocks = []
+                offset = len(MAGIC)
+                for block_offset, payload, count in _read_blocks(ifile):
+                    blocks.append((block_offset, len(payload), count))
+                    offset = block_offset + 1 + _block_header.size + len(payload)
+    with open_file_smart_mode(filename, True, append) as ofile:  # pylint: disable=W0135
+        writer = BlockWriter(ofile, blocks, offset)
+        try:
+            yield writer
+        finally:
+            writer.close()
@@ -67,6 +67,16 @@ def create_throttle():
     ).setResultsName("throttle")
 
 
+def create_max_capacity():
+    """Create a MAX CAPACITY statement"""
+    capacity_amount = Keyword("*") | number
+    return Group(
+        Suppress(upkey("max") + upkey("capacity"))
+        + capacity_amount
+        + Optional(Suppress(",") + capacity_amount)
+    ).setResultsName("max_capacity")
+
+
 # pylint: disable=W0104,W0106
 
 
@@ -76,7 +86,6 @@ def _query(cmd):
     consist = upkey("consistent").setResultsName("consistent")
     order_by = (Suppress(upkey("order") + upkey("by")) + var).setResultsName("order_by")
     ordering = (upkey("desc") | upkey("asc")).setResultsName("order")
-    save = (Suppress(upkey("save")) + filename).setResultsName("save_file")
 
     return (
         action
@@ -86,12 +95,16 @@ def _query(cmd):
         + table
         + Optional(keys_in | where)
         + Optional(using)
+        + Optional(group_by)
         + Optional(limit)
         + Optional(scan_limit)
         + Optional(order_by)
         + Optional(ordering)
+        + Optional(parallel)
+        + Optional(sample)
         + Optional(throttle)
-        + Optional(save)
+        + Optional(max_capacity)
+        + Optional(save + Optional(shards) + Optional(checkpoint))
     )
 
 
@@ -182,6 +195,8 @@ def create_delete():
         + Optional(where)
         + Optional(using)
         + Optional(throttle)
+        + Optional(max_capacity)
+        + Optional(checkpoint)
     )
 
 
@@ -258,6 +273,9 @@ def create_update():
     return_ = returns + Group(
         none | (all_ + old) | (all_ + new) | (updated + old) | (updated + new)
     ).setResultsName("returns")
+    batch_txn = (
+        Suppress(upkey("batch") + upkey("transaction")) + number
+    ).setResultsName("batch_transaction")
     return (
         update
         + table
@@ -266,7 +284,11 @@ def create_update():
         + Optional(where)
         + Optional(using)
         + Optional(return_)
+        + Optional(batch_txn)
         + Optional(throttle)
+        + Optional(max_capacity)
+        + Optional(save)
+        + Optional(checkpoint)
     )
 
 
@@ -346,6 +368,17 @@ def create_parser():
 using = (upkey("using") + index_name).setResultsName("using")
 throughput = create_throughput()
 throttle = create_throttle()
+max_capacity = create_max_capacity()
+save = (Suppress(upkey("save")) + filename).setResultsName("save_file")
+checkpoint = (Suppress(upkey("checkpoint")) + filename).setResultsName("checkpoint")
+shards = (Suppress(upkey("shards")) + number).setResultsName("shards")
+group_by = Group(
+    Suppress(upkey("group") + upkey("by")) + delimitedList(var)
+).setResultsName("group_by")
+parallel = (Suppress(upkey("parallel")) + number).setResultsName("parallel")
+sample = (
+    Suppress(upkey("sample")) + number + Suppress(upkey("percent"))
+).setResultsName("sample")
 index = Group(
     Optional(upkey("all") | upkey("keys") | upkey("include")) + upkey("index")
 ).setResultsName("index_type")
@@ -172,4 +172,4 @@ set_ = Group(set_ | _emptyset).setName("set")
 types = oneOf("s ss n ns b bs bool null l m", caseless=True).setParseAction(
     upcaseTokens
 )
-filename = quotedString | Regex(r"[0-9A-Za-z/_\-\.]+")
+filename = quotedString | Regex(r"[0-9A-Za-z/_\-\.\*]+")
@@ -1,6 +1,7 @@
 """ Grammars for parsing query strings """
 
 from pyparsing import (
+    FollowedBy,
     Forward,
     Group,
     Keyword,
@@ -33,6 +34,7 @@ from .common import (
     function,
     integer,
     not_,
+    number,
     or_,
     quoted,
     set_,
@@ -72,11 +74,29 @@ def create_selection():
     operation <<= maybe_nested + OneOrMore(oneOf("+ - * /") + maybe_nested)
     select_expr <<= operation | maybe_nested
     alias = Group(Suppress(upkey("as")) + var).setResultsName("alias")
+    aggregate = Group(
+        (
+            upkey("count")
+            | upkey("sum")
+            | upkey("avg")
+            | upkey("min")
+            | upkey("max")
+            | upkey("approx_count_distinct")
+            | upkey("approx_percentile")
+        )
+        + Suppress("(")
+        + (Keyword("*") | Group(select_expr))
+        + Optional(Suppress(",") + number)
+        + Suppress(")")
+    ).setResultsName("aggregate")
     full_select = Group(
-        Group(select_expr).setResultsName("selection") + Optional(alias)
+        (aggregate | Group(select_expr).setResultsName("selection")) + Optional(alias)
     )
     return Group(
-        Keyword("*") | upkey("count(*)") | delimitedList(full_select)
+        Keyword("*")
+        # COUNT(*) on its own is a count, otherwise it's an aggregate function
+        | upkey("count(*)") + ~FollowedBy(upkey("as") | ",")
+        | delimitedList(full_select)
     ).setResultsName("attrs")
 
 
@@ -69,6 +69,9 @@ DELETE = """
         [ KEYS IN primary_keys ]
         [ WHERE expression ]
         [ USING index ]
+        [ THROTTLE throughput ]
+        [ MAX CAPACITY read_units [, write_units] ]
+        [ CHECKPOINT state_file ]
 
     Examples
     --------
@@ -77,6 +80,8 @@ DELETE = """
     DELETE FROM foobars KEYS IN 'hkey1', 'hkey2' WHERE attribute_exists(foo);
     DELETE FROM foobars KEYS IN ('hkey1', 'rkey1'), ('hkey2', 'rkey2');
     DELETE FROM foobars WHERE (foo = 'bar' AND baz >= 3) USING baz-index;
+    DELETE FROM foobars WHERE foo = 'bar' MAX CAPACITY 100, 500;
+    DELETE FROM foobars WHERE foo = 'bar' CHECKPOINT delete.ckpt;
 
     Links
     -----
@@ -144,6 +149,8 @@ LOAD = """
     --------
     LOAD archive.p INTO mytable;
     LOAD dump.json.gz INTO mytable;
+    LOAD backup.ddbjson.gz INTO mytable;
+    LOAD 'exports/*.json.gz' INTO mytable;
 """
 
 SCAN = (
@@ -157,11 +164,16 @@ SCAN = (
         FROM tablename
         [ KEYS IN primary_keys | WHERE expression ]
         [ USING index ]
+        [ GROUP BY field, ... ]
         [ LIMIT limit ]
         [ SCAN LIMIT scan_limit ]
         [ ORDER BY field ]
         [ ASC | DESC ]
-        [ SAVE file.json ]
+        [ PARALLEL segments ]
+        [ SAMPLE percent PERCENT ]
+        [ THROTTLE throughput ]
+        [ MAX CAPACITY read_units [, write_units] ]
+        [ SAVE file.json [ SHARDS num_shards ] [ CHECKPOINT state_file ] ]
 
     Examples
     --------
@@ -177,6 +189,17 @@ SCAN = (
     SELECT 10 * (foo - bar) FROM foobars WHERE id = 'a' AND ts < 100 USING -; # force it to not use index
     SELECT * FROM foobars WHERE foo = 'bar' LIMIT 50 DESC;
     SELECT * FROM foobars THROTTLE (50%, *);
+    SCAN * FROM foobars MAX CAPACITY 1000 SAVE out.json.gz;
+    SCAN * FROM foobars SAVE out.json.gz CHECKPOINT scan.ckpt;
+    SCAN * FROM foobars SAVE out.parquet;
+    SCAN * FROM foobars SAVE backup.ddbjson.gz;
+    SCAN * FROM foobars SAVE 'out/part-*.json.gz' SHARDS 16;
+    SCAN sum(price), avg(price) AS average FROM foobars WHERE shop = 'x';
+    SCAN shop, count(*) AS n, max(price) FROM foobars GROUP BY shop ORDER BY n DESC;
+    SCAN count(*) FROM foobars WHERE foo = 'bar' PARALLEL 16;
+    SCAN count(*) FROM foobars WHERE foo = 'bar' SAMPLE 1 PERCENT;
+    SCAN shop, sum(price) FROM foobars GROUP BY shop PARALLEL 8;
+    SCAN approx_count_distinct(user), approx_percentile(latency, 0.99) FROM foobars;
 
     Links
     -----
@@ -192,6 +215,11 @@ UPDATE = """
         [ WHERE expression ]
         [ USING index ]
         [ RETURNS (NONE | ( ALL | UPDATED) (NEW | OLD)) ]
+        [ BATCH TRANSACTION size ]
+        [ THROTTLE throughput ]
+        [ MAX CAPACITY read_units [, write_units] ]
+        [ SAVE file.json ]
+        [ CHECKPOINT state_file ]
 
     Examples
     --------
@@ -203,6 +231,10 @@ UPDATE = """
     UPDATE foobars ADD fooset (1, 2);
     UPDATE foobars REMOVE old_attribute;
     UPDATE foobars DELETE fooset (1, 2);
+    UPDATE foobars SET foo = 'a' MAX CAPACITY *, 500;
+    UPDATE foobars SET foo = 'a' CHECKPOINT update.ckpt;
+    UPDATE foobars SET foo = 'a' WHERE foo = 'b' BATCH TRANSACTION 25;
+    UPDATE foobars SET foo = 'a' RETURNS ALL OLD SAVE backup.json.gz;
 
     Links
     -----
@@ -221,4 +253,5 @@ OPTIONS = """
               display : (less|stdout), The reader used to view query results
                format : (smart|column|expanded), Display format for query results
     allow_select_scan : bool, If True, SELECT statements can perform table scans
+       decode_workers : int, Processes that decode large query and scan results
 """
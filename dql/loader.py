@@ -0,0 +1,200 @@
+""" Splitting the files of a LOAD into chunks that can be parsed in parallel """
+
+import csv
+import glob
+import io
+import itertools
+import json
+import os
+import pickle
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .compress import get_compression, open_compressed
+from .csvtypes import SAMPLE_ROWS, TYPES_SUFFIX, get_column_types, make_converter
+from .exceptions import EngineRuntimeError
+from .framed import MAGIC, decode_block, iter_block_payloads
+from .raw import RAW_FORMAT, decode_raw_item
+from .shards import MANIFEST_FILE
+
+# The amount of data in each chunk of a text file
+CHUNK_SIZE = 1 << 20
+
+# The number of items in each chunk of a pickled file
+PICKLE_CHUNK_ITEMS = 1000
+
+# Files pickled by older versions are only loaded if they have this extension,
+# because unpickling a file can run arbitrary code
+PICKLE_FORMAT = ".pickle"
+
+
+def get_load_format(filename: str) -> str:
+    """Get the format extension of a file, ignoring the compression"""
+    remainder, ext = os.path.splitext(filename)
+    if get_compression(filename) is not None:
+        ext = os.path.splitext(remainder)[1]
+    return ext.lower()
+
+
+def expand_load_filename(filename: str) -> List[str]:
+    """
+    Get the files to LOAD from a filename, glob pattern, or directory
+
+    A directory loads the shards listed in its manifest if it has one (see
+    :func:`~dql.shards.write_manifest`), otherwise all of the files in it.
+    Files that start with '_' or '.', and the column types written next to
+    CSV files, are skipped when matching a pattern or listing a directory.
+
+    """
+    if os.path.isdir(filename):
+        manifest = os.path.join(filename, MANIFEST_FILE)
+        if os.path.exists(manifest):
+            with open(manifest, "r", encoding="utf-8") as ifile:
+                shards = json.load(ifile)["shards"]
+            return [os.path.join(filename, shard["file"]) for shard in shards]
+        filenames = [os.path.join(filename, name) for name in os.listdir(filename)]
+    elif glob.has_magic(filename):
+        filenames = glob.glob(filename)
+    elif os.path.exists(filename):
+        return [filename]
+    else:
+        raise FileNotFoundError("No such file %r" % filename)
+    filenames = sorted(
+        name
+        for name in filenames
+        if os.path.isfile(name)
+        and not os.path.basename(name).startswith(("_", "."))
+        and not name.endswith(TYPES_SUFFIX)
+    )
+    if not filenames:
+        raise FileNotFoundError("No files match %r" % filename)
+    return filenames
+
+
+def _iter_line_chunks(ifile: Any, is_csv: bool) -> Iterator[bytes]:
+    """Read chunks of a binary file that end at the end of a line"""
+    while True:
+        chunk = ifile.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        chunk += ifile.readline()
+        # A newline inside of a quoted CSV field doesn't end the row
+        while is_csv and chunk.count(b'"') % 2 == 1:
+            line = ifile.readline()
+            if not line:
+                break
+            chunk += line
+        yield chunk
+
+
+def not_framed_error(filename: str) -> EngineRuntimeError:
+    """The error for a binary file that isn't in the framed format"""
+    return EngineRuntimeError(
+        "%r is not in the DQL binary format. If it was pickled by an older "
+        "version of DQL and you trust it, rename it to end in %r to load it."
+        % (filename, PICKLE_FORMAT)
+    )
+
+
+def _open_binary(filename: str) -> Any:
+    """Open a file for reading in binary mode, decompressing it if needed"""
+    compression = get_compression(filename)
+    if compression is None:
+        return open(filename, "rb")
+    return open_compressed(filename, compression)
+
+
+def _get_csv_columns(
+    filename: str, data: bytes
+) -> Tuple[List[str], Dict[str, str], Set[str]]:
+    """Get the names and types of the columns from the start of a CSV"""
+    reader = csv.reader(io.StringIO(data.decode("utf-8"), newline=""))
+    header = next(reader, [])
+    return get_column_types(
+        filename, header, list(itertools.islice(reader, SAMPLE_ROWS))
+    )
+
+
+def iter_chunks(filename: str) -> Iterator[Tuple[str, Any]]:
+    """
+    Split a file saved with SELECT ... SAVE into chunks
+
+    Generates tuples of (kind, data). Each chunk can be parsed independently
+    with :func:`~.parse_chunk`, except for the 'items' chunks of pickled files,
+    which are already lists of items. The chunks of a CSV file also have the
+    names and types of the columns, which are found once for the whole file.
+
+    """
+    ext = get_load_format(filename)
+    if ext in (".json", RAW_FORMAT):
+        with _open_binary(filename) as ifile:
+            for chunk in _iter_line_chunks(ifile, False):
+                yield ext, chunk
+    elif ext == ".csv":
+        with _open_binary(filename) as ifile:
+            header = ifile.readline()
+            columns = None
+            for chunk in _iter_line_chunks(ifile, True):
+                if columns is None:
+                    # Find the column types once from the start of the file
+                    columns = _get_csv_columns(filename, header + chunk)
+                yield ext, (columns, chunk)
+    else:
+        with _open_binary(filename) as ifile:
+            is_framed = ifile.read(len(MAGIC)) == MAGIC
+        if is_framed:
+            with iter_block_payloads(filename) as blocks:  # pylint: disable=W0135
+                for payload, _ in blocks:
+                    yield "block", payload
+            return
+        if ext != PICKLE_FORMAT:
+            raise not_framed_error(filename)
+        # Files saved by older versions are pickled, so they can't be split
+        # without unpickling them
+        with _open_binary(filename) as ifile:
+            items: List[Dict[str, Any]] = []
+            try:
+                while True:
+                    items.append(pickle.load(ifile))
+                    if len(items) >= PICKLE_CHUNK_ITEMS:
+                        yield "items", items
+                        items = []
+            except EOFError:
+                pass
+            if items:
+                yield "items", items
+
+
+def parse_chunk(kind: str, data: Any) -> List[Dict[str, Any]]:
+    """
+    Parse a chunk from :func:`~.iter_chunks` into items
+
+    This is run in another process, so it only uses picklable arguments.
+
+    """
+    if kind == ".json":
+        return [json.loads(line) for line in data.splitlines() if line]
+    elif kind == RAW_FORMAT:
+        return [decode_raw_item(line) for line in data.splitlines() if line]
+    elif kind == ".csv":
+        (names, types, explicit), chunk = data
+        convert = make_converter(names, types, explicit)
+        reader = csv.reader(io.StringIO(chunk.decode("utf-8"), newline=""))
+        return [convert(row) for row in reader if row]
+    return decode_block(data)
+
+
+def get_manifest_counts(filenames: List[str]) -> Dict[str, Optional[int]]:
+    """Get the number of items in each file from the manifests, if known"""
+    counts: Dict[str, Optional[int]] = {}
+    manifests: Dict[str, Dict[str, int]] = {}
+    for filename in filenames:
+        dirname, basename = os.path.split(filename)
+        if dirname not in manifests:
+            manifests[dirname] = {}
+            manifest = os.path.join(dirname, MANIFEST_FILE)
+            if os.path.exists(manifest):
+                with open(manifest, "r", encoding="utf-8") as ifile:
+                    for shard in json.load(ifile)["shards"]:
+                        manifests[dirname][shard["file"]] = shard["count"]
+        counts[filename] = manifests[dirname].get(basename)
+    return counts
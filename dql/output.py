@@ -1,22 +1,21 @@
 # -*- coding: utf-8 -*-
 """ Formatting and displaying output """
 import contextlib
+import itertools
 import json
 import locale
-import os
-import stat
 import subprocess
 import sys
-import tempfile
 from base64 import b64encode
 from builtins import input, range, str
 from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from typing import Dict
+from typing import Any, Dict, List, Sized
 
 from dateutil.relativedelta import relativedelta
 from dynamo3 import Binary
+from dynamo3.result import PagedIterator
 from rich.console import Console
 from rich.highlighter import JSONHighlighter
 
@@ -32,14 +31,6 @@ def truncate(string, length, ellipsis="…"):
     return string
 
 
-def make_list(obj):
-    """Turn an object into a list if it isn't already"""
-    if isinstance(obj, list):
-        return obj
-    else:
-        return list(obj)
-
-
 def wrap(string, length, indent):
     """Wrap a string at a line length"""
     newline = "\n" + " " * indent
@@ -97,7 +88,10 @@ class BaseFormat(object):
     def __init__(
         self, results, ostream, width="auto", pagesize="auto", lossy_json_float=True
     ):
-        self._results = make_list(results)
+        # Consume the results lazily so that we only fetch the pages of a
+        # query that are actually displayed
+        self._source = results
+        self._results = iter(results)
         self._ostream = ostream
         self._width = width
         self._pagesize = pagesize
@@ -131,26 +125,50 @@ class BaseFormat(object):
     def post_write(self):
         """Called once after writing all records"""
 
+    def _results_are_local(self):
+        """Check if the rest of the results can be read without a fetch"""
+        source = self._source
+        if isinstance(source, Sized):
+            return True
+        if isinstance(source, PagedIterator):
+            # The rest of the current page is already in memory
+            return source.iterator is not None and not source.can_fetch_more
+        return False
+
     def display(self):
         """Write results to an output stream"""
         total = 0
         count = 0
-        for i, result in enumerate(self._results):
+        prompted = False
+        while True:
+            if count >= self.pagesize > 0:
+                count = 0
+                if self._results_are_local():
+                    # Look ahead so we don't prompt after the last result
+                    result = next(self._results, None)
+                    if result is None:
+                        break
+                    self.wait()
+                else:
+                    # Don't fetch the next page until the user asks for it
+                    self.wait()
+                    prompted = True
+                    result = next(self._results, None)
+            else:
+                result = next(self._results, None)
+            if result is None:
+                break
+            prompted = False
             if total == 0:
                 self.pre_write()
             self.write(result)
             count += 1
             total += 1
-            if (
-                count >= self.pagesize
-                and self.pagesize > 0
-                and i < len(self._results) - 1
-            ):
-                self.wait()
-                count = 0
         if total == 0:
             self._ostream.write("No results\n")
         else:
+            if prompted:
+                self._ostream.write("No more results\n")
             self.post_write()
 
     def wait(self):
@@ -233,57 +251,125 @@ class ExpandedFormat(BaseFormat):
 class ColumnFormat(BaseFormat):
     """A layout that puts item attributes in columns"""
 
+    # The number of results used to size the columns when not paging
+    sample_size = 1000
+
     def __init__(self, *args, **kwargs):
         super(ColumnFormat, self).__init__(*args, **kwargs)
-        col_width: Dict[str, int] = OrderedDict()
-        for result in self._results:
+        # The widest value seen in each column
+        self._max_width: Dict[str, int] = OrderedDict()
+        # The displayed width of each column
+        self._col_width: Dict[str, int] = OrderedDict()
+        self._header = ""
+        self._footer = ""
+        self._header_changed = False
+        # Set after a prompt, so the header is written above the next page
+        self._new_page = False
+        self.width_requested = 0
+        # Size the columns from the first page of results. Later pages keep
+        # that layout unless they don't fit in the width of the display.
+        results = self._results
+        first_page = self._next_page(results)
+        self._results = itertools.chain(first_page, self._iter_pages(results))
+
+    def _next_page(self, results):
+        """Fetch and format the next page of results and fit the columns to it"""
+        size = self.pagesize if self.pagesize > 0 else self.sample_size
+        rows = []
+        for result in itertools.islice(results, size):
+            # Format each value once, and cache it for writing
+            row = {}
             for key, value in result.items():
-                col_width.setdefault(key, len(key))
-                col_width[key] = max(col_width[key], len(self.format_field(value)))
-        self._all_columns = list(col_width)
+                text = self.format_field(value)
+                row[key] = text
+                self._max_width.setdefault(key, len(key))
+                self._max_width[key] = max(self._max_width[key], len(text))
+            rows.append(row)
+        if rows and self._needs_layout():
+            self._layout()
+        return rows
+
+    def _needs_layout(self):
+        """Check if the columns have to be laid out again for the latest page"""
+        if any(key not in self._col_width for key in self._max_width):
+            # There's a new attribute, which needs a column
+            return True
+        if self.width_requested > self.width:
+            # The columns are already squeezed into the width of the display
+            return False
+        # Values wider than their column are truncated until the table no
+        # longer fits in the width of the display
+        width_requested = 3 + len(self._max_width) + sum(self._max_width.values())
+        return width_requested > self.width
+
+    def _iter_pages(self, results):
+        """Generate the formatted rows one page at a time"""
+        while True:
+            rows = self._next_page(results)
+            if not rows:
+                return
+            yield from rows
+
+    def _layout(self):
+        """Compute the column widths and the header"""
+        col_width = OrderedDict(self._max_width)
         self.width_requested = 3 + len(col_width) + sum(col_width.values())
         if self.width_requested > self.width:
-            even_width = int((self.width - 1) / len(self._all_columns)) - 3
+            even_width = int((self.width - 1) / len(col_width)) - 3
             for key in col_width:
                 col_width[key] = even_width
+        if col_width == self._col_width:
+            return
         self._col_width = col_width
 
         header = "|"
-        for col in self._all_columns:
-            width = self._col_width[col]
+        for col, width in self._col_width.items():
             header += " "
             header += truncate(col.center(width), width)
             header += " |"
         self._header = header
+        self._header_changed = True
 
     def _write_header(self):
         """Write out the table header"""
-        self._ostream.write(len(self._header) * "-" + "\n")
+        self._header_changed = False
+        # The layout may change before the footer is written
+        self._footer = len(self._header) * "-" + "\n"
+        self._ostream.write(self._footer)
         self._ostream.write(self._header)
         self._ostream.write("\n")
-        self._ostream.write(len(self._header) * "-" + "\n")
+        self._ostream.write(self._footer)
 
     def _write_footer(self):
         """Write out the table footer"""
-        self._ostream.write(len(self._header) * "-" + "\n")
+        self._ostream.write(self._footer)
 
     def pre_write(self):
         self._write_header()
 
     def post_write(self):
-        self._write_footer()
+        if not self._new_page:
+            # wait() already closed off the last page
+            self._write_footer()
 
     def wait(self):
         """Block for user input"""
         self._write_footer()
         super(ColumnFormat, self).wait()
-        self._write_header()
+        self._new_page = True
 
     def write(self, result):
+        # The results have already been formatted by _next_page
+        if self._new_page:
+            self._new_page = False
+            self._write_header()
+        elif self._header_changed:
+            self._write_footer()
+            self._write_header()
         self._ostream.write("|")
         for col, width in self._col_width.items():
             self._ostream.write(" ")
-            val = self.format_field(result.get(col, None)).ljust(width)
+            val = result.get(col, "NULL").ljust(width)
             self._ostream.write(truncate(val, width))
             self._ostream.write(" |")
         self._ostream.write("\n")
@@ -314,18 +400,77 @@ class JsonFormat(BaseFormat):
             self._ostream.write("\n")
 
 
+class JsonLinesFormat(BaseFormat):
+    """Write each result as a line of compact JSON, for piping into other tools"""
+
+    def __init__(self, *args, **kwargs):
+        super(JsonLinesFormat, self).__init__(*args, **kwargs)
+        # Look up the encoder by exact type instead of a chain of isinstance
+        encoders = {
+            Decimal: float if self._lossy_json_float else str,
+            bytes: lambda value: b64encode(value).decode("ascii"),
+            Binary: lambda value: b64encode(value.value).decode("ascii"),
+            set: list,
+        }
+        fallback = self._default_json_serializer
+
+        def default(obj):
+            """Serialize custom types to JSON"""
+            encode = encoders.get(type(obj))
+            if encode is None:
+                return fallback(obj)
+            return encode(obj)
+
+        self._encode = json.JSONEncoder(
+            default=default, separators=(",", ":"), ensure_ascii=False
+        ).encode
+
+    def write(self, result):
+        self._ostream.write(self._encode(result).encode("utf-8") + b"\n")
+
+    def display(self):
+        """Write results to an output stream, without paging"""
+        write = self._ostream.write
+        encode = self._encode
+        for result in self._results:
+            write(encode(result).encode("utf-8") + b"\n")
+        self._ostream.flush()
+
+
 class SmartFormat(object):
     """A layout that chooses column/expanded format intelligently"""
 
     _sub_formatter: BaseFormat
 
+    # The most results to read before choosing a layout
+    sample_size = 100
+
     def __init__(self, results, ostream, *args, **kwargs):
-        results = make_list(results)
-        fmt = ColumnFormat(results, ostream, *args, **kwargs)
-        if fmt.width_requested > fmt.width:
+        source = results
+        results = iter(results)
+        # Only used to format the sample and get the display width
+        fmt = BaseFormat(results, ostream, *args, **kwargs)
+        sample: List[Dict[str, Any]] = []
+        col_width: Dict[str, int] = {}
+        width_requested = 0
+        # Stop reading as soon as the columns are too wide to fit
+        while width_requested <= fmt.width and len(sample) < self.sample_size:
+            result = next(results, None)
+            if result is None:
+                break
+            sample.append(result)
+            for key, value in result.items():
+                col_width.setdefault(key, len(key))
+                col_width[key] = max(col_width[key], len(fmt.format_field(value)))
+            width_requested = 3 + len(col_width) + sum(col_width.values())
+
+        results = itertools.chain(sample, results)
+        if width_requested > fmt.width:
             self._sub_formatter = ExpandedFormat(results, ostream, *args, **kwargs)
         else:
-            self._sub_formatter = fmt
+            self._sub_formatter = ColumnFormat(results, ostream, *args, **kwargs)
+        # Ask the original results whether there are more to fetch
+        self._sub_formatter._source = source  # pylint: disable=W0212
 
     def display(self):
         """Write results to an output stream"""
@@ -355,23 +500,24 @@ class SmartBuffer(object):
 
 @contextlib.contextmanager
 def less_display():
-    """Use smoke and mirrors to acquire 'less' for pretty paging"""
-    # here's some magic. We want the nice paging from 'less', so we write
-    # the output to a file and use subprocess to run 'less' on the file.
-    # But the file might have sensitive data, so open it in 0600 mode.
-    _, filename = tempfile.mkstemp()
-    mode = stat.S_IRUSR | stat.S_IWUSR
-    outfile = None
-    outfile = os.fdopen(os.open(filename, os.O_WRONLY | os.O_CREAT, mode), "wb")
+    """Stream the output into 'less' for pretty paging"""
+    # Writing through a pipe lets 'less' show the first page as soon as it is
+    # formatted, and keeps possibly sensitive data off the disk. Once the pipe
+    # fills up, writes block until the user scrolls, so we only fetch about as
+    # many results as they look at.
+    proc = subprocess.Popen(["less", "-FXR"], stdin=subprocess.PIPE)
+    assert proc.stdin is not None
     try:
-        yield SmartBuffer(outfile)
-        outfile.flush()
-        subprocess.call(["less", "-FXR", filename])
+        yield SmartBuffer(proc.stdin)
+    except BrokenPipeError:
+        # The user quit 'less' before reading all of the output
+        pass
     finally:
-        if outfile is not None:
-            outfile.close()
-        if os.path.exists(filename):
-            os.unlink(filename)
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
 
 
 @contextlib.contextmanager
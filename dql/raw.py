@@ -0,0 +1,115 @@
+""" Saving and loading items in the DynamoDB JSON wire format """
+
+import copy
+import json
+from base64 import b64decode, b64encode
+from typing import Any, Dict, Iterable, List
+
+from dynamo3 import Dynamizer, DynamoDBConnection
+from dynamo3.result import ResultSet
+
+from .exceptions import EngineRuntimeError
+
+RAW_FORMAT = ".ddbjson"
+
+# The most items allowed in one BatchWriteItem request
+BATCH_WRITE_SIZE = 25
+
+
+class RawDynamizer(Dynamizer):
+    """A :class:`~dynamo3.types.Dynamizer` that leaves items in the wire format"""
+
+    def decode_keys(self, keys: Dict) -> Dict:
+        """Return the items exactly as DynamoDB sent them"""
+        return keys
+
+
+class RawResultSet(ResultSet):
+    """A :class:`~dynamo3.result.ResultSet` that doesn't decode the items"""
+
+    @classmethod
+    def from_result_set(cls, result: ResultSet) -> "RawResultSet":
+        """Create a RawResultSet for the same request as a ResultSet"""
+        # The copy shares the client, hooks, and rate limiters of the original
+        connection = copy.copy(result.connection)
+        connection.dynamizer = RawDynamizer()
+        return cls(connection, result.limit, *result.args, **result.kwargs)
+
+
+def _encode_binary(value: Any) -> str:
+    """Encode the Binary values of a raw item for JSON"""
+    if isinstance(value, bytes):
+        return b64encode(value).decode("ascii")
+    raise TypeError("Cannot encode %s value %r" % (type(value), value))
+
+
+# Encodes an item in the DynamoDB JSON format as a single line
+raw_encoder = json.JSONEncoder(separators=(",", ":"), default=_encode_binary)
+
+
+def decode_binary(value: Dict[str, Any]) -> Dict[str, Any]:
+    """Decode the base64 Binary values of a raw attribute value in place"""
+    if "B" in value:
+        value["B"] = b64decode(value["B"])
+    elif "BS" in value:
+        value["BS"] = [b64decode(elem) for elem in value["BS"]]
+    elif "M" in value:
+        for elem in value["M"].values():
+            decode_binary(elem)
+    elif "L" in value:
+        for elem in value["L"]:
+            decode_binary(elem)
+    return value
+
+
+def decode_raw_item(line: str) -> Dict[str, Any]:
+    """Parse a line of DynamoDB JSON into an item botocore can send"""
+    item = json.loads(line)
+    for value in item.values():
+        decode_binary(value)
+    return item
+
+
+def write_raw_items(
+    connection: DynamoDBConnection, tablename: str, items: Iterable[Dict]
+) -> int:
+    """
+    Put items that are already in the DynamoDB JSON format into a table
+
+    Unprocessed items are retried with backoff, up to the connection's
+    ``request_retries`` times in a row.
+
+    """
+    count = 0
+    batch: List[Dict] = []
+
+    def flush():
+        """Write the batch, retrying any unprocessed items"""
+        request = {tablename: [{"PutRequest": {"Item": item}} for item in batch]}
+        attempt = 0
+        while request:
+            response = connection.call("batch_write_item", RequestItems=request)
+            unprocessed = response.get("UnprocessedItems")
+            if not unprocessed:
+                return
+            if len(unprocessed.get(tablename, [])) < len(request[tablename]):
+                # Some items got through, so start the backoff over
+                attempt = 0
+            attempt += 1
+            if attempt > connection.request_retries:
+                raise EngineRuntimeError(
+                    "%d items were still unprocessed after %d retries"
+                    % (len(unprocessed[tablename]), connection.request_retries)
+                )
+            connection.exponential_sleep(attempt)
+            request = unprocessed
+
+    for item in items:
+        batch.append(item)
+        count += 1
+        if len(batch) >= BATCH_WRITE_SIZE:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    return count
@@ -0,0 +1,127 @@
+""" Estimating counts from a sample of the segments of a table """
+
+import math
+import random
+from decimal import Decimal
+from typing import List, Tuple
+
+from dynamo3.result import Count
+
+# The number of segments a SAMPLE scans, unless the percentage is so small that
+# it would need more than MAX_SEGMENTS
+SAMPLE_SEGMENTS = 16
+
+# The most segments DynamoDB can split a scan into
+MAX_SEGMENTS = 1000000
+
+# The z-score of the 95% confidence interval
+Z_95 = 1.96
+
+
+class EstimatedCount(int):
+    """
+    A count extrapolated from a sample of a table
+
+    Attributes
+    ----------
+    low : int
+        The lower bound of the 95% confidence interval
+    high : int
+        The upper bound of the 95% confidence interval
+    count : int
+        The number of matching items in the sample
+    scanned_count : int
+        The number of items in the sample
+    fraction : float
+        The fraction of the table that was sampled
+
+    """
+
+    low: int
+    high: int
+    count: int
+    scanned_count: int
+    fraction: float
+
+    def __new__(
+        cls,
+        estimate: int,
+        low: int,
+        high: int,
+        count: int,
+        scanned_count: int,
+        fraction: float,
+    ) -> "EstimatedCount":
+        ret = super(EstimatedCount, cls).__new__(cls, estimate)
+        ret.low = low
+        ret.high = high
+        ret.count = count
+        ret.scanned_count = scanned_count
+        ret.fraction = fraction
+        return ret
+
+    def __repr__(self):
+        return "EstimatedCount(%d, %d, %d)" % (int(self), self.low, self.high)
+
+
+def choose_segments(percent: Decimal) -> Tuple[int, List[int]]:
+    """
+    Choose the segments to scan for a SAMPLE
+
+    Returns
+    -------
+    total_segments : int
+        The number of segments to split the table into
+    segments : list
+        The randomly chosen segments to scan
+
+    """
+    total = int(round(SAMPLE_SEGMENTS * 100 / percent))
+    total = min(MAX_SEGMENTS, max(SAMPLE_SEGMENTS, total))
+    num_segments = min(total, max(1, int(round(total * percent / 100))))
+    return total, sorted(random.sample(range(total), num_segments))
+
+
+def estimate_count(count: Count, fraction: float, item_count: int) -> EstimatedCount:
+    """
+    Extrapolate the result of a COUNT(*) on a sample to the whole table
+
+    The fraction of the sampled items that matched is scaled up to the number
+    of items in the table. The confidence interval is the Wilson score
+    interval of that fraction, which behaves well when few or no items match.
+
+    Parameters
+    ----------
+    count : :class:`~dynamo3.result.Count`
+        The result of the COUNT(*) on the sampled segments
+    fraction : float
+        The fraction of the segments that were scanned
+    item_count : int
+        The number of items in the table, as reported by DynamoDB. If this is 0
+        (DynamoDB hasn't updated it yet), it is estimated from the sample.
+
+    """
+    matched, scanned = count.count, count.scanned_count
+    if fraction >= 1:
+        # The whole table was scanned
+        return EstimatedCount(matched, matched, matched, matched, scanned, 1.0)
+    total = item_count or scanned / fraction
+    if scanned == 0:
+        return EstimatedCount(0, 0, int(total), 0, 0, fraction)
+    ratio = matched / scanned
+    z2 = Z_95 * Z_95
+    denominator = 1 + z2 / scanned
+    center = (ratio + z2 / (2 * scanned)) / denominator
+    spread = (
+        Z_95
+        * math.sqrt(ratio * (1 - ratio) / scanned + z2 / (4 * scanned * scanned))
+        / denominator
+    )
+    # Narrow the interval when the sample is a large part of the table
+    correction = math.sqrt(max(0.0, 1 - scanned / total))
+    low_ratio = ratio - (ratio - (center - spread)) * correction
+    high_ratio = ratio + (center + spread - ratio) * correction
+    low = max(matched, int(math.floor(max(0.0, low_ratio) * total)))
+    high = max(low, int(math.ceil(min(1.0, high_ratio) * total)))
+    estimate = min(high, max(low, int(round(ratio * total))))
+    return EstimatedCount(estimate, low, high, matched, scanned, fraction)
@@ -0,0 +1,51 @@
+""" Manifests for SAVE files that are split into shards """
+
+import json
+import os
+from typing import List
+
+# The name of the manifest, which is written next to the shards
+MANIFEST_FILE = "_manifest.json"
+
+# The most shards a SAVE can be split into
+MAX_SHARDS = 1000
+
+
+def write_manifest(
+    dirname: str, pattern: str, filenames: List[str], counts: List[int], complete: bool
+) -> None:
+    """
+    Write a manifest of the shards of a SAVE
+
+    Parameters
+    ----------
+    dirname : str
+        The directory of the shards
+    pattern : str
+        The filename pattern of the shards, with a '*' for the shard number
+    filenames : list
+        The path to each shard
+    counts : list
+        The number of items in each shard
+    complete : bool
+        False if the SAVE was stopped before all of the items were written
+
+    """
+    shards = []
+    for filename, count in zip(filenames, counts):
+        shards.append(
+            {
+                "file": os.path.basename(filename),
+                "count": count,
+                "bytes": os.path.getsize(filename) if os.path.exists(filename) else 0,
+            }
+        )
+    manifest = {
+        "pattern": pattern,
+        "count": sum(counts),
+        "complete": complete,
+        "shards": shards,
+    }
+    with open(os.path.join(dirname, MANIFEST_FILE), "w", encoding="utf-8") as ofile:
+        json.dump(manifest, ofile, indent=2)
+        ofile.write("\n")
@@ -0,0 +1,259 @@
+""" Fixed-memory sketches for approximate aggregate functions """
+
+import hashlib
+import math
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from dynamo3 import Binary
+
+# HyperLogLog uses 2^HLL_PRECISION registers (16KB), for a standard error of
+# about 1.04 / sqrt(2^HLL_PRECISION), or 0.8%
+HLL_PRECISION = 14
+
+# The relative accuracy of the values returned by QuantileSketch
+QUANTILE_ACCURACY = 0.01
+
+# The most buckets kept by a QuantileSketch. The smallest buckets are
+# collapsed together once there are more than this.
+QUANTILE_MAX_BUCKETS = 2048
+
+
+def _encode(value: Any) -> bytes:
+    """Encode a value as bytes, so that equal values have the same bytes"""
+    if isinstance(value, str):
+        return b"S" + value.encode("utf-8")
+    elif isinstance(value, Binary):
+        return b"B" + value.value
+    elif isinstance(value, bytes):
+        return b"B" + value
+    elif isinstance(value, bool):
+        return b"T" if value else b"F"
+    elif isinstance(value, (int, float, Decimal)):
+        return b"N" + str(Decimal(value).normalize()).encode("ascii")
+    elif isinstance(value, (set, frozenset)):
+        return b"L" + b"".join(sorted(_encode(v) for v in value))
+    elif isinstance(value, (list, tuple)):
+        return b"L" + b"".join(_encode(v) for v in value)
+    elif isinstance(value, dict):
+        return b"M" + b"".join(
+            _encode(k) + _encode(v) for k, v in sorted(value.items())
+        )
+    return b"O" + repr(value).encode("utf-8")
+
+
+def hash64(value: Any) -> int:
+    """A 64-bit hash of a value that is the same in every process"""
+    digest = hashlib.blake2b(_encode(value), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog(object):
+    """
+    Estimate the number of distinct values with a HyperLogLog sketch
+
+    Parameters
+    ----------
+    precision : int, optional
+        Use 2^precision registers (default :data:`HLL_PRECISION`)
+
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: Any) -> None:
+        """Add a value to the sketch"""
+        hashed = hash64(value)
+        bits = 64 - self.precision
+        index = hashed >> bits
+        # The position of the first 1 bit in the rest of the hash
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Merge another sketch into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precisions")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """
+        Estimate the number of distinct values
+
+        This uses the improved estimator from Ertl, "New cardinality estimation
+        algorithms for HyperLogLog sketches" (2017), which doesn't need the
+        bias corrections of the original estimator.
+
+        """
+        m = len(self.registers)
+        q = 64 - self.precision
+        counts = [0] * (q + 2)
+        for register in self.registers:
+            counts[register] += 1
+        z = m * _tau(1 - counts[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + counts[k])
+        z += m * _sigma(counts[0] / m)
+        return int(round(m * m / (2 * math.log(2) * z)))
+
+
+def _sigma(x: float) -> float:
+    """Correction for the registers that are still zero"""
+    if x == 1:
+        return math.inf
+    y = 1.0
+    z = x
+    while True:
+        x *= x
+        z_prev = z
+        z += x * y
+        y += y
+        if z == z_prev:
+            return z
+
+
+def _tau(x: float) -> float:
+    """Correction for the registers that have the largest possible value"""
+    if x == 0 or x == 1:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        z_prev = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == z_prev:
+            return z / 3
+
+
+class QuantileSketch(object):
+    """
+    Estimate the quantiles of numbers with a mergeable log-bucketed sketch
+
+    Numbers are counted in buckets whose bounds grow geometrically, so each
+    quantile is within ``accuracy`` of the true value (relative to it). This
+    is the same approach as DDSketch.
+
+    Parameters
+    ----------
+    accuracy : float, optional
+        The relative accuracy of the quantiles (default
+        :data:`QUANTILE_ACCURACY`)
+    max_buckets : int, optional
+        The most buckets to keep (default :data:`QUANTILE_MAX_BUCKETS`)
+
+    """
+
+    __slots__ = (
+        "gamma",
+        "max_buckets",
+        "positive",
+        "negative",
+        "zeros",
+        "count",
+        "min",
+        "max",
+    )
+
+    def __init__(
+        self,
+        accuracy: float = QUANTILE_ACCURACY,
+        max_buckets: int = QUANTILE_MAX_BUCKETS,
+    ):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.max_buckets = max_buckets
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _key(self, value: float) -> int:
+        return int(math.ceil(math.log(value, self.gamma)))
+
+    def add(self, value: Any) -> None:
+        """Add a number to the sketch"""
+        value = float(value)
+        if value > 0:
+            key = self._key(value)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0:
+            key = self._key(-value)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zeros += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self.positive) + len(self.negative) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        """Merge the buckets for the smallest magnitudes together"""
+        buckets = self.negative if self.negative else self.positive
+        excess = len(self.positive) + len(self.negative) - self.max_buckets
+        keys = sorted(buckets)[: excess + 1]
+        total = sum(buckets.pop(key) for key in keys)
+        buckets[keys[-1]] = total
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Merge another sketch into this one"""
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                if self.min is None or value < self.min:
+                    self.min = value
+                if self.max is None or value > self.max:
+                    self.max = value
+        if len(self.positive) + len(self.negative) > self.max_buckets:
+            self._collapse()
+
+    def _value(self, key: int) -> float:
+        """The value in the middle of a bucket"""
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the value at a quantile between 0 and 1"""
+        if self.count == 0:
+            return None
+        elif q <= 0:
+            return self.min
+        elif q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        value = None
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                value = -self._value(key)
+                break
+        else:
+            seen += self.zeros
+            if seen > rank:
+                value = 0.0
+            else:
+                for key in sorted(self.positive):
+                    seen += self.positive[key]
+                    if seen > rank:
+                        value = self._value(key)
+                        break
+        assert self.min is not None and self.max is not None
+        if value is None:
+            return self.max
+        # The buckets can be wider than the range of the values
+        return min(max(value, self.min), self.max)
@@ -1,8 +1,20 @@
 """ Wrapper around the dynamo3 RateLimit class """
 
+import threading
 from typing import Dict
 
-from dynamo3 import RateLimit
+from dynamo3 import Capacity, RateLimit
+from dynamo3.constants import READ_COMMANDS
+
+BUDGET_COMMANDS = READ_COMMANDS | frozenset(
+    [
+        "batch_write_item",
+        "delete_item",
+        "put_item",
+        "transact_write_items",
+        "update_item",
+    ]
+)
 
 
 class TableLimits(object):
@@ -154,3 +166,90 @@ class TableLimits(object):
             "total": self.total,
             "default": self.default,
         }
+
+
+class CapacityBudget(object):
+    """
+    Tracks the capacity consumed by a single statement against a budget
+
+    Parameters
+    ----------
+    tablename : str
+        The table the statement runs against. Only requests to this table
+        count against the budget.
+    read : float, optional
+        The maximum read capacity units to consume. None means no limit.
+    write : float, optional
+        The maximum write capacity units to consume. None means no limit.
+
+    """
+
+    def __init__(self, tablename, read=None, write=None):
+        self.tablename = tablename
+        self.read = read
+        self.write = write
+        self._read_limit = read
+        self._write_limit = write
+        self.consumed = Capacity(0, 0)
+        self.aborted = False
+        self._lock = threading.RLock()
+
+    def applies_to(self, command, kwargs):
+        """True if a request counts against this budget"""
+        if command not in BUDGET_COMMANDS:
+            return False
+        if "RequestItems" in kwargs:
+            return self.tablename in kwargs["RequestItems"]
+        if "TransactItems" in kwargs:
+            return any(
+                action["TableName"] == self.tablename
+                for item in kwargs["TransactItems"]
+                for action in item.values()
+            )
+        return kwargs.get("TableName") == self.tablename
+
+    def on_capacity(self, capacity):
+        """Record consumed capacity (thread-safe)"""
+        with self._lock:
+            self.consumed += capacity
+
+    @property
+    def exceeded(self):
+        """True if the consumed capacity has reached the budget"""
+        if self._read_limit is not None and self.consumed.read >= self._read_limit:
+            return True
+        if self._write_limit is not None and self.consumed.write >= self._write_limit:
+            return True
+        return False
+
+    def extend(self):
+        """Allow the statement to consume another full budget"""
+        if self._read_limit is not None:
+            self._read_limit += self.read
+        if self._write_limit is not None:
+            self._write_limit += self.write
+
+    def check(self, confirm):
+        """
+        Return True if the statement may make another request
+
+        When the budget has been reached, ``confirm`` is called (at most once
+        per overrun, even with multiple threads) to decide if the statement
+        should get another budget's worth of capacity.
+
+        """
+        with self._lock:
+            if self.aborted:
+                return False
+            if not self.exceeded:
+                return True
+            if confirm():
+                self.extend()
+                return True
+            self.aborted = True
+            return False
+
+    def __str__(self):
+        read = "*" if self.read is None else "%g" % self.read
+        write = "*" if self.write is None else "%g" % self.write
+        return "(%s, %s)" % (read, write)
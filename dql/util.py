@@ -2,7 +2,6 @@
 
 import calendar
 import contextlib
-import gzip
 import io
 import os
 from datetime import datetime
@@ -14,6 +13,8 @@ from dateutil.relativedelta import relativedelta
 from dateutil.tz import tzlocal, tzutc
 from dynamo3 import Binary
 
+from .compress import get_compression, open_compressed
+
 try:
     from shutil import get_terminal_size  # pylint: disable=E0611
 
@@ -165,24 +166,56 @@ def eval_expression(value):
 
 
 @contextlib.contextmanager
-def open_file_smart_mode(filename, write=False):
+def open_file_smart_mode(filename, write=False, append=False):
     remainder, ext = os.path.splitext(filename)
-    is_gzip = ext.lower() in [".gz", ".gzip"]
-    if is_gzip:
+    compression = get_compression(filename)
+    if compression is not None:
         ext = os.path.splitext(remainder)[1]
-    mode = "w" if write else "r"
-    text_format = ext.lower() in [".csv", ".json"]
-    if is_gzip:
-        with gzip.open(filename, mode + "b") as gzip_file:
+    if append:
+        mode = "a"
+    else:
+        mode = "w" if write else "r"
+    text_format = ext.lower() in [".csv", ".json", ".ddbjson"]
+    if compression is not None:
+        with open_compressed(filename, compression, mode) as compressed_file:
             if text_format:
                 with io.TextIOWrapper(
-                    cast(BinaryIO, gzip_file), encoding="utf-8"
+                    cast(BinaryIO, compressed_file), encoding="utf-8"
                 ) as text_file:
                     yield text_file
             else:
-                yield gzip_file
-    else:
-        if not text_format:
-            mode += "b"
+                yield compressed_file
+    elif text_format:
         with open(filename, mode, encoding="utf-8") as ofile:
             yield ofile
+    else:
+        with open(filename, mode + "b") as ofile:
+            yield ofile
+
+
+def truncate_file_smart_mode(filename, length):
+    """
+    Truncate a file written by :meth:`~.open_file_smart_mode`
+
+    The length is the number of uncompressed bytes to keep. Compressed files
+    are rewritten, because the compressed stream can't be cut at an arbitrary
+    point.
+
+    """
+    compression = get_compression(filename)
+    if compression is None:
+        with open(filename, "r+b") as ofile:
+            ofile.truncate(length)
+        return
+    tmpfile = filename + ".tmp"
+    with open_compressed(filename, compression) as ifile, open_compressed(
+        tmpfile, compression, "w"
+    ) as ofile:
+        remaining = length
+        while remaining > 0:
+            chunk = ifile.read(min(remaining, io.DEFAULT_BUFFER_SIZE))
+            if not chunk:
+                break
+            ofile.write(chunk)
+            remaining -= len(chunk)
+    os.replace(tmpfile, filename)
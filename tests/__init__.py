@@ -5,6 +5,8 @@ import unittest
 from dynamo3 import DynamoDBConnection
 
 from dql import Engine
+from dql.checkpoint import Checkpoint
+from dql.grammar import parser
 
 
 class BaseSystemTest(unittest.TestCase):
@@ -30,6 +32,7 @@ class BaseSystemTest(unittest.TestCase):
 
     def tearDown(self):
         super(BaseSystemTest, self).tearDown()
+        self.engine.close()
         for tablename in self.dynamo.list_tables():
             self.dynamo.delete_table(tablename)
 
@@ -37,6 +40,13 @@ class BaseSystemTest(unittest.TestCase):
         """Shorthand because I'm lazy"""
         return self.engine.execute(command)
 
+    def write_checkpoint(self, command, filename, last_key, processed, offset=0):
+        """Write a checkpoint as if the command had been interrupted"""
+        statement = repr(parser.parseString(command)[0].asList())
+        checkpoint = Checkpoint(filename, statement)
+        last_key = self.dynamo.dynamizer.encode_keys(last_key)
+        checkpoint.save(last_key, processed, offset)
+
     def make_table(self, name="foobar", hash_key="id", range_key="bar", index=None):
         """Shortcut for making a simple table"""
         rng = ""
@@ -0,0 +1,279 @@
+""" Tests for the output formatters """
+
+import json
+import unittest
+from decimal import Decimal
+from io import BytesIO, StringIO
+from typing import Dict, List
+from unittest.mock import patch
+
+from dynamo3 import Binary
+from dynamo3.result import PagedIterator
+
+from dql.output import (
+    ColumnFormat,
+    ExpandedFormat,
+    JsonLinesFormat,
+    SmartFormat,
+    less_display,
+)
+
+
+def counting_results(items, fetched):
+    """Generate the items and record how many have been fetched"""
+    for item in items:
+        fetched.append(item)
+        yield item
+
+
+class FakePages(PagedIterator):
+    """Results that are fetched a page at a time"""
+
+    def __init__(self, pages):
+        super(FakePages, self).__init__()
+        self.pages = pages
+        self.fetches = 0
+
+    @property
+    def can_fetch_more(self):
+        return bool(self.pages)
+
+    def _fetch(self):
+        self.fetches += 1
+        return iter(self.pages.pop(0))
+
+
+class FakeLess(object):
+    """Stand-in for the 'less' process that reads a limited amount"""
+
+    def __init__(self, limit):
+        self.received = BytesIO()
+        self.limit = limit
+        self.waited = False
+        self.stdin = self
+
+    def __call__(self, *_, **__):
+        return self
+
+    def write(self, data):
+        """Pretend the user quits after reading a few bytes"""
+        if self.received.tell() >= self.limit:
+            raise BrokenPipeError()
+        return self.received.write(data)
+
+    def flush(self):
+        """Nothing to flush"""
+
+    def close(self):
+        """Nothing to close"""
+
+    def wait(self):
+        """Record that the process was waited on"""
+        self.waited = True
+
+
+class TestFormatters(unittest.TestCase):
+    """Tests for displaying results"""
+
+    def test_lazy_pages(self):
+        """Results are only fetched as the pages are displayed"""
+        items = [{"id": str(i)} for i in range(10)]
+        fetched: List[Dict] = []
+        ostream = StringIO()
+        fmt = ExpandedFormat(
+            counting_results(items, fetched), ostream, width=40, pagesize=3
+        )
+        pages = []
+
+        def wait(*_):
+            """Record how many results were fetched before each prompt"""
+            pages.append(len(fetched))
+            return ""
+
+        with patch("dql.output.input", wait):
+            fmt.display()
+        # Nothing more is fetched until the user asks for it
+        self.assertEqual(pages, [3, 6, 9])
+        self.assertEqual(ostream.getvalue().count("id : "), 10)
+        self.assertNotIn("No more results", ostream.getvalue())
+
+    def test_no_prompt_after_last_page(self):
+        """Don't prompt for more results when there are none"""
+        items = [{"id": str(i)} for i in range(6)]
+        ostream = StringIO()
+        fmt = ExpandedFormat(items, ostream, width=40, pagesize=3)
+        prompts: List[str] = []
+        with patch("dql.output.input", prompts.append):
+            fmt.display()
+        self.assertEqual(len(prompts), 1)
+
+    def test_no_more_results(self):
+        """If the results run out after a prompt, say so"""
+        items = [{"id": str(i)} for i in range(6)]
+        ostream = StringIO()
+        fmt = ColumnFormat(iter(items), ostream, width=40, pagesize=3)
+        prompts: List[str] = []
+        with patch("dql.output.input", prompts.append):
+            fmt.display()
+        self.assertEqual(len(prompts), 2)
+        lines = ostream.getvalue().splitlines()
+        self.assertEqual(lines[-3:], ["| '5' |", "-------", "No more results"])
+
+    def test_no_prompt_after_last_fetch(self):
+        """Result sets tell us when the rest of the results are in memory"""
+        results = FakePages([[{"id": str(i)} for i in range(4)]])
+        ostream = StringIO()
+        fmt = ExpandedFormat(results, ostream, width=40, pagesize=2)
+        prompts: List[str] = []
+        with patch("dql.output.input", prompts.append):
+            fmt.display()
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(results.fetches, 1)
+        self.assertNotIn("No more results", ostream.getvalue())
+
+    def test_column_page_fetched_after_prompt(self):
+        """The next page isn't fetched and formatted until after the prompt"""
+        items = [{"id": str(i)} for i in range(5)]
+        fetched: List[Dict] = []
+        ostream = StringIO()
+        fmt = ColumnFormat(
+            counting_results(items, fetched), ostream, width=40, pagesize=2
+        )
+        pages = []
+
+        def wait(*_):
+            """Record how many results were fetched before each prompt"""
+            pages.append(len(fetched))
+            return ""
+
+        with patch("dql.output.input", wait):
+            fmt.display()
+        self.assertEqual(pages, [2, 4])
+
+    def test_no_results(self):
+        """Display a message when there are no results"""
+        ostream = StringIO()
+        ExpandedFormat(iter([]), ostream, width=40, pagesize=3).display()
+        self.assertEqual(ostream.getvalue(), "No results\n")
+
+    def test_column_widths_from_first_page(self):
+        """Columns are sized from the first page of results"""
+        items = [{"id": 1}, {"id": 2}, {"id": 123456}]
+        ostream = StringIO()
+        fmt = ColumnFormat(iter(items), ostream, width=80, pagesize=2)
+        with patch("dql.output.input", lambda *_: ""):
+            fmt.display()
+        lines = ostream.getvalue().splitlines()
+        self.assertEqual(lines[:5], ["------", "| id |", "------", "| 1  |", "| 2  |"])
+        # The last page keeps the layout, and the wider value is truncated
+        self.assertEqual(lines[-5:], ["------", "| id |", "------", "| 1… |", "------"])
+
+    def test_column_relayout_too_wide(self):
+        """A page that doesn't fit the width of the display gets a new layout"""
+        items = [{"id": 1, "bar": 1}, {"id": 2, "bar": "x" * 20}]
+        ostream = StringIO()
+        fmt = ColumnFormat(items, ostream, width=20, pagesize=1)
+        with patch("dql.output.input", lambda *_: ""):
+            fmt.display()
+        lines = ostream.getvalue().splitlines()
+        # The columns are squeezed into the width
+        self.assertEqual(lines[-2:], ["| 2      | 'xxxx… |", "-" * 19])
+
+    def test_column_relayout_without_paging(self):
+        """Write a new header when the layout changes mid-stream"""
+        items = [{"id": 1}, {"id": 123, "bar": 1}]
+        ostream = StringIO()
+        with patch.object(ColumnFormat, "sample_size", 1):
+            ColumnFormat(iter(items), ostream, width=80, pagesize=0).display()
+        lines = ostream.getvalue().splitlines()
+        self.assertEqual(
+            lines,
+            [
+                "------",
+                "| id |",
+                "------",
+                "| 1  |",
+                "------",
+                "-------------",
+                "|  id | bar |",
+                "-------------",
+                "| 123 | 1   |",
+                "-------------",
+            ],
+        )
+
+    def test_format_values_once(self):
+        """Each value is only formatted once"""
+        items = [{"id": str(i), "bar": i} for i in range(5)]
+        format_field = ColumnFormat.format_field
+        calls = []
+
+        def counting_format_field(fmt, field):
+            """Count the calls to format_field"""
+            calls.append(field)
+            return format_field(fmt, field)
+
+        with patch.object(ColumnFormat, "format_field", counting_format_field):
+            ColumnFormat(iter(items), StringIO(), width=80, pagesize=0).display()
+        self.assertEqual(len(calls), 10)
+
+    def test_smart_column(self):
+        """SmartFormat uses columns when the results fit"""
+        items = [{"id": i} for i in range(5)]
+        fmt = SmartFormat(iter(items), StringIO(), width=80, pagesize=0)
+        self.assertIsInstance(fmt._sub_formatter, ColumnFormat)
+
+    def test_smart_expanded(self):
+        """SmartFormat stops reading once the results are too wide"""
+        items = [{"id": i, "bar": "x" * 100} for i in range(5)]
+        fetched: List[Dict] = []
+        ostream = StringIO()
+        fmt = SmartFormat(
+            counting_results(items, fetched), ostream, width=80, pagesize=0
+        )
+        self.assertIsInstance(fmt._sub_formatter, ExpandedFormat)
+        self.assertEqual(len(fetched), 1)
+        fmt.display()
+        self.assertEqual(ostream.getvalue().count(" id : "), 5)
+
+    def test_json_lines(self):
+        """JsonLinesFormat writes one compact JSON object per line"""
+        items = [
+            {"id": "a", "num": Decimal("1.5"), "tags": set(["x"])},
+            {"id": "ü", "data": Binary(b"abc"), "raw": b"abc"},
+        ]
+        ostream = BytesIO()
+        JsonLinesFormat(iter(items), ostream, pagesize=1).display()
+        lines = ostream.getvalue().decode("utf-8").splitlines()
+        self.assertEqual(lines[0], '{"id":"a","num":1.5,"tags":["x"]}')
+        self.assertEqual(
+            json.loads(lines[1]), {"id": "ü", "data": "YWJj", "raw": "YWJj"}
+        )
+
+    def test_json_lines_exact_decimal(self):
+        """JsonLinesFormat can write Decimals as strings"""
+        ostream = BytesIO()
+        JsonLinesFormat(
+            iter([{"num": Decimal("0.1")}]), ostream, lossy_json_float=False
+        ).display()
+        self.assertEqual(ostream.getvalue(), b'{"num":"0.1"}\n')
+
+    def test_less_streams_output(self):
+        """Output is streamed to less as it is written"""
+        less = FakeLess(1000)
+        with patch("dql.output.subprocess.Popen", less):
+            with less_display() as ostream:
+                ostream.write("hello\n")
+                self.assertEqual(less.received.getvalue(), b"hello\n")
+        self.assertTrue(less.waited)
+
+    def test_less_quit_early(self):
+        """Stop fetching results when the user quits less"""
+        items = [{"id": i} for i in range(1000)]
+        fetched: List[Dict] = []
+        less = FakeLess(100)
+        with patch("dql.output.subprocess.Popen", less):
+            with less_display() as ostream:
+                JsonLinesFormat(counting_results(items, fetched), ostream).display()
+        self.assertLess(len(fetched), 100)
+        self.assertTrue(less.waited)
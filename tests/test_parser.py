@@ -290,6 +290,121 @@ TEST_CASES: Dict[str, List[Tuple[str, Union[str, List[Any]]]]] = {
         ("DUMP SCHEMA foobars, wibbles", ["DUMP", "SCHEMA", ["foobars", "wibbles"]]),
         ("DUMP SCHEMA foobars wibbles", "error"),
     ],
+    "max_capacity": [
+        (
+            "SCAN * FROM foobars MAX CAPACITY 10",
+            ["SCAN", ["*"], "FROM", "foobars", ["10"]],
+        ),
+        (
+            "SELECT * FROM foobars THROTTLE (1, *) MAX CAPACITY 10 SAVE out.json",
+            [
+                "SELECT",
+                ["*"],
+                "FROM",
+                "foobars",
+                ["THROTTLE", "1", "*"],
+                ["10"],
+                "out.json",
+            ],
+        ),
+        (
+            "UPDATE foobars SET foo = 1 MAX CAPACITY *, 5",
+            ["UPDATE", "foobars", ["foo", ["1"]], ["*", "5"]],
+        ),
+        (
+            "DELETE FROM foobars MAX CAPACITY 1.5, 2",
+            ["DELETE", "FROM", "foobars", ["1.5", "2"]],
+        ),
+        ("SCAN * FROM foobars MAX CAPACITY", "error"),
+    ],
+    "batch_transaction": [
+        (
+            "UPDATE foobars SET foo = 1 BATCH TRANSACTION 25",
+            ["UPDATE", "foobars", ["foo", ["1"]], "25"],
+        ),
+        (
+            "UPDATE foobars SET foo = 1 KEYS IN 'a', 'b' BATCH TRANSACTION 10 "
+            "CHECKPOINT update.ckpt",
+            [
+                "UPDATE",
+                "foobars",
+                ["foo", ["1"]],
+                [["'a'"], ["'b'"]],
+                "10",
+                "update.ckpt",
+            ],
+        ),
+        ("UPDATE foobars SET foo = 1 BATCH TRANSACTION", "error"),
+    ],
+    "checkpoint": [
+        (
+            "SCAN * FROM foobars SAVE out.json CHECKPOINT scan.ckpt",
+            ["SCAN", ["*"], "FROM", "foobars", "out.json", "scan.ckpt"],
+        ),
+        (
+            "UPDATE foobars SET foo = 1 MAX CAPACITY 10 CHECKPOINT 'update.ckpt'",
+            ["UPDATE", "foobars", ["foo", ["1"]], ["10"], "'update.ckpt'"],
+        ),
+        (
+            "DELETE FROM foobars KEYS IN 'a', 'b' CHECKPOINT delete.ckpt",
+            ["DELETE", "FROM", "foobars", [["'a'"], ["'b'"]], "delete.ckpt"],
+        ),
+        ("SCAN * FROM foobars CHECKPOINT scan.ckpt", "error"),
+        (
+            "UPDATE foobars SET foo = 1 RETURNS ALL NEW SAVE out.json",
+            [
+                "UPDATE",
+                "foobars",
+                ["foo", ["1"]],
+                "RETURNS",
+                ["ALL", "NEW"],
+                "out.json",
+            ],
+        ),
+    ],
+    "shards": [
+        (
+            "SCAN * FROM foobars SAVE 'out/part-*.json.gz' SHARDS 16",
+            ["SCAN", ["*"], "FROM", "foobars", "'out/part-*.json.gz'", "16"],
+        ),
+        ("SCAN * FROM foobars SHARDS 16", "error"),
+        ("SCAN * FROM foobars SAVE 'out/part-*.json' SHARDS", "error"),
+    ],
+    "aggregate": [
+        (
+            "SCAN foo, sum(bar) AS s FROM foobars GROUP BY foo",
+            [
+                "SCAN",
+                [[[["foo"]]], [["SUM", [["bar"]]], ["s"]]],
+                "FROM",
+                "foobars",
+                ["foo"],
+            ],
+        ),
+        (
+            "SCAN count(*) FROM foobars GROUP BY foo, bar PARALLEL 4",
+            ["SCAN", ["COUNT(*)"], "FROM", "foobars", ["foo", "bar"], "4"],
+        ),
+        (
+            "SCAN max(bar) FROM foobars PARALLEL 4",
+            ["SCAN", [[["MAX", [["bar"]]]]], "FROM", "foobars", "4"],
+        ),
+        ("SCAN foo FROM foobars GROUP BY", "error"),
+        ("SCAN max(bar) FROM foobars PARALLEL", "error"),
+        (
+            "SCAN count(*) FROM foobars SAMPLE 0.5 PERCENT",
+            ["SCAN", ["COUNT(*)"], "FROM", "foobars", "0.5"],
+        ),
+        ("SCAN count(*) FROM foobars SAMPLE 5", "error"),
+    ],
+    "load": [
+        ("LOAD out.p INTO foobars", ["LOAD", ["out.p"], "INTO", "foobars"]),
+        (
+            "LOAD exports/*.json.gz INTO foobars",
+            ["LOAD", ["exports/*.json.gz"], "INTO", "foobars"],
+        ),
+        ("LOAD 'out.p' INTO", "error"),
+    ],
     "multiple": [
         ("DUMP SCHEMA;DUMP SCHEMA", [["DUMP", "SCHEMA"], ["DUMP", "SCHEMA"]]),
         ("DUMP SCHEMA;\nDUMP SCHEMA", [["DUMP", "SCHEMA"], ["DUMP", "SCHEMA"]]),
@@ -378,6 +493,30 @@ class TestParser(TestCase):
         """Run tests for DUMP statements"""
         self._run_tests("dump")
 
+    def test_max_capacity(self):
+        """Run tests for MAX CAPACITY clauses"""
+        self._run_tests("max_capacity")
+
+    def test_checkpoint(self):
+        """Run tests for CHECKPOINT clauses"""
+        self._run_tests("checkpoint")
+
+    def test_batch_transaction(self):
+        """Run tests for BATCH TRANSACTION clauses"""
+        self._run_tests("batch_transaction")
+
+    def test_shards(self):
+        """Run tests for SHARDS clauses"""
+        self._run_tests("shards")
+
+    def test_aggregate(self):
+        """Run tests for aggregate functions"""
+        self._run_tests("aggregate")
+
+    def test_load(self):
+        """Run tests for LOAD statements"""
+        self._run_tests("load")
+
     def test_multiple_statements(self):
         """Run tests for multiple-line statements"""
         self._run_tests("multiple", parser)
@@ -511,6 +650,11 @@ SELECTION = [
     ("foo + 2", "(foo + 2)"),
     ("*", ""),
     ("count(*)", ""),
+    ("sum(foo)", "SUM(foo)"),
+    ("count(*) AS n", "COUNT(*) AS n"),
+    ("foo, avg(foo + bar) AS a", "foo AVG((foo + bar)) AS a"),
+    ("approx_count_distinct(foo)", "APPROX_COUNT_DISTINCT(foo)"),
+    ("approx_percentile(foo, 0.99) AS p", "APPROX_PERCENTILE(foo, 0.99) AS p"),
     ("timestamp(foo)", "TIMESTAMP(foo)"),
     ("utcts(foo - bar)", "UTCTIMESTAMP((foo - bar))"),
     ("now() - now()", "(NOW() - NOW())"),
@@ -1,15 +1,34 @@
 """ Tests for queries """
 
+import json
+import os
+import signal
+import tempfile
+import threading
 import time
+import unittest
 from datetime import datetime, timedelta
+from typing import List
+from unittest.mock import patch
 
-from dynamo3 import Binary, DynamoKey, GlobalIndex, Throughput
+from dateutil.tz import tzutc
+from dynamo3 import Binary, DynamoDBConnection, DynamoKey, GlobalIndex, Throughput
 from dynamo3.constants import NUMBER, STRING
 
+from dql.exceptions import (
+    CapacityExceeded,
+    EngineRuntimeError,
+    StatementInterrupted,
+)
 from dql.models import GlobalIndexMeta, IndexField, TableField
 
 from . import BaseSystemTest
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
 # pylint: disable=W0632
 
 
@@ -419,6 +438,34 @@ class TestSelect(BaseSystemTest):
         self.assertEqual(count, 2)
         self.assertEqual(count.scanned_count, 2)
 
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_to_columns(self):
+        """Collect query results into NumPy arrays"""
+        self.make_table()
+        self.query(
+            "INSERT INTO foobar (id, bar, baz, ts) VALUES "
+            "('a', 1, 'x', 1.5), ('a', 2, NULL, 2), ('a', 3, 'z', 'oops')"
+        )
+        columns = self.engine.to_columns(
+            "SELECT * FROM foobar WHERE id = 'a'", dtypes={"bar": "int32"}
+        )
+        self.assertEqual(columns["bar"].dtype, np.dtype("int32"))
+        self.assertEqual(columns["bar"].tolist(), [1, 2, 3])
+        self.assertEqual(columns["baz"].tolist(), ["x", None, "z"])
+        # Mixed types fall back to objects
+        self.assertEqual(columns["ts"].dtype, np.dtype(object))
+        self.assertEqual(columns["ts"].tolist(), [1.5, 2, "oops"])
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_to_columns_bad_dtype(self):
+        """Values that don't fit the requested dtype raise an error"""
+        self.make_table()
+        self.query("INSERT INTO foobar (id, bar) VALUES ('a', 1.5)")
+        with self.assertRaises(EngineRuntimeError):
+            self.engine.to_columns("SCAN * FROM foobar", dtypes={"bar": "int64"})
+        with self.assertRaises(EngineRuntimeError):
+            self.engine.to_columns("SELECT count(*) FROM foobar WHERE id = 'a'")
+
     def test_count_smart_index(self):
         """SELECT count(*) auto-selects correct index name"""
         self.make_table(index="ts")
@@ -520,6 +567,26 @@ class TestSelectScan(BaseSystemTest):
         self.query("INSERT INTO foobar (id, bar) VALUES ('a', 1), ('b', 2)")
         self._run("* FROM foobar", [{"id": "a", "bar": 1}, {"id": "b", "bar": 2}])
 
+    def test_decode_workers(self):
+        """The results of a scan can be decoded on a pool of processes"""
+        self.make_table()
+        self.query(
+            "INSERT INTO foobar (id, bar, tags) VALUES "
+            + ", ".join("('k%d', %d, ('a', 'b'))" % (i, i) for i in range(10))
+        )
+        query = "SCAN id, bar, bar + 1 AS next, tags FROM foobar ORDER BY bar DESC"
+        expected = list(self.query(query))
+        self.engine.decode_workers = 2
+        with patch("dql.decode.DECODE_BATCH_SIZE", 3):
+            self.assertEqual(list(self.query(query)), expected)
+            pool = self.engine._decode_pool
+            self.assertEqual(list(self.query(query)), expected)
+        # The statements share the pool
+        self.assertIs(self.engine._decode_pool, pool)
+        self.assertEqual(self.query("SCAN count(*) FROM foobar"), 10)
+        self.engine.close()
+        self.assertIsNone(self.engine._decode_pool)
+
     def test_filter(self):
         """SELECT scan can filter results"""
         self.make_table()
@@ -538,6 +605,38 @@ class TestSelectScan(BaseSystemTest):
         self.query("INSERT INTO foobar (id, bar) VALUES ('a', 1), ('b', 2)")
         self._run("* FROM foobar SCAN LIMIT 1", 1)
 
+    def test_max_capacity(self):
+        """SCAN stops before fetching another page once over MAX CAPACITY"""
+        self.make_table()
+        self.query(
+            "INSERT INTO foobar (id, bar) VALUES "
+            + ", ".join("('a', %d)" % i for i in range(30))
+        )
+        with self.assertRaises(CapacityExceeded) as ctx:
+            list(
+                self.query("SCAN * FROM foobar WHERE bar < 0 LIMIT 2 MAX CAPACITY 0.1")
+            )
+        self.assertIsNotNone(ctx.exception.last_key)
+
+    def test_max_capacity_new_connection(self):
+        """MAX CAPACITY still works after the connection is replaced"""
+        self.make_table()
+        self.query(
+            "INSERT INTO foobar (id, bar) VALUES "
+            + ", ".join("('a', %d)" % i for i in range(30))
+        )
+        self.engine.connection = DynamoDBConnection.connect(
+            region="us-east-1", host="localhost", port=8000, is_secure=False
+        )
+        with self.assertRaises(CapacityExceeded):
+            list(
+                self.query("SCAN * FROM foobar WHERE bar < 0 LIMIT 2 MAX CAPACITY 0.1")
+            )
+        # The old connection no longer calls the engine's hooks
+        hooks = self.dynamo._hooks  # pylint: disable=W0212
+        self.assertNotIn(self.engine._on_precall, hooks["precall"])
+        self.assertNotIn(self.engine._on_capacity_data, hooks["capacity"])
+
     def test_begins_with(self):
         """SELECT scan can filter attrs that begin with a string"""
         self.query("CREATE TABLE foobar (id NUMBER HASH KEY, bar STRING RANGE KEY)")
@@ -719,6 +818,16 @@ class TestSelectScan(BaseSystemTest):
         ret = list(self.query("SCAN bar + baz as ret FROM foobar"))[0]
         self.assertTrue(isinstance(ret["ret"], TypeError))
 
+    def test_select_nested_fields(self):
+        """SELECT can pull values out of maps"""
+        self.make_table(range_key=None)
+        self.query("INSERT INTO foobar (id='a', bar={'b': 1})")
+        self.engine.reserved_words = None
+        self._run(
+            "id, bar.b, bar.missing FROM foobar",
+            [{"id": "a", "bar.b": 1, "bar.missing": None}],
+        )
+
     def test_nested_operation(self):
         """SELECT can perform nested operations"""
         self.make_table(range_key=None)
@@ -746,6 +855,25 @@ class TestSelectScan(BaseSystemTest):
         ret = list(self.query("SCAN ts('2015-12-5') as d FROM foobar"))[0]
         self.assertTrue(isinstance(ret["d"], datetime))
 
+    def test_select_timestamp_strings(self):
+        """SELECT can parse ISO 8601 and other timestamp strings"""
+        self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, bar) VALUES ('a', '2015-12-05T10:30:00Z'), "
+            "('b', '2015-12-05 10:30:00.5'), ('c', 'Dec 5 2015 10:30AM'), "
+            "('d', '2015-12-05T10:30:00Z')"
+        )
+        ret = list(self.query("SCAN id, utcts(bar) as bar FROM foobar"))
+        self.assertCountEqual(
+            [item["bar"] for item in ret],
+            [
+                datetime(2015, 12, 5, 10, 30, tzinfo=tzutc()),
+                datetime(2015, 12, 5, 10, 30, 0, 500000, tzinfo=tzutc()),
+                datetime(2015, 12, 5, 10, 30, tzinfo=tzutc()),
+                datetime(2015, 12, 5, 10, 30, tzinfo=tzutc()),
+            ],
+        )
+
     def test_select_now(self):
         """SELECT can get the current time"""
         self.make_table(range_key=None)
@@ -760,6 +888,248 @@ class TestSelectScan(BaseSystemTest):
         ret = list(self.query("SCAN now() - ts(bar) as d FROM foobar"))[0]
         self.assertTrue(isinstance(ret["d"], timedelta))
 
+    def _make_sales(self):
+        """Create a table with some items to aggregate"""
+        self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, shop, price) VALUES "
+            "('a', 'x', 1), ('b', 'x', 3), ('c', 'y', 5), ('d', 'y', 'free'), "
+            "('e', 'z', 2)"
+        )
+
+    def test_aggregate(self):
+        """SELECT can compute aggregate functions over all items"""
+        self._make_sales()
+        self._run(
+            "count(*) AS n, sum(price), avg(price) AS avg, min(id), "
+            "max(price - 1) AS m FROM foobar WHERE shop <> 'z'",
+            [
+                {
+                    "n": 4,
+                    "SUM(price)": 9,
+                    "avg": 3,
+                    "MIN(id)": "a",
+                    "m": 4,
+                }
+            ],
+        )
+
+    def test_aggregate_no_items(self):
+        """Aggregate functions with no GROUP BY always return one row"""
+        self.make_table(range_key=None)
+        self._run("count(*) AS n, sum(price) AS s FROM foobar", [{"n": 0, "s": None}])
+
+    def test_group_by(self):
+        """SELECT can compute aggregate functions for each group"""
+        self._make_sales()
+        self._run(
+            "shop, count(price) AS n, sum(price) AS s FROM foobar GROUP BY shop",
+            [
+                {"shop": "x", "n": 2, "s": 4},
+                {"shop": "y", "n": 2, "s": 5},
+                {"shop": "z", "n": 1, "s": 2},
+            ],
+        )
+
+    def test_group_by_order(self):
+        """Groups can be sorted with ORDER BY"""
+        self._make_sales()
+        ret = self.query(
+            "SCAN shop, min(id) AS m FROM foobar GROUP BY shop ORDER BY m DESC"
+        )
+        self.assertEqual([r["shop"] for r in ret], ["z", "y", "x"])
+
+    def test_group_by_order_missing(self):
+        """Groups with no value to sort by go last"""
+        self._make_sales()
+        self.query("INSERT INTO foobar (id, shop, price) VALUES ('f', 'w', 'free')")
+        query = "SCAN shop, sum(price) AS s FROM foobar GROUP BY shop ORDER BY s"
+        ret = self.query(query)
+        self.assertEqual([r["shop"] for r in ret], ["z", "x", "y", "w"])
+        ret = self.query(query + " DESC")
+        self.assertEqual([r["shop"] for r in ret], ["y", "x", "z", "w"])
+
+    def test_count_group_by(self):
+        """COUNT(*) with GROUP BY counts the items in each group"""
+        self._make_sales()
+        self._run(
+            "count(*) FROM foobar GROUP BY shop",
+            [
+                {"shop": "x", "COUNT(*)": 2},
+                {"shop": "y", "COUNT(*)": 2},
+                {"shop": "z", "COUNT(*)": 1},
+            ],
+        )
+
+    def test_group_by_spill(self):
+        """Groups are spilled to disk when there are too many of them"""
+        self._make_sales()
+        query = "SCAN id, sum(price) AS s FROM foobar GROUP BY id"
+        expected = list(self.query(query))
+        with patch("dql.aggregate.MAX_GROUPS", 2):
+            self.assertCountEqual(list(self.query(query)), expected)
+        self.assertEqual(len(expected), 5)
+
+    def test_aggregate_parallel(self):
+        """Aggregate functions can scan segments of the table in parallel"""
+        self._make_sales()
+        query = "SCAN shop, sum(price) AS s, count(*) AS n FROM foobar GROUP BY shop"
+        expected = list(self.query(query))
+        self.assertCountEqual(list(self.query(query + " PARALLEL 3")), expected)
+
+    def test_approx_count_distinct(self):
+        """APPROX_COUNT_DISTINCT estimates the number of distinct values"""
+        self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, user, n) VALUES "
+            + ", ".join("('k%d', 'u%d', %d)" % (i, i % 37, i % 5) for i in range(200))
+        )
+        self._run(
+            "approx_count_distinct(user) AS users, approx_count_distinct(n) AS n "
+            "FROM foobar",
+            [{"users": 37, "n": 5}],
+        )
+        ret = self.query(
+            "SCAN approx_count_distinct(user) AS users FROM foobar PARALLEL 4"
+        )
+        self.assertEqual(list(ret), [{"users": 37}])
+
+    def test_approx_percentile(self):
+        """APPROX_PERCENTILE estimates a percentile of the values"""
+        self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, n, shop) VALUES "
+            + ", ".join("('k%d', %d, 's%d')" % (i, i, i % 2) for i in range(1, 201))
+        )
+        for query in [
+            "SCAN approx_percentile(n, 0.5) AS p50, approx_percentile(n, 0.99) "
+            "AS p99, approx_percentile(n, 1) AS max FROM foobar",
+            "SCAN approx_percentile(n, 0.5) AS p50, approx_percentile(n, 0.99) "
+            "AS p99, approx_percentile(n, 1) AS max FROM foobar PARALLEL 3",
+        ]:
+            ret = list(self.query(query))[0]
+            self.assertAlmostEqual(ret["p50"], 100, delta=2)
+            self.assertAlmostEqual(ret["p99"], 198, delta=2)
+            self.assertEqual(ret["max"], 200)
+
+    def test_count_parallel(self):
+        """COUNT(*) can scan segments of the table in parallel"""
+        self._make_sales()
+        ret = self.query("SCAN count(*) FROM foobar WHERE shop <> 'z' PARALLEL 4")
+        self.assertEqual(ret, 4)
+        self.assertEqual(ret.scanned_count, 5)
+
+    def test_count_parallel_error(self):
+        """A failed segment of a parallel COUNT(*) stops the others"""
+        self._make_sales()
+        stopped: List[int] = []
+
+        def scan(*args, **kwargs):
+            """Fail the last segment while the first one is still running"""
+            if kwargs["segment"] == 1:
+                raise EngineRuntimeError("Segment failed")
+            time.sleep(0.5)
+            try:
+                return original(*args, **kwargs)
+            except StatementInterrupted:
+                stopped.append(kwargs["segment"])
+                raise
+
+        original = self.engine.connection.scan
+        with patch.object(self.engine.connection, "scan", scan):
+            with self.assertRaisesRegex(EngineRuntimeError, "Segment failed"):
+                self.query("SCAN count(*) FROM foobar PARALLEL 2")
+        self.assertEqual(stopped, [0])
+        # The hooks are removed afterwards
+        self.assertEqual(self.query("SCAN count(*) FROM foobar"), 5)
+
+    def test_count_sample(self):
+        """SAMPLE estimates a COUNT(*) from some of the segments"""
+        self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, bar) VALUES "
+            + ", ".join("('k%d', %d)" % (i, i % 4) for i in range(100))
+        )
+        ret = self.query("SCAN count(*) FROM foobar WHERE bar = 1 SAMPLE 100 PERCENT")
+        self.assertEqual((ret, ret.low, ret.high, ret.fraction), (25, 25, 25, 1))
+        ret = self.query("SCAN count(*) FROM foobar WHERE bar = 1 SAMPLE 25 PERCENT")
+        self.assertEqual(ret.fraction, 0.25)
+        self.assertLessEqual(ret.count, ret.low)
+        self.assertLessEqual(ret.low, ret)
+        self.assertLessEqual(ret, ret.high)
+
+    def test_count_sample_format(self):
+        """Sampled counts are displayed with their confidence interval"""
+        self.make_table(range_key=None)
+        self.query("INSERT INTO foobar (id, bar) VALUES ('a', 1), ('b', 2)")
+        ret = self.engine.execute(
+            "SCAN count(*) FROM foobar SAMPLE 100 PERCENT", pretty_format=True
+        )
+        self.assertEqual(ret, "~2 (95% confidence: 2 - 2, sampled 100% of table)")
+
+    def test_aggregate_parallel_error(self):
+        """A failed segment of a parallel aggregate stops the others"""
+        self._make_sales()
+        yielded = []
+
+        def scan(*args, **kwargs):
+            """Fail the last segment while the first one is still running"""
+            if kwargs["segment"] == 1:
+                raise EngineRuntimeError("Segment failed")
+            return slow_items()
+
+        def slow_items():
+            """Generate items slowly"""
+            for i in range(100):
+                yielded.append(i)
+                time.sleep(0.01)
+                yield {"id": "k%d" % i, "price": i}
+
+        def spill_dirs():
+            """The temporary directories that groups are spilled to"""
+            return {
+                name
+                for name in os.listdir(tempfile.gettempdir())
+                if name.startswith("dql-groups-")
+            }
+
+        before = spill_dirs()
+        with patch.object(self.engine.connection, "scan", scan), patch(
+            "dql.aggregate.MAX_GROUPS", 1
+        ):
+            with self.assertRaisesRegex(EngineRuntimeError, "Segment failed"):
+                self.query("SCAN id, sum(price) FROM foobar GROUP BY id PARALLEL 2")
+        self.assertLess(len(yielded), 100)
+        # The spill files of the other segments are removed
+        self.assertEqual(spill_dirs(), before)
+
+    def test_aggregate_errors(self):
+        """Aggregate functions cannot be used with some clauses"""
+        self._make_sales()
+        for query in [
+            "SCAN sum(price) FROM foobar LIMIT 2",
+            "SCAN sum(price) FROM foobar SAVE out.json",
+            "SCAN id, sum(price) FROM foobar GROUP BY shop",
+            "SCAN id FROM foobar GROUP BY shop",
+            "SCAN * FROM foobar GROUP BY shop",
+            "SCAN sum(*) FROM foobar",
+            "SCAN sum(price, 2) FROM foobar",
+            "SCAN approx_percentile(price) FROM foobar",
+            "SCAN approx_percentile(price, 1.5) FROM foobar",
+            "SCAN id FROM foobar PARALLEL 2",
+            "SCAN count(*) AS n FROM foobar PARALLEL 0",
+            "SELECT count(*) FROM foobar WHERE id = 'a' PARALLEL 2",
+            "SCAN id FROM foobar SAMPLE 10 PERCENT",
+            "SCAN count(*) FROM foobar SAMPLE 0 PERCENT",
+            "SCAN count(*) FROM foobar SAMPLE 101 PERCENT",
+            "SCAN count(*) FROM foobar PARALLEL 2 SAMPLE 10 PERCENT",
+            "SELECT count(*) FROM foobar WHERE id = 'a' SAMPLE 10 PERCENT",
+        ]:
+            with self.assertRaises(SyntaxError):
+                self.query(query)
+        with self.assertRaises(EngineRuntimeError):
+            self.query("SCAN max(price) FROM foobar")
+
 
 class TestCreate(BaseSystemTest):
     """Tests for CREATE"""
@@ -957,6 +1327,79 @@ class TestUpdate(BaseSystemTest):
         ret = self.query("UPDATE foobar SET baz = 3 KEYS IN ('a', 1), ('b', 2)")
         self.assertEqual(ret, 2)
 
+    def test_update_max_capacity(self):
+        """UPDATE aborts once it has consumed its MAX CAPACITY"""
+        table = self.make_table()
+        self.query("INSERT INTO foobar (id, bar, baz) VALUES ('a', 1, 1), ('b', 2, 2)")
+        with self.assertRaises(CapacityExceeded) as ctx:
+            self.query("UPDATE foobar SET baz = 3 MAX CAPACITY 0.1")
+        self.assertEqual(ctx.exception.processed, 0)
+        items = list(self.dynamo.scan(table))
+        self.assertCountEqual(
+            items, [{"id": "a", "bar": 1, "baz": 1}, {"id": "b", "bar": 2, "baz": 2}]
+        )
+
+    def test_update_interrupt(self):
+        """Ctrl-C during UPDATE cancels the queued requests"""
+        self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, baz) VALUES "
+            + ", ".join("('%02d', 1)" % i for i in range(30))
+        )
+        calls: List[str] = []
+        lock = threading.Lock()
+
+        def slow_update(conn, command, kwargs):
+            """Send a SIGINT once all the workers are busy"""
+            if command != "update_item":
+                return
+            with lock:
+                first = not calls
+                calls.append(command)
+            time.sleep(0.2)
+            if first:
+                os.kill(os.getpid(), signal.SIGINT)
+            time.sleep(0.3)
+
+        self.dynamo.subscribe("precall", slow_update)
+        handler = signal.signal(signal.SIGINT, signal.default_int_handler)
+        try:
+            with self.assertRaises(StatementInterrupted) as ctx:
+                self.query("UPDATE foobar SET baz = 2")
+        finally:
+            signal.signal(signal.SIGINT, handler)
+            self.dynamo.unsubscribe("precall", slow_update)
+        # Only the requests that were in flight (one per worker) should finish
+        self.assertEqual(ctx.exception.processed, 20)
+        self.assertEqual(len(calls), 20)
+        self.assertIsNotNone(ctx.exception.last_key)
+
+    def test_update_resume_from_checkpoint(self):
+        """UPDATE with a CHECKPOINT skips the items that were already updated"""
+        table = self.make_table(range_key=None)
+        self.query("INSERT INTO foobar (id, baz) VALUES ('a', 1), ('b', 2), ('c', 3)")
+        items = list(self.dynamo.scan(table))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = os.path.join(tmpdir, "update.ckpt")
+            command = "UPDATE foobar SET baz = 0 CHECKPOINT %s" % checkpoint
+            self.write_checkpoint(command, checkpoint, {"id": items[0]["id"]}, 1)
+            ret = self.query(command)
+            self.assertEqual(ret, 3)
+            self.assertFalse(os.path.exists(checkpoint))
+        updated = list(self.dynamo.scan(table))
+        self.assertEqual(updated[0], items[0])
+        self.assertEqual([item["baz"] for item in updated[1:]], [0, 0])
+
+    def test_update_checkpoint_mismatch(self):
+        """Can't resume a CHECKPOINT with a different statement"""
+        self.make_table()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = os.path.join(tmpdir, "update.ckpt")
+            command = "UPDATE foobar SET baz = 0 CHECKPOINT %s" % checkpoint
+            self.write_checkpoint(command, checkpoint, {"id": "a", "bar": 1}, 1)
+            with self.assertRaises(EngineRuntimeError):
+                self.query("UPDATE foobar SET baz = 1 CHECKPOINT %s" % checkpoint)
+
     def test_update_increment(self):
         """UPDATE can increment attributes"""
         table = self.make_table()
@@ -1002,6 +1445,126 @@ class TestUpdate(BaseSystemTest):
         items = list(result)
         self.assertCountEqual(items, [{"id": "a", "bar": 1}, {"id": "b", "bar": 2}])
 
+    def test_update_returns_not_read(self):
+        """UPDATE with RETURNS runs even if the results aren't read"""
+        table = self.make_table()
+        self.query("INSERT INTO foobar (id, bar, baz) VALUES ('a', 1, 1), ('b', 2, 2)")
+        self.query("UPDATE foobar REMOVE baz RETURNS ALL NEW")
+        items = list(self.dynamo.scan(table))
+        self.assertCountEqual(items, [{"id": "a", "bar": 1}, {"id": "b", "bar": 2}])
+
+    def test_update_returns_stream(self):
+        """UPDATE with RETURNS can stream the results as the updates run"""
+        table = self.make_table()
+        self.query("INSERT INTO foobar (id, bar, baz) VALUES ('a', 1, 1), ('b', 2, 2)")
+        result = self.engine.execute(
+            "UPDATE foobar REMOVE baz RETURNS ALL NEW", stream=True
+        )
+        # Nothing has been updated yet
+        items = list(self.dynamo.scan(table))
+        self.assertCountEqual(
+            items, [{"id": "a", "bar": 1, "baz": 1}, {"id": "b", "bar": 2, "baz": 2}]
+        )
+        items = list(result)
+        self.assertCountEqual(items, [{"id": "a", "bar": 1}, {"id": "b", "bar": 2}])
+
+    def test_update_returns_multiple_statements(self):
+        """UPDATE with RETURNS runs even if it isn't the last statement"""
+        table = self.make_table()
+        self.query("INSERT INTO foobar (id, bar, baz) VALUES ('a', 1, 1), ('b', 2, 2)")
+        self.query("UPDATE foobar REMOVE baz RETURNS ALL NEW; SCAN * FROM foobar")
+        items = list(self.dynamo.scan(table))
+        self.assertCountEqual(items, [{"id": "a", "bar": 1}, {"id": "b", "bar": 2}])
+
+    def test_select_not_drained(self):
+        """Only UPDATE results are read when they aren't from the last statement"""
+        self.make_table()
+        read = []
+
+        def select(*_):
+            read.append(True)
+            yield {}
+
+        with patch.object(self.engine, "_select", select):
+            self.query("SELECT * FROM foobar WHERE id = 'a'; SCAN * FROM foobar")
+        self.assertEqual(read, [])
+
+    def test_update_returns_save_caution(self):
+        """UPDATE with SAVE does nothing if the caution_callback says no"""
+        self.make_table()
+        self.query("INSERT INTO foobar (id, bar, baz) VALUES ('a', 1, 1)")
+        self.engine.caution_callback = lambda _: False
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "out.json")
+            ret = self.query(
+                "UPDATE foobar SET baz = 3 RETURNS ALL NEW SAVE %s" % filename
+            )
+            self.assertIs(ret, False)
+            self.assertFalse(os.path.exists(filename))
+
+    def test_update_returns_save(self):
+        """UPDATE can save the returned items to a file"""
+        self.make_table()
+        self.query("INSERT INTO foobar (id, bar, baz) VALUES ('a', 1, 1), ('b', 2, 2)")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "out.json")
+            count = self.query(
+                "UPDATE foobar SET baz = 3 RETURNS UPDATED NEW SAVE %s" % filename
+            )
+            self.assertEqual(count, 2)
+            with open(filename, "r", encoding="utf-8") as ifile:
+                items = [json.loads(line) for line in ifile]
+        self.assertEqual(items, [{"baz": 3}, {"baz": 3}])
+
+    def test_update_save_requires_returns(self):
+        """UPDATE with SAVE must have RETURNS"""
+        self.make_table()
+        with self.assertRaises(SyntaxError):
+            self.query("UPDATE foobar SET baz = 3 SAVE out.json")
+
+    def test_update_batch_transaction(self):
+        """UPDATE can write items in transactions"""
+        table = self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, bar) VALUES "
+            + ", ".join("('%02d', %d)" % (i, i % 2) for i in range(7))
+        )
+        ret = self.query("UPDATE foobar SET baz = 3 BATCH TRANSACTION 3")
+        self.assertEqual(ret, 7)
+        items = list(self.dynamo.scan(table))
+        self.assertEqual(len(items), 7)
+        self.assertTrue(all(item["baz"] == 3 for item in items))
+
+    def test_update_batch_transaction_where(self):
+        """Items that fail the condition are skipped in a transaction"""
+        table = self.make_table(range_key=None)
+        self.query(
+            "INSERT INTO foobar (id, bar) VALUES "
+            + ", ".join("('%02d', %d)" % (i, i % 2) for i in range(7))
+        )
+        ret = self.query(
+            "UPDATE foobar SET baz = 3 KEYS IN "
+            + ", ".join("('%02d')" % i for i in range(7))
+            + " WHERE bar = 1 BATCH TRANSACTION 4"
+        )
+        self.assertEqual(ret, 3)
+        items = list(self.dynamo.scan(table))
+        for item in items:
+            self.assertEqual(item.get("baz"), 3 if item["bar"] else None)
+
+    def test_update_batch_transaction_returns(self):
+        """UPDATE with BATCH TRANSACTION cannot use RETURNS"""
+        self.make_table()
+        with self.assertRaises(SyntaxError):
+            self.query("UPDATE foobar SET baz = 3 RETURNS ALL NEW BATCH TRANSACTION 5")
+
+    def test_update_batch_transaction_size(self):
+        """BATCH TRANSACTION must be an integer between 2 and 100"""
+        self.make_table()
+        for size in ("1", "101", "2.5", "-3"):
+            with self.assertRaises(SyntaxError):
+                self.query("UPDATE foobar SET baz = 3 BATCH TRANSACTION %s" % size)
+
     def test_update_soft(self):
         """UPDATE can set a field if it doesn't exist"""
         table = self.make_table(range_key=None)
@@ -1,11 +1,45 @@
 """ Tests for saving data to files """
 
+import gzip
+import json
 import os
+import pickle
 import shutil
 import tempfile
+import unittest
+from decimal import Decimal
+from typing import Dict, List
+from unittest.mock import patch
+
+from dynamo3 import Binary
+
+from dql.columnar import ColumnarWriter
+from dql.compress import ParallelCompressor, open_compressed
+from dql.exceptions import EngineRuntimeError
+from dql.framed import (
+    MAGIC,
+    _read_index,
+    decode_block,
+    iter_block_payloads,
+    open_block_file,
+)
+from dql.raw import write_raw_items
+from dql.shards import MANIFEST_FILE
+from dql.util import open_file_smart_mode
 
 from . import BaseSystemTest
 
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+try:
+    import lz4
+    import zstandard
+except ImportError:  # pragma: no cover
+    lz4 = zstandard = None  # type: ignore
+
 # pylint: disable=W0632
 
 
@@ -39,3 +73,489 @@ class TestSave(BaseSystemTest):
             res2 = list(self.query("SCAN * FROM destination"))
             self.assertCountEqual(res2, res1)
             self.query("DELETE FROM destination")
+
+    @unittest.skipIf(
+        zstandard is None or lz4 is None, "zstandard and lz4 are not installed"
+    )
+    def test_compressed_formats(self):
+        """Can save and load zstd and lz4 files"""
+        for fmt in ["p.zst", "json.zst", "p.lz4", "csv.lz4"]:
+            filename = self._save("out.%s" % fmt)
+            self.query("LOAD %s INTO destination" % filename)
+            res1 = list(self.query("SCAN * FROM foobar"))
+            res2 = list(self.query("SCAN * FROM destination"))
+            self.assertCountEqual(res2, res1)
+            self.query("DELETE FROM destination")
+
+    def test_parallel_gzip(self):
+        """Blocks are compressed in parallel as separate gzip members"""
+        filename = os.path.join(self.tmpdir, "out.gz")
+        data = b"".join(b"line %d\n" % i for i in range(10000))
+        with ParallelCompressor(
+            open(filename, "wb"), gzip.compress, block_size=1000, workers=4
+        ) as ofile:
+            for i in range(0, len(data), 700):
+                ofile.write(data[i : i + 700])
+            self.assertEqual(ofile.tell(), len(data))
+        with open(filename, "rb") as ifile:
+            compressed = ifile.read()
+        self.assertGreater(compressed.count(b"\x1f\x8b\x08"), 1)
+        self.assertEqual(gzip.decompress(compressed), data)
+        with open_compressed(filename, "gzip") as ifile:
+            self.assertEqual(ifile.read(), data)
+
+    def test_resume_from_checkpoint(self):
+        """SAVE with a CHECKPOINT resumes where the last run left off"""
+        for fmt in ["json", "json.gz"]:
+            filename = self._save("out.%s" % fmt)
+            with open_file_smart_mode(filename) as ifile:
+                lines = ifile.readlines()
+            checkpoint = os.path.join(self.tmpdir, "save.ckpt")
+            command = "SCAN * FROM foobar SAVE %s CHECKPOINT %s" % (
+                filename,
+                checkpoint,
+            )
+            self.write_checkpoint(
+                command,
+                checkpoint,
+                {"id": json.loads(lines[0])["id"]},
+                1,
+                len(lines[0]),
+            )
+            # Simulate a partial write after the checkpoint
+            with open_file_smart_mode(filename, True, True) as ofile:
+                ofile.write('{"id": "garbage"}\n')
+            count = self.query(command)
+            self.assertEqual(count, 2)
+            with open_file_smart_mode(filename) as ifile:
+                self.assertEqual(ifile.readlines(), lines)
+            self.assertFalse(os.path.exists(checkpoint))
+
+    def _read_blocks(self, filename: str) -> List[List[Dict]]:
+        """Read the items in each block of a binary file"""
+        with iter_block_payloads(filename) as blocks:
+            return [decode_block(payload) for payload, _ in blocks]
+
+    def test_binary_format(self):
+        """The default format is lossless"""
+        self.query(
+            "INSERT INTO foobar (id, data, tags, nums, meta) VALUES "
+            "('c', b'abc', ('a', 'b'), (1, 2.5), {'n': 1.5, 'l': [1, null, 'x']})"
+        )
+        for fmt in ["p", "p.gz"]:
+            filename = self._save("out.%s" % fmt)
+            with open_file_smart_mode(filename) as ifile:
+                self.assertEqual(ifile.read(len(MAGIC)), MAGIC)
+            res1 = list(self.query("SCAN * FROM foobar"))
+            self.assertCountEqual(sum(self._read_blocks(filename), []), res1)
+            self.query("LOAD %s INTO destination" % filename)
+            res2 = list(self.query("SCAN * FROM destination"))
+            self.assertCountEqual(res2, res1)
+            self.query("DELETE FROM destination")
+
+    def test_binary_blocks(self):
+        """LOAD writes the blocks of a binary file in parallel"""
+        filename = os.path.join(self.tmpdir, "out.p")
+        items = [{"id": str(i), "n": Decimal(i)} for i in range(100)]
+        with patch("dql.framed.BLOCK_SIZE", 100):
+            with open_block_file(filename) as writer:
+                for item in items:
+                    writer.write(item)
+        with open(filename, "rb") as ifile:
+            index = _read_index(ifile.read())
+        assert index is not None
+        self.assertGreater(len(index), 1)
+        self.assertEqual(sum(count for _, _, count in index), 100)
+        self.assertEqual(self.query("LOAD %s INTO destination" % filename), 100)
+        self.assertCountEqual(self.query("SCAN * FROM destination"), items)
+
+    def test_binary_without_index(self):
+        """A binary file that was never closed can still be loaded"""
+        filename = self._save("out.p")
+        with open(filename, "rb") as ifile:
+            data = ifile.read()
+        with open(filename, "wb") as ofile:
+            ofile.write(data[: data.rindex(b"X")])
+        self.assertEqual(self.query("LOAD %s INTO destination" % filename), 2)
+
+    def test_binary_resume_from_checkpoint(self):
+        """SAVE with a CHECKPOINT can resume a binary file"""
+        for fmt in ["p", "p.gz"]:
+            filename = self._save("out.%s" % fmt)
+            items = sum(self._read_blocks(filename), [])
+            with open_block_file(filename) as writer:
+                writer.write(items[0])
+                writer.flush()
+                offset = writer.tell()
+                # Simulate a partial write after the checkpoint
+                writer.write({"id": "garbage"})
+            checkpoint = os.path.join(self.tmpdir, "save.ckpt")
+            command = "SCAN * FROM foobar SAVE %s CHECKPOINT %s" % (
+                filename,
+                checkpoint,
+            )
+            self.write_checkpoint(
+                command, checkpoint, {"id": items[0]["id"]}, 1, offset
+            )
+            self.assertEqual(self.query(command), 2)
+            self.assertEqual(self._read_blocks(filename), [items[:1], items[1:]])
+            self.query("LOAD %s INTO destination" % filename)
+            self.assertCountEqual(self.query("SCAN * FROM destination"), items)
+            self.query("DELETE FROM destination")
+
+    def _write_pickle(self, filename):
+        """Write a file the way older versions saved them"""
+        with open(filename, "wb") as ofile:
+            pickle.dump({"id": "a"}, ofile)
+            pickle.dump({"id": "b"}, ofile)
+
+    def test_load_pickle(self):
+        """Can LOAD files that were pickled by older versions with '.pickle'"""
+        filename = os.path.join(self.tmpdir, "out.pickle")
+        self._write_pickle(filename)
+        self.assertEqual(self.query("LOAD %s INTO destination" % filename), 2)
+
+    def test_load_pickle_not_opted_in(self):
+        """Pickled files aren't loaded unless they end in '.pickle'"""
+        filename = os.path.join(self.tmpdir, "out.p")
+        self._write_pickle(filename)
+        with self.assertRaises(EngineRuntimeError):
+            self.query("LOAD %s INTO destination" % filename)
+        other = os.path.join(self.tmpdir, "other.p")
+        self._write_pickle(other)
+        with self.assertRaises(EngineRuntimeError):
+            self.query("LOAD '%s' INTO destination" % os.path.join(self.tmpdir, "*.p"))
+        self.assertEqual(list(self.query("SCAN * FROM destination")), [])
+
+    def _read_manifest(self, dirname):
+        """Read the manifest of a sharded SAVE"""
+        with open(os.path.join(dirname, MANIFEST_FILE), encoding="utf-8") as ifile:
+            return json.load(ifile)
+
+    def test_sharded_save(self):
+        """SAVE with SHARDS writes a file for each scan segment"""
+        self.query(
+            "INSERT INTO foobar (id, foo) VALUES "
+            + ", ".join("('k%d', %d)" % (i, i) for i in range(20))
+        )
+        for fmt in ["json.gz", "p"]:
+            dirname = os.path.join(self.tmpdir, fmt)
+            pattern = os.path.join(dirname, "part-*.%s" % fmt)
+            count = self.query("SCAN * FROM foobar SAVE '%s' SHARDS 4" % pattern)
+            self.assertEqual(count, 22)
+            manifest = self._read_manifest(dirname)
+            self.assertEqual(manifest["count"], 22)
+            self.assertTrue(manifest["complete"])
+            self.assertEqual(
+                [shard["file"] for shard in manifest["shards"]],
+                ["part-0000%d.%s" % (i, fmt) for i in range(4)],
+            )
+            for shard in manifest["shards"]:
+                filename = os.path.join(dirname, shard["file"])
+                self.assertEqual(shard["bytes"], os.path.getsize(filename))
+                loaded = self.query("LOAD %s INTO destination" % filename)
+                self.assertEqual(loaded, shard["count"])
+            res1 = list(self.query("SCAN * FROM foobar"))
+            res2 = list(self.query("SCAN * FROM destination"))
+            self.assertCountEqual(res2, res1)
+            self.query("DELETE FROM destination")
+
+    def test_sharded_save_decode_workers(self):
+        """SAVE with SHARDS can decode the segments on a pool of processes"""
+        self.engine.decode_workers = 2
+        pattern = os.path.join(self.tmpdir, "part-*.json")
+        self.assertEqual(
+            self.query("SCAN * FROM foobar SAVE '%s' SHARDS 2" % pattern), 2
+        )
+        self.assertEqual(self.query("LOAD %s INTO destination" % self.tmpdir), 2)
+        res1 = list(self.query("SCAN * FROM foobar"))
+        res2 = list(self.query("SCAN * FROM destination"))
+        self.assertCountEqual(res2, res1)
+
+    def test_sharded_save_csv(self):
+        """SAVE to CSV with SHARDS writes the header and types of each shard"""
+        dirname = os.path.join(self.tmpdir, "out")
+        pattern = os.path.join(dirname, "part-*.csv")
+        self.assertEqual(
+            self.query("SCAN id, foo FROM foobar SAVE '%s' SHARDS 2" % pattern), 2
+        )
+        for shard in self._read_manifest(dirname)["shards"]:
+            filename = os.path.join(dirname, shard["file"])
+            with open(filename, "r", encoding="utf-8") as ifile:
+                self.assertEqual(ifile.readline().strip(), "id,foo")
+            with open(filename + ".types.json", "r", encoding="utf-8") as ifile:
+                types = json.load(ifile)
+            if shard["count"]:
+                self.assertEqual(types, {"id": "S", "foo": "N"})
+        self.assertEqual(self.query("LOAD %s INTO destination" % dirname), 2)
+        res1 = list(self.query("SCAN * FROM foobar"))
+        res2 = list(self.query("SCAN * FROM destination"))
+        self.assertCountEqual(res2, res1)
+
+    def test_sharded_query(self):
+        """SAVE with SHARDS deals out the results of a query"""
+        pattern = os.path.join(self.tmpdir, "part-*.json")
+        count = self.query(
+            "SELECT * FROM foobar WHERE id = 'a' SAVE '%s' SHARDS 2" % pattern
+        )
+        self.assertEqual(count, 1)
+        manifest = self._read_manifest(self.tmpdir)
+        self.assertEqual([shard["count"] for shard in manifest["shards"]], [1, 0])
+
+    def test_shards_errors(self):
+        """SAVE with SHARDS needs a pattern and can't be limited"""
+        pattern = os.path.join(self.tmpdir, "part-*.json")
+        with self.assertRaises(SyntaxError):
+            self.query(
+                "SCAN * FROM foobar SAVE '%s' SHARDS 2"
+                % os.path.join(self.tmpdir, "out.json")
+            )
+        with self.assertRaises(SyntaxError):
+            self.query("SCAN * FROM foobar LIMIT 1 SAVE '%s' SHARDS 2" % pattern)
+        with self.assertRaises(SyntaxError):
+            self.query("SCAN * FROM foobar SAVE '%s' SHARDS 0" % pattern)
+        with self.assertRaises(SyntaxError):
+            self.query(
+                "SCAN * FROM foobar SAVE '%s' SHARDS 2 CHECKPOINT %s"
+                % (pattern, os.path.join(self.tmpdir, "save.ckpt"))
+            )
+
+    def test_load_glob(self):
+        """LOAD every file that matches a pattern, or every shard in a directory"""
+        self.query(
+            "INSERT INTO foobar (id, foo) VALUES "
+            + ", ".join("('k%d', %d)" % (i, i) for i in range(20))
+        )
+        dirname = os.path.join(self.tmpdir, "out")
+        pattern = os.path.join(dirname, "part-*.json.gz")
+        self.query("SCAN * FROM foobar SAVE '%s' SHARDS 3" % pattern)
+        res1 = list(self.query("SCAN * FROM foobar"))
+        for filename in [pattern, dirname]:
+            self.assertEqual(self.query("LOAD %s INTO destination" % filename), 22)
+            res2 = list(self.query("SCAN * FROM destination"))
+            self.assertCountEqual(res2, res1)
+            self.query("DELETE FROM destination")
+
+    def test_load_directory_formats(self):
+        """LOAD a directory of files in different formats"""
+        for fmt in ["csv", "p", "ddbjson.gz"]:
+            self._save("out.%s" % fmt)
+        # Files that start with '_' are skipped
+        notes = os.path.join(self.tmpdir, "_notes.txt")
+        with open(notes, "w", encoding="utf-8") as ofile:
+            ofile.write("notes")
+        self.assertEqual(self.query("LOAD %s INTO destination" % self.tmpdir), 6)
+        res1 = list(self.query("SCAN * FROM foobar"))
+        res2 = list(self.query("SCAN * FROM destination"))
+        self.assertCountEqual(res2, res1)
+
+    def test_load_no_match(self):
+        """LOAD raises an error if no files match the pattern"""
+        with self.assertRaises(FileNotFoundError):
+            self.query("LOAD %s INTO destination" % os.path.join(self.tmpdir, "*.json"))
+
+    def test_csv_types(self):
+        """SAVE to CSV writes the column types, which LOAD uses"""
+        self.query(
+            "INSERT INTO foobar (id, code, exp, flag, num) VALUES "
+            "('c', '0012', '1e5', TRUE, 12.5)"
+        )
+        filename = self._save("out.csv")
+        with open(filename + ".types.json", "r", encoding="utf-8") as ifile:
+            types = json.load(ifile)
+        self.assertEqual(
+            types,
+            {
+                "id": "S",
+                "foo": "N",
+                "code": "S",
+                "exp": "S",
+                "flag": "BOOL",
+                "num": "N",
+            },
+        )
+        res1 = list(self.query("SCAN * FROM foobar"))
+        # The types are inferred from the values without the sidecar file
+        for remove_types in [False, True]:
+            if remove_types:
+                os.remove(filename + ".types.json")
+            self.query("LOAD %s INTO destination" % filename)
+            res2 = list(self.query("SCAN * FROM destination"))
+            self.assertCountEqual(res2, res1)
+            self.query("DELETE FROM destination")
+
+    def test_csv_missing_attribute(self):
+        """A missing attribute doesn't change the type of a CSV column"""
+        self.query("INSERT INTO foobar (id) VALUES ('c')")
+        filename = os.path.join(self.tmpdir, "out.csv")
+        self.query("SCAN id, foo FROM foobar SAVE %s" % filename)
+        with open(filename + ".types.json", "r", encoding="utf-8") as ifile:
+            self.assertEqual(json.load(ifile), {"id": "S", "foo": "N"})
+        self.assertEqual(self.query("LOAD %s INTO destination" % filename), 3)
+        res1 = list(self.query("SCAN * FROM foobar"))
+        res2 = list(self.query("SCAN * FROM destination"))
+        self.assertCountEqual(res2, res1)
+
+    def test_csv_header_types(self):
+        """The column types of a CSV can be given in the header"""
+        filename = os.path.join(self.tmpdir, "in.csv")
+        with open(filename, "w", encoding="utf-8") as ofile:
+            ofile.write("id,zip,count:N,label:S\n")
+            ofile.write("a,02134,1e3,7\n")
+            ofile.write("b,,2,\n")
+        self.assertEqual(self.query("LOAD %s INTO destination" % filename), 2)
+        results = list(self.query("SCAN * FROM destination"))
+        self.assertCountEqual(
+            results,
+            [
+                {"id": "a", "zip": "02134", "count": 1000, "label": "7"},
+                {"id": "b", "count": 2},
+            ],
+        )
+
+    def test_csv_invalid_type(self):
+        """LOAD raises an error if a value doesn't match the column type"""
+        filename = os.path.join(self.tmpdir, "in.csv")
+        with open(filename, "w", encoding="utf-8") as ofile:
+            ofile.write("id,count:N\n")
+            ofile.write("a,many\n")
+        with self.assertRaises(EngineRuntimeError):
+            self.query("LOAD %s INTO destination" % filename)
+
+    def test_csv_inferred_type_fallback(self):
+        """Values that don't fit an inferred column type are loaded as strings"""
+        filename = os.path.join(self.tmpdir, "in.csv")
+        with open(filename, "w", encoding="utf-8") as ofile:
+            ofile.write("id,count\n")
+            ofile.write("a,1\n")
+            ofile.write("b,many\n")
+        # Only infer the types from the first row
+        with patch("dql.engine.SAMPLE_ROWS", 1):
+            self.assertEqual(self.query("LOAD %s INTO destination" % filename), 2)
+        results = list(self.query("SCAN * FROM destination"))
+        self.assertCountEqual(
+            results, [{"id": "a", "count": 1}, {"id": "b", "count": "many"}]
+        )
+
+    def test_raw_format(self):
+        """SAVE and LOAD items in the DynamoDB JSON format"""
+        self.query(
+            "INSERT INTO foobar (id, data, tags, meta) VALUES "
+            "('c', b'abc', ('a', 'b'), {'n': 1.5, 'l': [1, null, 'x']})"
+        )
+        for fmt in ["ddbjson", "ddbjson.gz"]:
+            filename = self._save("out.%s" % fmt)
+            with open_file_smart_mode(filename) as ifile:
+                items = [json.loads(line) for line in ifile]
+            self.assertIn({"id": {"S": "a"}, "foo": {"N": "1"}}, items)
+            self.query("LOAD %s INTO destination" % filename)
+            res1 = list(self.query("SCAN * FROM foobar"))
+            res2 = list(self.query("SCAN * FROM destination"))
+            self.assertCountEqual(res2, res1)
+            self.query("DELETE FROM destination")
+
+    def test_raw_format_select_all(self):
+        """SAVE in the DynamoDB JSON format can't process the items locally"""
+        filename = os.path.join(self.tmpdir, "out.ddbjson")
+        with self.assertRaises(SyntaxError):
+            self.query("SCAN id FROM foobar SAVE %s" % filename)
+        with self.assertRaises(SyntaxError):
+            self.query("SCAN * FROM foobar ORDER BY foo SAVE %s" % filename)
+
+    def test_raw_unprocessed_items(self):
+        """Writing raw items gives up if they stay unprocessed"""
+        item = {"id": {"S": "a"}}
+        unprocessed = {"destination": [{"PutRequest": {"Item": item}}]}
+        connection = self.engine.connection
+        with patch.object(
+            connection, "call", return_value={"UnprocessedItems": unprocessed}
+        ) as call, patch.object(connection, "exponential_sleep") as sleep:
+            with self.assertRaises(EngineRuntimeError):
+                write_raw_items(connection, "destination", [item])
+        self.assertEqual(sleep.call_count, connection.request_retries)
+        self.assertEqual(call.call_count, connection.request_retries + 1)
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_columnar_formats(self):
+        """Can save to Parquet and Arrow files"""
+        import pyarrow.parquet as pq
+
+        self.query(
+            "INSERT INTO foobar (id, foo, bar, baz, data, tags, meta) VALUES "
+            "('c', 3.5, 'x', TRUE, b'abc', ('a', 'b'), {'n': 1})"
+        )
+        readers = {
+            "parquet": pq.read_table,
+            "arrow": lambda filename: pa.ipc.open_file(filename).read_all(),
+        }
+        for fmt, read in readers.items():
+            filename = self._save("out.%s" % fmt)
+            rows = {row["id"]: row for row in read(filename).to_pylist()}
+            self.assertEqual(rows["a"]["foo"], 1.0)
+            self.assertEqual(rows["c"]["foo"], 3.5)
+            self.assertEqual(rows["c"]["bar"], "x")
+            self.assertEqual(rows["c"]["baz"], True)
+            self.assertEqual(rows["c"]["data"], b"abc")
+            self.assertCountEqual(rows["c"]["tags"], ["a", "b"])
+            self.assertEqual(json.loads(rows["c"]["meta"]), {"n": 1})
+            self.assertIsNone(rows["a"]["bar"])
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_columnar_batches(self):
+        """The schema is inferred from the items in each batch"""
+        filename = os.path.join(self.tmpdir, "out.arrow")
+        with ColumnarWriter(filename, ".arrow", batch_size=2) as writer:
+            writer.write({"id": "a", "n": Decimal(1)})
+            writer.write({"id": "b", "n": Decimal(2), "s": set([Binary(b"a")])})
+            writer.write({"id": "c"})
+        table = pa.ipc.open_file(filename).read_all()
+        self.assertEqual(str(table.schema.field("n").type), "int64")
+        self.assertEqual(table.column("n").to_pylist(), [1, 2, None])
+        self.assertEqual(table.column("s").to_pylist(), [None, [b"a"], None])
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_columnar_promote(self):
+        """Columns are promoted when a later batch doesn't fit the schema"""
+        import pyarrow.parquet as pq
+
+        readers = {
+            ".parquet": pq.read_table,
+            ".arrow": lambda filename: pa.ipc.open_file(filename).read_all(),
+        }
+        for ext, read in readers.items():
+            filename = os.path.join(self.tmpdir, "out" + ext)
+            with ColumnarWriter(filename, ext, batch_size=1) as writer:
+                writer.write({"id": "a", "n": Decimal(1), "x": "s"})
+                writer.write({"id": "b", "n": Decimal("1.5"), "x": Decimal(2)})
+                writer.write({"id": "c", "late": True})
+            table = read(filename)
+            self.assertEqual(str(table.schema.field("n").type), "double")
+            self.assertEqual(table.column("n").to_pylist(), [1.0, 1.5, None])
+            self.assertEqual(table.column("x").to_pylist(), ['"s"', "2", None])
+            self.assertEqual(table.column("late").to_pylist(), [None, None, True])
+            self.assertEqual(os.listdir(self.tmpdir), ["out" + ext])
+            os.remove(filename)
+
+    def test_columnar_null_column(self):
+        """A column that starts out NULL gets its type from later values"""
+        import pyarrow.parquet as pq
+
+        readers = {
+            ".parquet": pq.read_table,
+            ".arrow": lambda filename: pa.ipc.open_file(filename).read_all(),
+        }
+        for ext, read in readers.items():
+            filename = os.path.join(self.tmpdir, "out" + ext)
+            with ColumnarWriter(filename, ext, batch_size=1) as writer:
+                writer.write({"id": "a", "foo": None})
+                writer.write({"id": "b", "foo": Decimal(1)})
+            table = read(filename)
+            self.assertEqual(str(table.schema.field("foo").type), "int64")
+            self.assertEqual(table.column("foo").to_pylist(), [None, 1])
+            self.assertEqual(os.listdir(self.tmpdir), ["out" + ext])
+            os.remove(filename)
+
+    def test_columnar_no_gzip(self):
+        """Columnar files are already compressed"""
+        with self.assertRaises(SyntaxError):
+            self._save("out.parquet.gz")